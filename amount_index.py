@@ -0,0 +1,100 @@
+from array import array
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from functools import lru_cache
+import bisect
+
+THRESHOLD_AMOUNT = 15000.00
+TOLERANCE = 0.01  # 1% tolerance above the threshold
+INVALID_CENTS = -2 ** 63  # marks unparseable amounts in array('q') columns
+CENT = Decimal('0.01')
+
+def parse_cents(value):
+    """Parse an amount to integer cents, rounding half to even; None if it is not a finite number"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    elif isinstance(value, float):
+        value = repr(value)
+    if not isinstance(value, str):
+        return None
+    return _parse_cents(value.strip())
+
+@lru_cache(maxsize=65536)
+def _parse_cents(text):
+    """Parse a stripped amount string to integer cents"""
+    try:
+        amount = Decimal(text)
+        if not amount.is_finite():
+            return None
+        cents = int(amount.quantize(CENT, rounding=ROUND_HALF_EVEN).scaleb(2))
+    except (InvalidOperation, ValueError):
+        return None
+    # Keep to what fits an array('q') column
+    return cents if INVALID_CENTS < cents < 2 ** 63 else None
+
+def cents_column(values):
+    """Parse amounts into an array('q') column, INVALID_CENTS where unparseable"""
+    column = array('q')
+    for value in values:
+        cents = parse_cents(value)
+        column.append(INVALID_CENTS if cents is None else cents)
+    return column
+
+def tolerance_terms(threshold=THRESHOLD_AMOUNT, tolerance=TOLERANCE):
+    """Convert a threshold amount and relative tolerance to (threshold cents, tolerance basis points)"""
+    return parse_cents(threshold), int(Decimal(repr(tolerance)).scaleb(4).to_integral_value())
+
+THRESHOLD_CENTS, TOLERANCE_BP = tolerance_terms()
+
+def amount_matches(record_cents, payment_cents, threshold_cents=THRESHOLD_CENTS, tolerance_bp=TOLERANCE_BP):
+    """Relative tolerance for record amounts above the threshold, exact match otherwise, all in integers"""
+    if record_cents > threshold_cents:
+        return abs(record_cents - payment_cents) * 10000 <= tolerance_bp * record_cents
+    return record_cents == payment_cents
+
+class AmountIndex:
+    def __init__(self, records, cents=None):
+        """
+        Record amounts in integer cents, sorted within each stripped reference and across the file
+        cents: the records' amounts already parsed by cents_column, parsed here if not given
+        """
+        if cents is None:
+            cents = cents_column(record.get('amount') for record in records)
+        entries = sorted(
+            ((amount, (record.get('reference') or '').strip(), record)
+             for amount, record in zip(cents, records) if amount != INVALID_CENTS),
+            key=lambda entry: entry[0])
+
+        self.amounts = array('q', (amount for amount, _, _ in entries))
+        self.references = [reference for _, reference, _ in entries]
+        self.records = [record for _, _, record in entries]
+        self.by_reference = {}
+        for amount, reference, record in entries:
+            amounts, records = self.by_reference.setdefault(reference, (array('q'), []))
+            amounts.append(amount)
+            records.append(record)
+
+    def _window(self, amounts, payment_cents, tolerance_bp):
+        """Bisect to the slice of sorted amounts that can match payment_cents"""
+        # Above the threshold r matches when p / (1 + t) <= r <= p / (1 - t); at or below it only r == p
+        low = min(payment_cents, payment_cents * 10000 // (10000 + tolerance_bp)) - 1
+        if tolerance_bp < 10000:
+            high = max(payment_cents, payment_cents * 10000 // (10000 - tolerance_bp)) + 1
+        else:
+            high = 2 ** 63 - 1
+        return bisect.bisect_left(amounts, low), bisect.bisect_right(amounts, high)
+
+    def find(self, reference, payment_cents, threshold_cents=THRESHOLD_CENTS, tolerance_bp=TOLERANCE_BP):
+        """Get records with the reference whose amount matches payment_cents"""
+        amounts, records = self.by_reference.get(str(reference).strip(), ((), []))
+        start, stop = self._window(amounts, payment_cents, tolerance_bp)
+        return [records[i] for i in range(start, stop)
+                if amount_matches(amounts[i], payment_cents, threshold_cents, tolerance_bp)]
+
+    def find_amount(self, payment_cents, threshold_cents=THRESHOLD_CENTS, tolerance_bp=TOLERANCE_BP,
+                    exclude_reference=None):
+        """Get records of any reference, optionally except one, whose amount matches payment_cents"""
+        exclude = str(exclude_reference).strip() if exclude_reference is not None else None
+        start, stop = self._window(self.amounts, payment_cents, tolerance_bp)
+        return [self.records[i] for i in range(start, stop)
+                if self.references[i] != exclude and
+                amount_matches(self.amounts[i], payment_cents, threshold_cents, tolerance_bp)]
@@ -0,0 +1,103 @@
+import atexit
+import queue
+import threading
+
+class AsyncLogQueue:
+    def __init__(self, maxsize=1000, on_full='block', put_timeout=None):
+        """
+        Background thread that runs log writes in submission order from a bounded queue
+        on_full: 'block' makes callers wait for space (up to put_timeout seconds, then drop),
+        'drop' discards the event straight away
+        """
+        if on_full not in ('block', 'drop'):
+            raise ValueError(f"Invalid on_full policy: {on_full}")
+
+        self.on_full = on_full
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.counters = {
+            'submitted': 0,
+            'written': 0,
+            'errors': 0,
+            'blocked': 0,
+            'dropped': 0,
+            'high_water': 0
+        }
+
+        self._thread = threading.Thread(target=self._worker, name='AsyncLogQueue', daemon=True)
+        self._thread.start()
+
+        # Drain pending writes before the interpreter exits
+        atexit.register(self.close)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a write; returns False if it was dropped"""
+        if self._closed:
+            # After shutdown writes go straight through so nothing is lost
+            func(*args, **kwargs)
+            return True
+
+        item = (func, args, kwargs)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.on_full == 'drop':
+                self._count('dropped')
+                return False
+            self._count('blocked')
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                self._count('dropped')
+                return False
+
+        with self._lock:
+            self.counters['submitted'] += 1
+            self.counters['high_water'] = max(self.counters['high_water'], self._queue.qsize())
+        return True
+
+    def _count(self, name):
+        """Increment a counter"""
+        with self._lock:
+            self.counters[name] += 1
+
+    def _worker(self):
+        """Run queued writes one at a time"""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                func, args, kwargs = item
+                try:
+                    func(*args, **kwargs)
+                    self._count('written')
+                except Exception as e:
+                    self._count('errors')
+                    print(f"Error in background log write: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def drain(self):
+        """Wait until every queued write has run"""
+        if not self._closed:
+            self._queue.join()
+
+    def stats(self):
+        """Get counters plus the current queue depth"""
+        with self._lock:
+            stats = dict(self.counters)
+        stats['depth'] = self._queue.qsize()
+        return stats
+
+    def close(self):
+        """Drain the queue and stop the worker thread"""
+        if self._closed:
+            return
+        self._queue.join()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
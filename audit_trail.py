@@ -1,16 +1,54 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import csv
+import glob
+import gzip
+import lzma
 import os
+from audit_writer import BufferedAuditWriter
+from timestamp_index import TimestampIndex, TIMESTAMP_PATTERN
+
+PARTITION_SCHEMES = {
+    'daily': 10,    # AUDIT_LOG_YYYY-MM-DD.csv
+    'monthly': 7    # AUDIT_LOG_YYYY-MM.csv
+}
+
+EXPORT_OPENERS = {
+    None: open,
+    'gzip': gzip.open,
+    'lzma': lzma.open
+}
+EXPORT_SUFFIXES = {
+    '.gz': 'gzip',
+    '.xz': 'lzma',
+    '.lzma': 'lzma'
+}
+EXPORT_PROGRESS_ROWS = 1000
 
 class AuditTrail:
-    def __init__(self):
+    def __init__(self, durability='event', max_events=100, max_delay=1.0, async_queue=None, partition=None,
+                 repository=None, data_dir=None):
+        if partition is not None and partition not in PARTITION_SCHEMES:
+            raise ValueError(f"Invalid partition scheme: {partition}")
+
+        self.async_queue = async_queue
+        self.partition = partition
+        # The CSV backend keeps the buffered writers and timestamp indexes; other backends store the events
+        self.storage = repository if repository is not None and not repository.file_indexes else None
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.audit_file = os.path.join(self.base_dir, 'data/exceptions/AUDIT_LOG.csv')
+        self.data_dir = data_dir or os.path.join(self.base_dir, 'data')
+        self.audit_file = os.path.join(self.data_dir, 'exceptions/AUDIT_LOG.csv')
+        self.partition_dir = os.path.join(os.path.dirname(self.audit_file), 'audit')
+        self.fieldnames = ['timestamp', 'action', 'reference', 'details', 'user', 'status']
         self._ensure_directories()
-        
+        self._writer_settings = (durability, max_events, max_delay)
+        self.writer = self._new_writer(self.audit_file)
+        self._partition_writers = {}
+
     def _ensure_directories(self):
         """Ensure audit directory exists"""
         os.makedirs(os.path.dirname(self.audit_file), exist_ok=True)
+        if self.partition:
+            os.makedirs(self.partition_dir, exist_ok=True)
 
     def log_action(self, action_data):
         """Log system action"""
@@ -22,70 +60,340 @@ class AuditTrail:
             'user': action_data.get('user', 'System'),
             'status': action_data.get('status', 'Completed')
         }
-        
-        self._write_to_audit_log(audit_data)
+
+        if self.async_queue is not None:
+            self.async_queue.submit(self._write_to_audit_log, audit_data)
+        else:
+            self._write_to_audit_log(audit_data)
         return audit_data
 
     def get_actions(self, reference=None, action_type=None, start_date=None, end_date=None):
         """Get audit trail entries with optional filters"""
-        actions = []
-        
-        if os.path.exists(self.audit_file):
-            with open(self.audit_file, 'r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if self._matches_filters(row, reference, action_type, start_date, end_date):
-                        actions.append(row)
-        
-        return actions
+        return list(self.iter_actions(reference, action_type, start_date, end_date))
+
+    def iter_actions(self, reference=None, action_type=None, start_date=None, end_date=None):
+        """Yield audit trail entries with optional filters without loading the log into memory"""
+        for row in self._iter_range(start_date, end_date):
+            if self._matches_filters(row, reference, action_type):
+                yield row
+
+    def _iter_range(self, start_date=None, end_date=None):
+        """Yield the rows of every log file in the date range"""
+        self.flush()
+        if self.storage is not None:
+            for row in self.storage.get_records(self.audit_file):
+                if self._matches_filters(row, start_date=start_date, end_date=end_date):
+                    yield row
+            return
+        for file_path, check_dates in self._files_for_range(start_date, end_date):
+            if check_dates:
+                yield from self._read_rows(file_path, start_date, end_date)
+            else:
+                yield from self._read_rows(file_path)
+
+    def _read_rows(self, file_path, start_date=None, end_date=None):
+        """Yield the rows of one log file that fall in the date range"""
+        if start_date or end_date:
+            # Bisect the timestamp index to the range instead of parsing every row
+            start = datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S') if start_date else None
+            end = datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S') if end_date else None
+            rows = TimestampIndex.for_file(file_path).iter_range(start, end)
+            if rows is not None:
+                yield from rows
+                return
+
+        with open(file_path, 'r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                if self._matches_filters(row, start_date=start_date, end_date=end_date):
+                    yield row
 
     def _matches_filters(self, row, reference=None, action_type=None, start_date=None, end_date=None):
         """Check if row matches all provided filters"""
         if reference and row['reference'] != reference:
             return False
-            
+
         if action_type and row['action'] != action_type:
             return False
-            
+
         if start_date or end_date:
             row_date = datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S')
-            
+
             if start_date:
                 start = datetime.strptime(start_date, '%Y-%m-%d')
                 if row_date < start:
                     return False
-                    
+
             if end_date:
                 end = datetime.strptime(end_date, '%Y-%m-%d')
                 if row_date > end:
                     return False
-        
+
         return True
 
+    def _partition_key(self, timestamp):
+        """Get the partition key for a 'YYYY-MM-DD HH:MM:SS' timestamp"""
+        return timestamp[:PARTITION_SCHEMES[self.partition]]
+
+    def _partition_path(self, key):
+        """Get the file path of a partition"""
+        return os.path.join(self.partition_dir, f'AUDIT_LOG_{key}.csv')
+
+    def _partition_bounds(self, key):
+        """Get [start, end) datetimes covered by a partition key, None if not a date"""
+        try:
+            if len(key) == 10:
+                start = datetime.strptime(key, '%Y-%m-%d')
+                return start, start + timedelta(days=1)
+            start = datetime.strptime(key, '%Y-%m')
+            return start, (start + timedelta(days=32)).replace(day=1)
+        except ValueError:
+            return None
+
+    def _files_for_range(self, start_date=None, end_date=None):
+        """
+        List (file, check_dates) pairs to read for a date range
+        Partitions outside the range are skipped; rows of partitions lying wholly
+        inside it need no per-row date check
+        """
+        files = []
+
+        # The monolithic log (unmigrated rows, ExceptionHandler entries) is always read
+        if os.path.exists(self.audit_file):
+            files.append((self.audit_file, True))
+
+        if not self.partition:
+            return files
+
+        start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        end = datetime.strptime(end_date, '%Y-%m-%d') if end_date else None
+
+        for file_path in sorted(glob.glob(os.path.join(self.partition_dir, 'AUDIT_LOG_*.csv'))):
+            key = os.path.basename(file_path)[len('AUDIT_LOG_'):-len('.csv')]
+            bounds = self._partition_bounds(key)
+            if bounds is None:
+                # Rows without a parseable timestamp only show up in undated queries
+                if start is None and end is None:
+                    files.append((file_path, False))
+                continue
+
+            partition_start, partition_end = bounds
+            if start is not None and partition_end <= start:
+                continue
+            if end is not None and partition_start > end:
+                continue
+
+            inside = ((start is None or partition_start >= start) and
+                      (end is None or partition_end - timedelta(seconds=1) <= end))
+            files.append((file_path, not inside))
+
+        return files
+
+    def _get_writer(self, timestamp):
+        """Get the writer for the file an event with this timestamp belongs in"""
+        if not self.partition:
+            return self.writer
+
+        key = self._partition_key(timestamp)
+        writer = self._partition_writers.get(key)
+        if writer is None:
+            # Only the current partition stays open once the day or month rolls over
+            for old_writer in self._partition_writers.values():
+                old_writer.close()
+            self._partition_writers = {}
+            writer = self._new_writer(self._partition_path(key))
+            self._partition_writers[key] = writer
+        return writer
+
+    def _new_writer(self, file_path):
+        """Create a buffered writer that keeps the file's timestamp index current"""
+        writer = BufferedAuditWriter(file_path, self.fieldnames, *self._writer_settings)
+        writer.on_flush = lambda: self._update_index(writer.file_path, save=False)
+        return writer
+
+    def _update_index(self, file_path, save=True):
+        """Extend the timestamp index over newly written rows"""
+        try:
+            if os.path.exists(file_path):
+                TimestampIndex.for_file(file_path).refresh(save=save)
+        except Exception as e:
+            # The index is rebuilt from the log on the next query
+            print(f"Error updating audit index: {str(e)}")
+
     def _write_to_audit_log(self, data):
         """Write data to audit log"""
-        file_exists = os.path.exists(self.audit_file)
-        
+        if self.storage is not None:
+            self.storage.append_record(self.audit_file, self.fieldnames, data)
+            return
         try:
-            mode = 'a' if file_exists else 'w'
-            with open(self.audit_file, mode, newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=['timestamp', 'action', 'reference', 'details', 'user', 'status'])
-                if not file_exists:
-                    writer.writeheader()
-                writer.writerow(data)
+            self._get_writer(data['timestamp']).write(data)
         except Exception as e:
             print(f"Error writing to audit log: {str(e)}")
             raise
 
-    def export_audit_trail(self, output_file, reference=None, action_type=None, start_date=None, end_date=None):
-        """Export filtered audit trail to a new file"""
-        actions = self.get_actions(reference, action_type, start_date, end_date)
-        
-        if actions:
-            with open(output_file, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=actions[0].keys())
-                writer.writeheader()
-                writer.writerows(actions)
+    def flush(self):
+        """Write any queued and buffered audit events to disk"""
+        if self.async_queue is not None:
+            self.async_queue.drain()
+        self.writer.flush()
+        for writer in list(self._partition_writers.values()):
+            writer.flush()
+
+    def close(self):
+        """Flush queued and buffered audit events and release the log file"""
+        if self.async_queue is not None:
+            self.async_queue.drain()
+        for writer in [self.writer] + list(self._partition_writers.values()):
+            writer.close()
+            self._update_index(writer.file_path)
+
+    def migrate_to_partitions(self):
+        """
+        Split the monolithic audit log into partition files
+        The original is kept as AUDIT_LOG.csv.migrated; returns rows written per partition
+        """
+        if not self.partition:
+            raise ValueError("Audit trail is not partitioned")
+
+        self.flush()
+        counts = {}
+        if not os.path.exists(self.audit_file):
+            return counts
+
+        os.makedirs(self.partition_dir, exist_ok=True)
+        self.writer.close()
+
+        groups = {}
+        with open(self.audit_file, 'r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                timestamp = row.get('timestamp') or ''
+                try:
+                    datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+                    key = self._partition_key(timestamp)
+                except ValueError:
+                    key = 'undated'
+                groups.setdefault(key, []).append(row)
+
+        for key, rows in groups.items():
+            writer = BufferedAuditWriter(self._partition_path(key), self.fieldnames, 'batch')
+            writer.write_many(rows)
+            writer.close()
+            counts[key] = len(rows)
+
+        os.replace(self.audit_file, self.audit_file + '.migrated')
+        return counts
+
+    def export_audit_trail(self, output_file, reference=None, action_type=None, start_date=None, end_date=None,
+                           compression=None, progress_callback=None):
+        """
+        Stream a filtered audit trail to a new file
+        compression: None, 'gzip' or 'lzma', taken from a .gz/.xz/.lzma suffix when not given
+        progress_callback(rows) is called as rows are written
+        """
+        counts = self.export_audit_trails([{
+            'output_file': output_file,
+            'reference': reference,
+            'action_type': action_type,
+            'start_date': start_date,
+            'end_date': end_date,
+            'compression': compression
+        }], progress_callback)
+        return counts[output_file] > 0
+
+    def export_audit_trails(self, exports, progress_callback=None):
+        """
+        Export several filtered audit trails in one pass over the log
+        exports: dicts with output_file and optional reference, action_type, start_date,
+        end_date and compression; returns rows written per output file
+        No file is created for an export without matching rows, and a failed export leaves
+        any earlier output file in place
+        """
+        targets = [self._export_target(export) for export in exports]
+        if not targets:
+            return {}
+
+        # Read the union of the requested ranges once; each target applies its own
+        starts = [target['start_date'] for target in targets]
+        ends = [target['end_date'] for target in targets]
+        start_date = min(starts) if all(starts) else None
+        end_date = max(ends) if all(ends) else None
+
+        written = 0
+        completed = False
+        try:
+            for row in self._iter_range(start_date, end_date):
+                for target in targets:
+                    if not self._export_matches(row, target):
+                        continue
+                    if target['writer'] is None:
+                        self._open_export(target)
+                    target['writer'].writerow(row)
+                    target['rows'] += 1
+                    written += 1
+                    if progress_callback and written % EXPORT_PROGRESS_ROWS == 0:
+                        progress_callback(written)
+            completed = True
+        finally:
+            for target in targets:
+                if target['file'] is not None:
+                    target['file'].close()
+                    if completed:
+                        os.replace(target['temp_file'], target['output_file'])
+                    else:
+                        os.remove(target['temp_file'])
+
+        if progress_callback:
+            progress_callback(written)
+        return {target['output_file']: target['rows'] for target in targets}
+
+    def _export_target(self, export):
+        """Normalise one export request"""
+        output_file = export['output_file']
+        compression = export.get('compression')
+        if compression is None:
+            compression = EXPORT_SUFFIXES.get(os.path.splitext(output_file)[1].lower())
+        if compression not in EXPORT_OPENERS:
+            raise ValueError(f"Invalid compression: {compression}")
+
+        start_date = export.get('start_date')
+        end_date = export.get('end_date')
+        return {
+            'output_file': output_file,
+            'compression': compression,
+            'reference': export.get('reference'),
+            'action_type': export.get('action_type'),
+            'start_date': start_date,
+            'end_date': end_date,
+            'start': datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S') if start_date else None,
+            'end': datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S') if end_date else None,
+            'temp_file': output_file + '.tmp',
+            'file': None,
+            'writer': None,
+            'rows': 0
+        }
+
+    def _export_matches(self, row, target):
+        """Check a row against one export's filters"""
+        if not self._matches_filters(row, target['reference'], target['action_type']):
+            return False
+        if not (target['start'] or target['end']):
             return True
-            
-        return False
+
+        timestamp = row['timestamp']
+        if not TIMESTAMP_PATTERN.match(timestamp or ''):
+            return self._matches_filters(row, start_date=target['start_date'], end_date=target['end_date'])
+        if target['start'] and timestamp < target['start']:
+            return False
+        if target['end'] and timestamp > target['end']:
+            return False
+        return True
+
+    def _open_export(self, target):
+        """
+        Open the temporary file of an export on its first row and write the header
+        Rows of logs with fewer columns get empty values for the missing ones
+        """
+        opener = EXPORT_OPENERS[target['compression']]
+        target['file'] = opener(target['temp_file'], 'wt', newline='', encoding='utf-8')
+        target['writer'] = csv.DictWriter(target['file'], fieldnames=self.fieldnames,
+                                          extrasaction='ignore', restval='')
+        target['writer'].writeheader()
@@ -0,0 +1,124 @@
+import atexit
+import csv
+import io
+import os
+import threading
+
+DURABILITY_MODES = ('event', 'batch', 'fsync')
+
+class BufferedAuditWriter:
+    def __init__(self, file_path, fieldnames, durability='event', max_events=100, max_delay=1.0):
+        """
+        Append-only CSV writer that keeps its file open and commits rows in groups
+        durability: 'event' flushes every row, 'batch' flushes once max_events rows are
+        buffered or max_delay seconds have passed, 'fsync' is 'batch' plus os.fsync
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Invalid durability mode: {durability}")
+
+        self.file_path = file_path
+        self.fieldnames = list(fieldnames)
+        self.durability = durability
+        self.max_events = max_events
+        self.max_delay = max_delay
+
+        self._buffer = []
+        self._file = None
+        self._timer = None
+        self._closed = False
+        self._lock = threading.RLock()
+        self.flush_count = 0
+        # Called after each group is written, e.g. to extend an index over the file
+        self.on_flush = None
+
+        # Whatever is still buffered when the interpreter exits is written out; close unregisters this
+        atexit.register(self.close)
+
+    def write(self, row):
+        """Buffer one row, flushing when the durability mode or thresholds require it"""
+        with self._lock:
+            self._buffer.append(row)
+            if self._closed:
+                self._write_through()
+            elif self.durability == 'event' or len(self._buffer) >= self.max_events:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def write_many(self, rows):
+        """Buffer several rows and commit them as one group"""
+        with self._lock:
+            self._buffer.extend(rows)
+            if self._closed:
+                self._write_through()
+            else:
+                self.flush()
+
+    def _write_through(self):
+        """
+        Commit rows written after close straight away and close the file again
+        Writes drained from a log queue at exit can arrive after atexit closed the writer
+        """
+        try:
+            self.flush()
+        finally:
+            self._close_file()
+
+    def flush(self):
+        """Write buffered rows to the file as one group"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._buffer:
+                return
+
+            file = self._open()
+            output = io.StringIO()
+            writer = csv.DictWriter(output, fieldnames=self.fieldnames, extrasaction='ignore')
+            if os.fstat(file.fileno()).st_size == 0:
+                writer.writeheader()
+            writer.writerows(self._buffer)
+
+            file.write(output.getvalue().encode('utf-8'))
+            file.flush()
+            if self.durability == 'fsync':
+                os.fsync(file.fileno())
+
+            self._buffer = []
+            self.flush_count += 1
+            if self.on_flush is not None:
+                self.on_flush()
+
+    def _open(self):
+        """Get the open file handle, reopening it if the file was removed or replaced"""
+        if self._file is not None:
+            try:
+                if os.stat(self.file_path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return self._file
+            except OSError:
+                pass
+            self._file.close()
+            self._file = None
+
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self._file = open(self.file_path, 'ab')
+        return self._file
+
+    def close(self):
+        """Flush remaining rows and close the file; later rows are written through"""
+        with self._lock:
+            self._closed = True
+            try:
+                self.flush()
+            finally:
+                self._close_file()
+        atexit.unregister(self.close)
+
+    def _close_file(self):
+        """Close the file handle if it is open"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
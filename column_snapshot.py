@@ -0,0 +1,415 @@
+from array import array
+from datetime import datetime
+import ast
+import bisect
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import sys
+from amount_index import INVALID_CENTS, parse_cents
+from sidecar_index import SidecarIndex, file_lock, file_stat, is_unchanged, iter_records, make_row
+
+SNAPSHOT_SUFFIX = '.columns'
+SNAPSHOT_LOCK = 'lock'
+SNAPSHOT_VERSION = 2
+NPY_MAGIC = b'\x93NUMPY'
+NPY_HEADER_BYTES = 128
+
+# (name, .npy dtype, array typecode) of each column, all little-endian
+COLUMNS = [
+    ('reference_hash', '<i8', 'q'),
+    ('amount_cents', '<i8', 'q'),
+    ('date_ordinal', '<i4', 'i'),
+    ('status_code', '<u2', 'H'),
+    ('offset', '<i8', 'q'),
+    # Row numbers sorted by reference hash in runs, the lookup index
+    ('order', '<i8', 'q')
+]
+STATUS_OTHER = 0xFFFF  # more distinct statuses than codes, read the status from the row
+
+def reference_hash(reference):
+    """Stable signed 64-bit hash of a stripped reference"""
+    digest = hashlib.blake2b(str(reference).strip().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+def npy_header(dtype, rows):
+    """Build a version 1.0 .npy header of fixed length, so the shape can be rewritten in place"""
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (dtype, rows)
+    # Magic, version and length take 10 bytes; pad so the data starts 64-byte aligned
+    header = header.ljust(NPY_HEADER_BYTES - 11) + '\n'
+    return NPY_MAGIC + b'\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+def npy_data(values):
+    """Get an array or a mapped column as little-endian data to write"""
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+def write_npy(path, dtype, *parts):
+    """
+    Write arrays one after the other as a version 1.0 .npy file
+    The file is written under a temporary name and replaced, so a mapped copy is never changed
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(npy_header(dtype, sum(len(part) for part in parts)))
+        for part in parts:
+            f.write(npy_data(part))
+    os.replace(temp_path, path)
+
+def release_maps(maps):
+    """Release memory-mapped columns and close their maps"""
+    for views, mapped in maps:
+        for view in views:
+            view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # A caller still holds a view; the map closes once it is dropped
+            pass
+
+def read_npy_header(file):
+    """Read a .npy header, return (dtype, rows, data offset)"""
+    prefix = file.read(10)
+    if len(prefix) < 10 or prefix[:6] != NPY_MAGIC or prefix[6:8] != b'\x01\x00':
+        raise ValueError("Not a version 1.0 .npy file")
+    header_length = struct.unpack('<H', prefix[8:10])[0]
+    try:
+        header = ast.literal_eval(file.read(header_length).decode('latin1'))
+    except SyntaxError as e:
+        raise ValueError(f"Malformed .npy header: {e}")
+    if header['fortran_order'] or len(header['shape']) != 1:
+        raise ValueError("Only one-dimensional arrays are supported")
+    return header['descr'], header['shape'][0], 10 + header_length
+
+class ColumnSnapshot(SidecarIndex):
+    SUFFIX = SNAPSHOT_SUFFIX
+    VERSION = SNAPSHOT_VERSION
+    _instances = {}
+
+    def __init__(self, file_path):
+        """
+        Columnar .npy snapshot of a statement CSV, memory-mapped and rebuilt only when the CSV changes
+        Processes sharing the snapshot load, refresh and save it under a lock file in its directory
+        """
+        self._maps = []
+        # Set by pin(): the CSV is no longer checked, the saved snapshot is used as it is
+        self.pinned = False
+        self.snapshot_dir = os.path.dirname(self.sidecar_path(os.path.abspath(file_path)))
+        self.lock_path = os.path.join(self.snapshot_dir, SNAPSHOT_LOCK)
+        super().__init__(file_path)
+
+    @classmethod
+    def sidecar_path(cls, file_path):
+        """Get the path of the snapshot metadata, written after the columns"""
+        return os.path.join(file_path + cls.SUFFIX, 'meta.json')
+
+    def _reset(self):
+        """Clear the in-memory snapshot"""
+        super()._reset()
+        self.statuses = []
+        self.rows = 0
+        # Start of each sorted run of order; run i holds exactly the rows runs[i] up to runs[i + 1]
+        self.runs = []
+        for name, _, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+
+    @classmethod
+    def invalidate(cls, file_path):
+        """Drop the snapshot of a file that has been rewritten, once no other process is using it"""
+        with file_lock(os.path.join(os.path.dirname(cls.sidecar_path(os.path.abspath(file_path))), SNAPSHOT_LOCK)):
+            super().invalidate(file_path)
+
+    def close(self):
+        """Release the memory maps"""
+        maps, self._maps = self._maps, []
+        release_maps(maps)
+
+    def _load(self):
+        """Load the saved snapshot while no other process is writing it"""
+        try:
+            with file_lock(self.lock_path):
+                super()._load()
+        except OSError as e:
+            print(f"Error locking snapshot {self.snapshot_dir}: {e}")
+
+    def refresh(self, save=True):
+        """Bring the snapshot up to date with the CSV, holding the lock when it has to be updated or saved"""
+        with self._lock:
+            if self.pinned:
+                return True
+            stat = file_stat(self.file_path)
+            if stat is not None and is_unchanged(self.state, stat) and not (save and self._dirty):
+                return True
+            with file_lock(self.lock_path):
+                return super().refresh(save)
+
+    def pin(self, position):
+        """
+        Stop checking the CSV if the snapshot ends at position, returning whether it does
+        For worker processes reading a snapshot their parent has just brought up to date
+        """
+        with self._lock:
+            self.pinned = self.state['end'] == position
+            return self.pinned
+
+    def _sidecar_data(self):
+        """Get the snapshot metadata"""
+        return dict(super()._sidecar_data(), statuses=self.statuses, rows=self.rows, runs=self.runs)
+
+    def _restore(self, data):
+        """Memory-map the saved columns described by the metadata"""
+        runs = data['runs']
+        if runs != sorted(set(runs)) or (runs and (runs[0] != 0 or runs[-1] >= data['rows'])):
+            raise ValueError("Snapshot runs do not match its rows")
+        columns, self._maps = self._map_columns(data['rows'])
+        super()._restore(data)
+        self.statuses = data['statuses']
+        self.rows = data['rows']
+        self.runs = runs
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+    def _map_columns(self, rows):
+        """Memory-map every saved column, returning (columns, maps); nothing stays mapped on failure"""
+        maps = []
+        try:
+            columns = {name: self._map_column(name, dtype, typecode, rows, maps)
+                       for name, dtype, typecode in COLUMNS}
+        except BaseException:
+            release_maps(maps)
+            raise
+        return columns, maps
+
+    def _map_column(self, name, dtype, typecode, rows, maps):
+        """Memory-map one .npy column, checking it holds rows values of dtype, and add its map to maps"""
+        with open(os.path.join(self.snapshot_dir, name + '.npy'), 'rb') as f:
+            descr, length, data_offset = read_npy_header(f)
+            if descr != dtype or length != rows:
+                raise ValueError(f"Column {name} does not match the snapshot")
+            if sys.byteorder != 'little':
+                column = array(typecode)
+                column.frombytes(f.read(rows * column.itemsize))
+                column.byteswap()
+                return column
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        data = memoryview(mapped)
+        column = data[data_offset:data_offset + rows * array(typecode).itemsize].cast(typecode)
+        maps.append(((column, data), mapped))
+        return column
+
+    def _remap(self):
+        """
+        Swap the columns for maps of the saved ones, returning whether that worked
+        The current columns are only released once the new maps are in place, so they stay usable on failure
+        """
+        try:
+            columns, maps = self._map_columns(self.rows)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            print(f"Error mapping snapshot {self.snapshot_dir}: {e}")
+            return False
+        old_maps, self._maps = self._maps, maps
+        for name, column in columns.items():
+            setattr(self, name, column)
+        release_maps(old_maps)
+        return True
+
+    def _save(self):
+        """
+        Write the metadata last, so a partial save is never loaded
+        Mapped columns were already written by _extend; in-memory ones are written in full
+        """
+        if not self._maps:
+            try:
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                for name, dtype, _ in COLUMNS:
+                    write_npy(os.path.join(self.snapshot_dir, name + '.npy'), dtype, getattr(self, name))
+            except OSError as e:
+                # The in-memory columns still work without a saved snapshot
+                print(f"Error saving snapshot {self.snapshot_dir}: {e}")
+                return False
+            self._remap()
+        return super()._save()
+
+    def position(self):
+        """Get (byte offset, rows, fingerprint) of the complete rows, brought up to date with the CSV"""
+        with self._lock:
+            self.refresh()
+            return self.state['end'], self.rows, self.state['fingerprint']
+
+    def _extend(self, file, start):
+        """
+        Add the complete records from start to the snapshot, returning where they end
+        The new rows are sorted into a run of their own, merged with the runs before it
+        while they are not at least twice as long, so only the tail of order is rewritten
+        """
+        first_row = self.rows
+        new, end = self._parse_records(file, start)
+        rows = first_row + len(new['offset'])
+        if rows == first_row:
+            return start
+
+        new_hashes = new['reference_hash']
+
+        def row_hash(row):
+            return self.reference_hash[row] if row < first_row else new_hashes[row - first_row]
+
+        runs = list(self.runs)
+        tail_start = first_row
+        tail = sorted(range(first_row, rows), key=row_hash)
+        while runs and len(tail) * 2 >= tail_start - runs[-1]:
+            run_start = runs.pop()
+            run = self.order[run_start:tail_start].tolist()
+            # Stable, so equal hashes stay in file order
+            tail = list(heapq.merge(run, tail, key=row_hash))
+            tail_start = run_start
+        runs.append(tail_start)
+        new['order'] = array('q', tail)
+
+        if self._maps:
+            if self._write_columns(new, first_row, tail_start):
+                self.rows, self.runs = rows, runs
+                # The metadata has to describe the new files before the lock is released
+                if self._remap() and SidecarIndex._save(self):
+                    return end
+            # The mapped columns no longer match the saved ones; start over from the CSV
+            return self._rebuild(file)
+
+        for name, _, _ in COLUMNS[:-1]:
+            getattr(self, name).extend(new[name])
+        del self.order[tail_start:]
+        self.order.extend(new['order'])
+        self.rows, self.runs = rows, runs
+        return end
+
+    def _write_columns(self, new, first_row, order_start):
+        """
+        Write the saved column files with the new rows after the mapped ones and the new tail of order
+        Each file is replaced whole, so other processes keep reading the maps they already have
+        """
+        try:
+            for name, dtype, _ in COLUMNS:
+                position = order_start if name == 'order' else first_row
+                write_npy(os.path.join(self.snapshot_dir, name + '.npy'), dtype,
+                          getattr(self, name)[:position], new[name])
+        except OSError as e:
+            print(f"Error writing snapshot {self.snapshot_dir}: {e}")
+            return False
+        return True
+
+    def _parse_records(self, file, start):
+        """Parse the complete records from start into new columns, returning (columns, end)"""
+        new = {name: array(typecode) for name, _, typecode in COLUMNS[:-1]}
+        positions = {name: self.fieldnames.index(name) if name in self.fieldnames else None
+                     for name in ('reference', 'amount', 'date', 'status')}
+        status_codes = {status: code for code, status in enumerate(self.statuses)}
+        date_ordinals = {}
+        last_offset = None
+
+        def value(values, name):
+            position = positions[name]
+            return values[position] if position is not None and position < len(values) else ''
+
+        for offset, values in iter_records(file, start):
+            last_offset = offset
+            new['reference_hash'].append(reference_hash(value(values, 'reference')))
+            cents = parse_cents(value(values, 'amount'))
+            new['amount_cents'].append(INVALID_CENTS if cents is None else cents)
+
+            date_text = value(values, 'date').strip()
+            if date_text not in date_ordinals:
+                try:
+                    date_ordinals[date_text] = datetime.strptime(date_text, '%Y-%m-%d').toordinal()
+                except ValueError:
+                    date_ordinals[date_text] = 0
+            new['date_ordinal'].append(date_ordinals[date_text])
+
+            status = value(values, 'status').strip()
+            if status not in status_codes and len(self.statuses) < STATUS_OTHER:
+                status_codes[status] = len(self.statuses)
+                self.statuses.append(status)
+            new['status_code'].append(status_codes.get(status, STATUS_OTHER))
+            new['offset'].append(offset)
+        end = file.tell()
+
+        # Leave a half-written last row for the next refresh
+        if last_offset is not None:
+            file.seek(end - 1)
+            if file.read(1) not in (b'\n', b'\r'):
+                for column in new.values():
+                    column.pop()
+                end = last_offset
+        return new, end
+
+    def row_at(self, offset):
+        """Get the number of the first row starting at or after a byte offset"""
+        with self._lock:
+            self.refresh()
+            return bisect.bisect_left(self.offset, offset)
+
+    def find(self, reference, first_row=0):
+        """Get the numbers of rows from first_row whose reference hash matches, in file order"""
+        with self._lock:
+            if not self.refresh():
+                return []
+            target = reference_hash(reference)
+            hashes, order = self.reference_hash, self.order
+            bounds = self.runs + [self.rows]
+            rows = []
+            # Runs hold consecutive row ranges, so matches come out in file order run by run
+            for run_start, run_stop in zip(bounds, bounds[1:]):
+                if run_stop <= first_row:
+                    continue
+                low, high = run_start, run_stop
+                while low < high:
+                    middle = (low + high) // 2
+                    if hashes[order[middle]] < target:
+                        low = middle + 1
+                    else:
+                        high = middle
+                while low < run_stop and hashes[order[low]] == target:
+                    if order[low] >= first_row:
+                        rows.append(order[low])
+                    low += 1
+            return rows
+
+    def records(self, rows, reference=None):
+        """Read the given rows from the CSV, keeping only those with the reference if given"""
+        with self._lock:
+            records = []
+            if not rows:
+                return records
+            reference = str(reference).strip() if reference is not None else None
+            with open(self.file_path, 'rb') as f:
+                for row in rows:
+                    for _, values in iter_records(f, self.offset[row]):
+                        record = make_row(self.fieldnames, values)
+                        if reference is None or (record.get('reference') or '').strip() == reference:
+                            records.append(record)
+                        break
+            return records
+
+    def lookup(self, reference, first_row=0):
+        """Get (amount cents, status) of the rows with reference from first_row on, in file order"""
+        with self._lock:
+            rows = self.find(reference, first_row)
+            if not rows:
+                return []
+            # Hash matches are checked against the CSV so a collision can never match
+            records = self.records(rows)
+            reference = str(reference).strip()
+            matches = []
+            for row, record in zip(rows, records):
+                if (record.get('reference') or '').strip() != reference:
+                    continue
+                cents = self.amount_cents[row]
+                if cents == INVALID_CENTS:
+                    continue
+                code = self.status_code[row]
+                status = self.statuses[code] if code != STATUS_OTHER else (record.get('status') or '').strip()
+                matches.append((cents, status))
+            return matches
@@ -0,0 +1,224 @@
+import csv
+import os
+import threading
+from amount_index import AmountIndex, cents_column
+from column_snapshot import ColumnSnapshot
+from reference_index import ReferenceIndex
+from sidecar_index import read_header, iter_records, make_row, prefix_fingerprint
+from storage_backend import StorageBackend
+
+class DataRepository(StorageBackend):
+    file_indexes = True
+    process_workers = True
+
+    def __init__(self):
+        """CSV storage backend: shared CSV access with parsed records cached per file until its stat changes"""
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def _stat_key(self, file_path):
+        """Identify the current version of a file"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def _get_entry(self, file_path):
+        """Get the cache entry for a file, parsing it if missing or stale"""
+        file_path = os.path.abspath(file_path)
+        stat_key = self._stat_key(file_path)
+        if stat_key is None:
+            self._entries.pop(file_path, None)
+            return None
+
+        entry = self._entries.get(file_path)
+        if entry is not None and entry['stat'] == stat_key:
+            return entry
+
+        entry = {'fieldnames': None, 'records': [], 'by_reference': None, 'cents': None, 'amount_index': None}
+        with open(file_path, 'rb') as f:
+            entry['fieldnames'], data_offset = read_header(f)
+            if entry['fieldnames']:
+                self._parse_into(entry, f, data_offset)
+        entry['stat'] = stat_key
+        self._entries[file_path] = entry
+        return entry
+
+    def _parse_into(self, entry, file, start):
+        """Parse records from start into a cache entry"""
+        fieldnames = entry['fieldnames']
+        entry['amount_index'] = None
+        for _, values in iter_records(file, start):
+            record = make_row(fieldnames, values)
+            entry['records'].append(record)
+            if entry['cents'] is not None:
+                entry['cents'].extend(cents_column([record.get('amount')]))
+            if entry['by_reference'] is not None:
+                self._add_to_reference_map(entry['by_reference'], record)
+
+    def _add_to_reference_map(self, by_reference, record):
+        """Add record to a reference -> records map"""
+        reference = (record.get('reference') or '').strip()
+        by_reference.setdefault(reference, []).append(record)
+
+    def exists(self, file_path):
+        """Check whether a file exists"""
+        return os.path.exists(file_path)
+
+    def get_records(self, file_path):
+        """Get all records of a file; the returned rows are shared and must not be modified"""
+        with self._lock:
+            entry = self._get_entry(file_path)
+            return entry['records'] if entry else []
+
+    def get_records_with_stat(self, file_path):
+        """Get all records together with the (size, mtime_ns, inode) of the version they came from"""
+        with self._lock:
+            entry = self._get_entry(file_path)
+            return (entry['records'], entry['stat']) if entry else ([], None)
+
+    def get_fieldnames(self, file_path):
+        """Get the header of a file"""
+        with self._lock:
+            entry = self._get_entry(file_path)
+            return list(entry['fieldnames'] or []) if entry else []
+
+    def find(self, file_path, reference):
+        """Get records with the given stripped reference"""
+        reference = str(reference).strip()
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(file_path))
+            if entry is None or entry['stat'] != self._stat_key(file_path):
+                # Not parsed yet: a seek through the reference index is cheaper than a full parse
+                return ReferenceIndex.for_file(file_path).lookup(reference)
+
+            if entry['by_reference'] is None:
+                entry['by_reference'] = {}
+                for record in entry['records']:
+                    self._add_to_reference_map(entry['by_reference'], record)
+            return list(entry['by_reference'].get(reference, []))
+
+    def amount_index(self, file_path):
+        """Get the sorted amount index of a file, built from its cached records"""
+        with self._lock:
+            entry = self._get_entry(file_path)
+            if entry is None:
+                return AmountIndex([])
+            if entry['amount_index'] is None:
+                entry['amount_index'] = AmountIndex(entry['records'], self._cents(entry))
+            return entry['amount_index']
+
+    def amount_cents(self, file_path):
+        """Get the amounts of a file's records as an array('q') of cents, INVALID_CENTS where unparseable"""
+        with self._lock:
+            entry = self._get_entry(file_path)
+            return self._cents(entry) if entry else cents_column([])
+
+    def _cents(self, entry):
+        """Get the cents column of a cache entry, parsing it on first use"""
+        if entry['cents'] is None:
+            entry['cents'] = cents_column(record.get('amount') for record in entry['records'])
+        return entry['cents']
+
+    def snapshot(self, file_path):
+        """Get the columnar snapshot of a file, brought up to date with the CSV"""
+        snapshot = ColumnSnapshot.for_file(file_path)
+        snapshot.refresh()
+        return snapshot
+
+    def pin_snapshot(self, file_path, position):
+        """Read a file through its saved snapshot up to position without checking the CSV again, if the snapshot ends there"""
+        return ColumnSnapshot.for_file(file_path).pin(position)
+
+    def read_position(self, file_path):
+        """Get (byte offset, rows, fingerprint) of the complete rows of a file"""
+        return ColumnSnapshot.for_file(file_path).position()
+
+    def position_valid(self, file_path, offset, fingerprint):
+        """Check that a file was only appended to since a byte offset was read"""
+        try:
+            with open(file_path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                return f.tell() >= offset and prefix_fingerprint(f, offset) == fingerprint
+        except OSError:
+            return False
+
+    def row_at(self, file_path, offset):
+        """Get the number of the first row starting at or after a byte offset"""
+        return ColumnSnapshot.for_file(file_path).row_at(offset)
+
+    def lookup_amounts(self, file_path, reference, first_row=0):
+        """Get (amount cents, status) of the rows with reference through the file's snapshot"""
+        return ColumnSnapshot.for_file(file_path).lookup(reference, first_row)
+
+    def references_from(self, file_path, first_row=0):
+        """Get the set of stripped references of the rows from first_row on, reading only those rows"""
+        snapshot = self.snapshot(file_path)
+        records = snapshot.records(range(first_row, snapshot.rows))
+        return {(record.get('reference') or '').strip() for record in records}
+
+    def append_records(self, file_path, fieldnames, records):
+        """Append several records in one write, creating the file with headers if needed, and update the cache"""
+        with self._lock:
+            file_path = os.path.abspath(file_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+            entry = self._entries.get(file_path)
+            if entry is not None and entry['stat'] != self._stat_key(file_path):
+                entry = None
+            start = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+            with open(file_path, 'a', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+                if start == 0:
+                    writer.writeheader()
+                writer.writerows(records)
+
+            if entry is None or start == 0:
+                self._entries.pop(file_path, None)
+                return
+
+            # Parse back only what was written so the cache matches a fresh read
+            with open(file_path, 'rb') as f:
+                self._parse_into(entry, f, start)
+            entry['stat'] = self._stat_key(file_path)
+
+    def write_records(self, file_path, fieldnames, records):
+        """
+        Rewrite a file with the given records; the next read parses it again
+        The records go to a temporary file that replaces the old one, so an interrupted write never truncates it
+        """
+        with self._lock:
+            file_path = os.path.abspath(file_path)
+            temp_path = file_path + '.tmp'
+            try:
+                with open(temp_path, 'w', newline='', encoding='utf-8') as file:
+                    writer = csv.DictWriter(file, fieldnames=fieldnames)
+                    writer.writeheader()
+                    writer.writerows(records)
+                os.replace(temp_path, file_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            ReferenceIndex.invalidate(file_path)
+            ColumnSnapshot.invalidate(file_path)
+            self._entries.pop(file_path, None)
+
+    def update_status(self, file_path, updates, where_status=None, fill_fields=()):
+        """Update many records in one write, holding the lock so no append lands between the read and the write"""
+        with self._lock:
+            return super().update_status(file_path, updates, where_status, fill_fields)
+
+    def locked(self):
+        """Hold the repository lock; it is reentrant, so the repository can still be used inside"""
+        return self._lock
+
+    def invalidate(self, file_path=None):
+        """Drop cached records for one file or for all files"""
+        with self._lock:
+            if file_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(file_path), None)
@@ -1,12 +1,24 @@
 from datetime import datetime
-import csv
 import os
+from data_repository import DataRepository
+from exception_index import OpenExceptionIndex, RESOLUTION_FIELDS
+from sidecar_index import read_header, iter_records, make_row
+
+EXCEPTION_FIELDS = ['timestamp', 'reference', 'type', 'description', 'status', 'resolution']
+AUDIT_FIELDS = ['timestamp', 'action', 'reference', 'details']
+
+# Resolution events kept before they are folded back into the exception log
+COMPACT_AFTER = 500
 
 class ExceptionHandler:
-    def __init__(self):
+    def __init__(self, repository=None, async_queue=None, data_dir=None):
+        self.repository = repository or DataRepository()
+        self.async_queue = async_queue
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.exception_file = os.path.join(self.base_dir, 'data/exceptions/EXCEPTION_LOG.csv')
-        self.audit_file = os.path.join(self.base_dir, 'data/exceptions/AUDIT_LOG.csv')
+        self.data_dir = data_dir or os.path.join(self.base_dir, 'data')
+        self.exception_file = os.path.join(self.data_dir, 'exceptions/EXCEPTION_LOG.csv')
+        self.audit_file = os.path.join(self.data_dir, 'exceptions/AUDIT_LOG.csv')
+        self.compact_after = COMPACT_AFTER
         self._ensure_directories()
         
     def _ensure_directories(self):
@@ -15,6 +27,32 @@ class ExceptionHandler:
         
     def log_exception(self, data):
         """Log exception details"""
+        exception_data, audit_data = self._build_exception(data)
+        
+        if self.async_queue is not None:
+            self.async_queue.submit(self._write_exception, exception_data, audit_data)
+        else:
+            self._write_exception(exception_data, audit_data)
+        
+        return exception_data
+
+    def log_exceptions(self, items):
+        """Log several exceptions, writing the exception rows and audit entries as one group each"""
+        built = [self._build_exception(data) for data in items]
+        if not built:
+            return []
+        exceptions = [exception_data for exception_data, _ in built]
+        audit_entries = [audit_data for _, audit_data in built]
+
+        if self.async_queue is not None:
+            self.async_queue.submit(self._write_exceptions, exceptions, audit_entries)
+        else:
+            self._write_exceptions(exceptions, audit_entries)
+
+        return exceptions
+
+    def _build_exception(self, data):
+        """Build the exception row and audit entry for exception details"""
         exception_data = {
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'reference': 'N/A' if not data.get('reference') else data['reference'],
@@ -24,124 +62,253 @@ class ExceptionHandler:
             'resolution': ''
         }
         
-        self._write_to_exception_log(exception_data)
-        self._write_to_audit_log({
+        audit_data = {
+            'timestamp': exception_data['timestamp'],
             'action': 'Exception_Logged',
             'reference': exception_data['reference'],
             'details': f"Exception: {exception_data['type']} - {exception_data['description']}"
-        })
-        
-        return exception_data
+        }
+        return exception_data, audit_data
+
+    def _write_exception(self, exception_data, audit_data):
+        """Write an exception and its audit entry"""
+        self._write_to_exception_log(exception_data)
+        self._write_to_audit_log(audit_data)
+
+    def _write_exceptions(self, exceptions, audit_entries):
+        """Write exceptions and their audit entries in one append each"""
+        self.repository.append_records(self.exception_file, EXCEPTION_FIELDS, exceptions)
+        self._write_audit_entries(audit_entries)
+
+    def flush(self):
+        """Wait for queued exception writes to reach disk"""
+        if self.async_queue is not None:
+            self.async_queue.drain()
 
     def resolve_exception(self, reference, resolution_data):
         """Resolve an existing exception"""
-        exceptions = []
-        updated = False
-        
-        # Read existing exceptions
-        if os.path.exists(self.exception_file):
-            with open(self.exception_file, 'r', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row['reference'] == reference and row['status'] == 'Open':
+        self.flush()
+        if not self.repository.file_indexes:
+            return self.resolve_exceptions({reference: resolution_data})[reference]
+        index = self._open_index()
+        # The event points into the log as it is now, so compaction must not rewrite it before the append
+        with self.repository.locked():
+            if not index.has_open(reference):
+                return False
+
+            # Record the resolution as an event instead of rewriting the exception log
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            event = index.resolution_event(reference, resolution_data.get('resolution', ''), timestamp)
+            self.repository.append_record(index.resolution_file, RESOLUTION_FIELDS, event)
+            index.refresh()
+
+        # Log resolution to audit
+        self._write_to_audit_log({
+            'timestamp': timestamp,
+            'action': 'Exception_Resolved',
+            'reference': reference,
+            'details': f"Resolution: {resolution_data.get('resolution', '')}"
+        })
+
+        if index.resolution_count >= self.compact_after:
+            self.compact_exceptions()
+        return True
+
+    def resolve_exceptions(self, resolutions):
+        """
+        Resolve many exceptions at once
+        resolutions: {reference: resolution_data}; returns {reference: resolved}
+        Events and audit entries are each written as one group
+        """
+        self.flush()
+        if not self.repository.file_indexes:
+            return self._resolve_in_backend(resolutions)
+        index = self._open_index()
+        # Events point into the log as it is now, so compaction must not rewrite it before the append
+        with self.repository.locked():
+            index.refresh()
+
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            results = {}
+            events = []
+            audit_entries = []
+            for reference, resolution_data in resolutions.items():
+                results[reference] = reference in index.open
+                if not results[reference]:
+                    continue
+                resolution = resolution_data.get('resolution', '')
+                events.append(index.resolution_event(reference, resolution, timestamp))
+                audit_entries.append({
+                    'timestamp': timestamp,
+                    'action': 'Exception_Resolved',
+                    'reference': reference,
+                    'details': f"Resolution: {resolution}"
+                })
+
+            if not events:
+                return results
+            self.repository.append_records(index.resolution_file, RESOLUTION_FIELDS, events)
+            index.refresh()
+
+        self._write_audit_entries(audit_entries)
+        if index.resolution_count >= self.compact_after:
+            self.compact_exceptions()
+        return results
+
+    def _resolve_in_backend(self, resolutions):
+        """Resolve exceptions with one bulk status update in a backend without the CSV index"""
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        updates = {
+            str(reference).strip(): {'status': 'Resolved', 'resolution': resolution_data.get('resolution', '')}
+            for reference, resolution_data in resolutions.items()
+        }
+        applied = self.repository.update_status(self.exception_file, updates, where_status='Open')
+        resolved = {row['reference'].strip() for _, row in applied}
+
+        results = {reference: str(reference).strip() in resolved for reference in resolutions}
+        audit_entries = [{
+            'timestamp': timestamp,
+            'action': 'Exception_Resolved',
+            'reference': reference,
+            'details': f"Resolution: {resolutions[reference].get('resolution', '')}"
+        } for reference, result in results.items() if result]
+        if audit_entries:
+            self._write_audit_entries(audit_entries)
+        return results
+
+    def get_open_exceptions(self, reference=None):
+        """Get all open exceptions, optionally filtered by reference"""
+        self.flush()
+        if not self.repository.file_indexes:
+            filters = {'status': 'Open'}
+            if reference is not None:
+                filters['reference'] = reference
+            return list(self.repository.scan(self.exception_file, **filters))
+        return self._open_index().open_rows(reference)
+
+    def compact_exceptions(self):
+        """Fold resolution events into the exception log and clear them, returning how many were applied"""
+        self.flush()
+        if not self.repository.file_indexes:
+            # Backends without the CSV index resolve rows in place, there are no events to fold
+            return 0
+        # A resolution appended between reading the events and clearing them would be lost
+        with self.repository.locked():
+            index = self._open_index()
+            index.refresh()
+            if not os.path.exists(self.exception_file) or not os.path.exists(index.resolution_file):
+                return 0
+
+            with open(self.exception_file, 'rb') as f:
+                fieldnames, data_offset = read_header(f)
+                rows = []
+                open_rows = {}
+                for offset, values in iter_records(f, data_offset):
+                    row = make_row(fieldnames, values)
+                    rows.append(row)
+                    if row.get('status') == 'Open':
+                        open_rows.setdefault(row.get('reference'), []).append((offset, row))
+
+            with open(index.resolution_file, 'rb') as f:
+                events = list(index.iter_resolutions(f, 0))
+
+            # Each event resolves the rows of its reference that were open when it was written
+            for event in events:
+                for offset, row in open_rows.get(event['reference'], []):
+                    if offset < event['log_offset'] and row['status'] == 'Open':
                         row.update({
                             'status': 'Resolved',
-                            'resolution': resolution_data.get('resolution', '')
+                            'resolution': event['resolution']
                         })
-                        updated = True
-                    exceptions.append(row)
-        
-        if updated:
-            # Write back all exceptions
-            with open(self.exception_file, 'w', newline='') as file:
-                if exceptions:
-                    writer = csv.DictWriter(file, fieldnames=exceptions[0].keys())
-                    writer.writeheader()
-                    writer.writerows(exceptions)
-            
-            # Log resolution to audit
-            self._write_to_audit_log({
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'action': 'Exception_Resolved',
-                'reference': reference,
-                'details': f"Resolution: {resolution_data.get('resolution', '')}"
-            })
-            
-        return updated
 
-    def get_open_exceptions(self, reference=None):
-        """Get all open exceptions, optionally filtered by reference"""
-        exceptions = []
-        
-        if os.path.exists(self.exception_file):
-            with open(self.exception_file, 'r', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row['status'] == 'Open':
-                        if reference is None or row['reference'] == reference:
-                            exceptions.append(row)
-        
-        return exceptions
+            if fieldnames:
+                self.repository.write_records(self.exception_file, fieldnames, rows)
+            self.repository.write_records(index.resolution_file, RESOLUTION_FIELDS, [])
+            index.refresh()
+            return len(events)
+
+    def _open_index(self):
+        """Get the open-exception index of the current exception log"""
+        return OpenExceptionIndex.for_file(self.exception_file)
 
     def _write_to_exception_log(self, data):
         """Write to exception log file"""
-        headers = ['timestamp', 'reference', 'type', 'description', 'status', 'resolution']
-        file_exists = os.path.exists(self.exception_file)
-        
-        with open(self.exception_file, 'a', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=headers)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(data)
+        self.repository.append_record(self.exception_file, EXCEPTION_FIELDS, data)
 
     def _write_to_audit_log(self, data):
         """Write to audit log file"""
-        audit_data = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        self._write_audit_entries([data])
+
+    def _write_audit_entries(self, entries):
+        """Write audit entries to the audit log file in one append"""
+        rows = [{
+            'timestamp': data.get('timestamp') or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'action': data.get('action', 'Exception_Logged'),
             'reference': data.get('reference', 'N/A'),
             'details': data.get('details', 'No details provided')
-        }
-        
-        file_exists = os.path.exists(self.audit_file)
+        } for data in entries]
         
-        with open(self.audit_file, 'a', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=audit_data.keys())
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(audit_data)
+        self.repository.append_records(self.audit_file, AUDIT_FIELDS, rows)
 
     def verify_old_payment(self, data):
         """Verify old payment in both CNP and Bank Statement"""
-        verification_result = {
-            'cnp_verified': False,
-            'bs_verified': False,
-            'warnings': [],
-            'requires_approval': False
-        }
-        
         company = data.get('company', '').upper()
         reference = data.get('reference', '')
         
-        # Check CNP file
-        cnp_file = os.path.join(self.base_dir, f'data/cnp/{company.lower()}/CNP_{company}.csv')
-        if os.path.exists(cnp_file):
-            with open(cnp_file, 'r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row['reference'] == reference:
-                        verification_result['cnp_verified'] = True
-                        break
+        cnp_verified = self._reference_in_file(self._cnp_file(company), reference)
+        bs_verified = self._reference_in_file(self._bs_file(company), reference)
+        verification_result = self._verification_result(cnp_verified, bs_verified)
         
-        # Check Bank Statement file
-        bs_file = os.path.join(self.base_dir, f'data/bank_statements/{company.lower()}/BS_{company}.csv')
-        if os.path.exists(bs_file):
-            with open(bs_file, 'r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row['reference'] == reference:
-                        verification_result['bs_verified'] = True
-                        break
+        if verification_result['requires_approval']:
+            self.log_exception(self._verification_exception(reference, verification_result))
+        
+        return verification_result
+
+    def verify_old_payments(self, payments):
+        """
+        Verify many old payments, reading each company's CNP and Bank Statement file once
+        payments: dicts with company and reference; returns results in the same order
+        Exceptions for payments that need approval are logged as one group
+        """
+        references_by_file = {}
+        results = []
+        exceptions = []
+        
+        for data in payments:
+            company = data.get('company', '').upper()
+            reference = data.get('reference', '')
+            found = []
+            for file_path in (self._cnp_file(company), self._bs_file(company)):
+                if file_path not in references_by_file:
+                    references_by_file[file_path] = {
+                        row.get('reference') for row in self.repository.get_records(file_path)
+                    }
+                found.append(reference in references_by_file[file_path])
+            
+            verification_result = self._verification_result(*found)
+            if verification_result['requires_approval']:
+                exceptions.append(self._verification_exception(reference, verification_result))
+            results.append(verification_result)
+        
+        self.log_exceptions(exceptions)
+        return results
+
+    def _cnp_file(self, company):
+        """Get the CNP file of a company"""
+        return os.path.join(self.data_dir, f'cnp/{company.lower()}/CNP_{company}.csv')
+
+    def _bs_file(self, company):
+        """Get the Bank Statement file of a company"""
+        return os.path.join(self.data_dir, f'bank_statements/{company.lower()}/BS_{company}.csv')
+
+    def _verification_result(self, cnp_verified, bs_verified):
+        """Build a verification result with its warnings and approval requirement"""
+        verification_result = {
+            'cnp_verified': cnp_verified,
+            'bs_verified': bs_verified,
+            'warnings': [],
+            'requires_approval': False
+        }
         
         # Set warnings and approval requirements
         if not verification_result['cnp_verified']:
@@ -152,11 +319,19 @@ class ExceptionHandler:
             verification_result['warnings'].append("Payment not found in Bank Statement")
             verification_result['requires_approval'] = True
         
-        if verification_result['requires_approval']:
-            self.log_exception({
-                'reference': reference,
-                'type': 'Old_Payment_Verification',
-                'description': '; '.join(verification_result['warnings'])
-            })
-        
         return verification_result
+
+    def _verification_exception(self, reference, verification_result):
+        """Build the exception logged for a payment that failed verification"""
+        return {
+            'reference': reference,
+            'type': 'Old_Payment_Verification',
+            'description': '; '.join(verification_result['warnings'])
+        }
+
+    def _reference_in_file(self, file_path, reference):
+        """Check if reference exists in file"""
+        if not self.repository.exists(file_path):
+            return False
+        return any(row['reference'] == reference
+                   for row in self.repository.find(file_path, reference))
@@ -0,0 +1,202 @@
+import os
+from sidecar_index import (SidecarIndex, read_header, iter_records, make_row, file_fingerprint,
+                           empty_state, file_stat, is_unchanged, append_digest, record_state)
+
+INDEX_SUFFIX = '.openidx'
+INDEX_VERSION = 2
+RESOLUTION_FIELDS = ['timestamp', 'reference', 'resolution', 'log_offset', 'log_fingerprint']
+
+def resolution_file_for(exception_file):
+    """Get the resolution event log that belongs to an exception log"""
+    return os.path.splitext(exception_file)[0] + '_RESOLUTIONS.csv'
+
+class OpenExceptionIndex(SidecarIndex):
+    SUFFIX = INDEX_SUFFIX
+    VERSION = INDEX_VERSION
+    _instances = {}
+
+    def __init__(self, exception_file):
+        """
+        Reference -> byte offsets of open exceptions, persisted next to the exception log
+        Resolutions are events in a separate log; each one closes the open rows of its
+        reference that were in the exception log when it was written
+        """
+        self.exception_file = os.path.abspath(exception_file)
+        self.resolution_file = resolution_file_for(self.exception_file)
+        super().__init__(self.exception_file)
+
+    def _reset(self):
+        """Clear the in-memory index"""
+        super()._reset()
+        self.open = {}
+        self.log = empty_state()
+        self.resolutions = empty_state()
+        self.resolution_count = 0
+        self._fingerprints = {}
+
+    def _sidecar_data(self):
+        """Get what the sidecar persists"""
+        return {
+            'fieldnames': self.fieldnames,
+            'log': self.log,
+            'resolutions': self.resolutions,
+            'resolution_count': self.resolution_count,
+            'open': self.open
+        }
+
+    def _restore(self, data):
+        """Restore the in-memory index from sidecar data"""
+        self.fieldnames = data['fieldnames']
+        self.open = data['open']
+        self.log = data['log']
+        self.resolutions = data['resolutions']
+        self.resolution_count = data['resolution_count']
+
+    def _changed(self, state, stat):
+        """Check whether a file changed since state was recorded"""
+        if stat is None:
+            return state['mtime_ns'] != 0
+        return not is_unchanged(state, stat)
+
+    def _append_digest(self, file_path, state, stat):
+        """Get the running hash of the indexed part of a file if it only grew past it, else None"""
+        with open(file_path, 'rb') as f:
+            return append_digest(f, state, stat)
+
+    def refresh(self, save=True):
+        """Bring the index up to date with both logs, rebuilding it if either was rewritten"""
+        with self._lock:
+            log_stat = file_stat(self.exception_file)
+            res_stat = file_stat(self.resolution_file)
+            log_changed = self._changed(self.log, log_stat)
+            res_changed = self._changed(self.resolutions, res_stat)
+            if not log_changed and not res_changed:
+                return True
+
+            rebuild = False
+            log_digest = res_digest = None
+            if log_changed:
+                if log_stat is not None:
+                    log_digest = self._append_digest(self.exception_file, self.log, log_stat)
+                rebuild = log_digest is None
+            if res_changed and not rebuild:
+                if res_stat is not None:
+                    res_digest = self._append_digest(self.resolution_file, self.resolutions, res_stat)
+                rebuild = res_digest is None
+
+            if rebuild:
+                self._reset()
+            self._fingerprints = {}
+
+            if log_stat is not None and (rebuild or log_changed):
+                with open(self.exception_file, 'rb') as f:
+                    if rebuild:
+                        self.fieldnames, start = read_header(f)
+                    else:
+                        start = self.log['end']
+                    end = self._extend(f, start)
+                    record_state(f, self.log, log_stat, end, None if rebuild else log_digest)
+
+            if res_stat is not None and (rebuild or res_changed):
+                with open(self.resolution_file, 'rb') as f:
+                    start = read_header(f)[1] if rebuild else self.resolutions['end']
+                    end = self._apply_resolutions(f, start)
+                    record_state(f, self.resolutions, res_stat, end, None if rebuild else res_digest)
+
+            self._dirty = True
+            if save:
+                self._save()
+            return True
+
+    def _extend(self, file, start):
+        """Add open rows of the exception log from start to the index, returning the end of the log"""
+        if self.fieldnames:
+            for offset, values in iter_records(file, start):
+                row = make_row(self.fieldnames, values)
+                if row.get('status') == 'Open':
+                    self.open.setdefault(row.get('reference'), []).append(offset)
+        file.seek(0, os.SEEK_END)
+        return file.tell()
+
+    def iter_resolutions(self, file, start):
+        """Yield resolution events from start that belong to the current exception log"""
+        fieldnames, data_offset = read_header(file)
+        if not fieldnames:
+            return
+        for _, values in iter_records(file, max(start, data_offset)):
+            event = make_row(fieldnames, values)
+            try:
+                log_offset = int(event['log_offset'])
+            except (TypeError, ValueError):
+                continue
+            # Events written against an earlier version of the log are ignored
+            if self._log_fingerprint(log_offset) == event['log_fingerprint']:
+                event['log_offset'] = log_offset
+                yield event
+
+    def _apply_resolutions(self, file, start):
+        """Close the rows resolved by events from start"""
+        for event in self.iter_resolutions(file, start):
+            self.close_rows(event['reference'], event['log_offset'])
+            self.resolution_count += 1
+        file.seek(0, os.SEEK_END)
+        return file.tell()
+
+    def _log_fingerprint(self, size):
+        """Fingerprint of the first size bytes of the exception log, as stored in resolution events"""
+        if size not in self._fingerprints:
+            try:
+                with open(self.exception_file, 'rb') as f:
+                    f.seek(0, os.SEEK_END)
+                    self._fingerprints[size] = file_fingerprint(f, size) if f.tell() >= size else None
+            except OSError:
+                self._fingerprints[size] = None
+        return self._fingerprints[size]
+
+    def close_rows(self, reference, log_offset):
+        """Drop open rows of a reference that start before log_offset, returning how many"""
+        with self._lock:
+            offsets = self.open.get(reference)
+            if not offsets:
+                return 0
+            remaining = [offset for offset in offsets if offset >= log_offset]
+            if remaining:
+                self.open[reference] = remaining
+            else:
+                del self.open[reference]
+            return len(offsets) - len(remaining)
+
+    def has_open(self, reference):
+        """Check whether a reference has open exceptions"""
+        self.refresh()
+        return reference in self.open
+
+    def open_rows(self, reference=None):
+        """Get open exception rows in log order, optionally for one reference"""
+        self.refresh()
+        with self._lock:
+            if reference is None:
+                offsets = sorted(offset for offsets in self.open.values() for offset in offsets)
+            else:
+                offsets = list(self.open.get(reference, []))
+            fieldnames = self.fieldnames
+
+        rows = []
+        if not offsets:
+            return rows
+        with open(self.exception_file, 'rb') as f:
+            for offset in offsets:
+                for _, values in iter_records(f, offset):
+                    rows.append(make_row(fieldnames, values))
+                    break
+        return rows
+
+    def resolution_event(self, reference, resolution, timestamp):
+        """Build a resolution event against the log as currently indexed"""
+        return {
+            'timestamp': timestamp,
+            'reference': reference,
+            'resolution': resolution,
+            'log_offset': self.log['end'],
+            'log_fingerprint': self._log_fingerprint(self.log['end'])
+        }
@@ -1,33 +1,37 @@
 from datetime import datetime
 import csv
 import os
+from amount_index import amount_matches, parse_cents
+from data_repository import DataRepository
 
 class FileOperations:
-    def __init__(self):
+    def __init__(self, repository=None, data_dir=None):
+        self.repository = repository or DataRepository()
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.data_dir = data_dir or os.path.join(self.base_dir, 'data')
         self.file_paths = {
-            'BS-SALAM': os.path.join(self.base_dir, 'data/bank_statements/SALAM/BS_SALAM_CURRENT.csv'),
-            'BS-MVNO': os.path.join(self.base_dir, 'data/bank_statements/mvno/BS_MVNO_CURRENT.csv'),
-            'CNP-SALAM': os.path.join(self.base_dir, 'data/cnp/SALAM/CNP_SALAM_CURRENT.csv'),
-            'CNP-MVNO': os.path.join(self.base_dir, 'data/cnp/mvno/CNP_MVNO_CURRENT.csv'),
-            'Treasury': os.path.join(self.base_dir, 'data/treasury/TREASURY_CURRENT.csv')
+            'BS-SALAM': os.path.join(self.data_dir, 'bank_statements/SALAM/BS_SALAM_CURRENT.csv'),
+            'BS-MVNO': os.path.join(self.data_dir, 'bank_statements/mvno/BS_MVNO_CURRENT.csv'),
+            'CNP-SALAM': os.path.join(self.data_dir, 'cnp/SALAM/CNP_SALAM_CURRENT.csv'),
+            'CNP-MVNO': os.path.join(self.data_dir, 'cnp/mvno/CNP_MVNO_CURRENT.csv'),
+            'Treasury': os.path.join(self.data_dir, 'treasury/TREASURY_CURRENT.csv')
         }
         self._ensure_directories()
 
     def _ensure_directories(self):
         """Ensure all required directories exist"""
         directories = [
-            'data',
-            'data/bank_statements',
-            'data/bank_statements/SALAM',
-            'data/bank_statements/mvno',
-            'data/cnp',
-            'data/cnp/SALAM',
-            'data/cnp/mvno',
-            'data/treasury'
+            '',
+            'bank_statements',
+            'bank_statements/SALAM',
+            'bank_statements/mvno',
+            'cnp',
+            'cnp/SALAM',
+            'cnp/mvno',
+            'treasury'
         ]
         for directory in directories:
-            dir_path = os.path.join(self.base_dir, directory)
+            dir_path = os.path.join(self.data_dir, directory)
             if not os.path.exists(dir_path):
                 os.makedirs(dir_path)
                 # Ensure write permissions
@@ -121,26 +125,37 @@ class FileOperations:
 
         file_path = self.file_paths[file_key]
         try:
-            if not os.path.exists(file_path):
+            if not self.repository.exists(file_path):
                 results['messages'].append(f"File not found: {file_path}")
                 return results
 
             print(f"Checking file: {file_path}")  # Debug print
-            with open(file_path, 'r', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    print(f"Checking row: {row}")  # Debug print
-                    if self._is_matching_record(row, payment_data):
-                        results['matches'].append({
-                            'file': file_key,
-                            'record': row
-                        })
+            for row in self._candidate_rows(file_path, payment_data):
+                print(f"Checking row: {row}")  # Debug print
+                if self._is_matching_record(row, payment_data):
+                    results['matches'].append({
+                        'file': file_key,
+                        'record': row
+                    })
         except Exception as e:
             results['messages'].append(f"Error reading {file_key}: {str(e)}")
             print(f"Error: {str(e)}")  # Debug print
 
         return results
 
+    def _candidate_rows(self, file_path, payment_data):
+        """Get the rows of a file with the payment's reference that may match its amount"""
+        snapshot = self.repository.snapshot(file_path)
+        if snapshot is None:
+            return self.repository.find(file_path, payment_data['reference'])
+
+        # Narrow to rows with the reference and a matching amount on the snapshot columns,
+        # then read only those rows from the CSV
+        payment_cents = parse_cents(payment_data.get('amount'))
+        rows = [row for row in snapshot.find(payment_data['reference'])
+                if payment_cents is not None and amount_matches(snapshot.amount_cents[row], payment_cents)]
+        return snapshot.records(rows, payment_data['reference'])
+
     def _is_matching_record(self, record, payment_data):
         """Check if record matches payment data"""
         try:
@@ -148,21 +163,40 @@ class FileOperations:
             if record['reference'].strip() != payment_data['reference'].strip():
                 return False
 
-            # Match amount (with threshold handling)
-            amount = float(record['amount'])
-            payment_amount = float(payment_data['amount'])
-            if amount > 15000:
-                # 1% tolerance for amounts over 15000
-                difference = abs(amount - payment_amount) / amount
-                if difference > 0.01:
-                    return False
-            elif amount != payment_amount:
+            # Match amount in cents (1% tolerance for amounts over 15000)
+            record_cents = parse_cents(record['amount'])
+            payment_cents = parse_cents(payment_data.get('amount'))
+            if record_cents is None or payment_cents is None:
                 return False
-
-            return True
+            return amount_matches(record_cents, payment_cents)
         except (KeyError, ValueError) as e:
             return False
 
+    def amount_index(self, file_key):
+        """Get the sorted amount index of a file"""
+        file_path = self.file_paths.get(file_key) or self.file_paths.get(file_key.upper())
+        if not file_path:
+            raise ValueError(f"Invalid file key: {file_key}")
+        return self.repository.amount_index(file_path)
+
+    def find_possible_matches(self, payment_data):
+        """Find records with a matching amount but a different reference in the company's BS and CNP files"""
+        matches = []
+        payment_cents = parse_cents(payment_data.get('amount'))
+        if payment_cents is None:
+            return matches
+
+        for file_key in (f"BS-{payment_data['company']}", f"CNP-{payment_data['company']}"):
+            if file_key not in self.file_paths:
+                continue
+            index = self.amount_index(file_key)
+            for record in index.find_amount(payment_cents, exclude_reference=payment_data['reference']):
+                matches.append({
+                    'file': file_key,
+                    'record': record
+                })
+        return matches
+
     def _is_old_payment(self, payment_date):
         """Check if payment is from previous month"""
         payment_date = datetime.strptime(payment_date, '%Y-%m-%d')
@@ -171,6 +205,13 @@ class FileOperations:
         return (payment_date.year < current_date.year or 
                 payment_date.month < current_date.month)
 
+    def read_file(self, file_key):
+        """Get all records of a file from the shared repository"""
+        file_path = self.file_paths.get(file_key) or self.file_paths.get(file_key.upper())
+        if not file_path:
+            raise ValueError(f"Invalid file key: {file_key}")
+        return self.repository.get_records(file_path)
+
     def get_file_path(self, file_key):
         """Get absolute path for a file"""
         return self.file_paths.get(file_key)
@@ -189,16 +230,10 @@ class FileOperations:
         try:
             file_path = self.file_paths['Treasury']
             
-            # Create Treasury file with headers if it doesn't exist
-            if not os.path.exists(file_path):
-                with open(file_path, 'w', newline='') as file:
-                    writer = csv.DictWriter(file, fieldnames=['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary'])
-                    writer.writeheader()
-            
-            # Append payment data to Treasury
-            with open(file_path, 'a', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary'])
-                writer.writerow({
+            # Append payment data to Treasury, creating it with headers if needed
+            self.repository.append_payment(
+                file_path,
+                {
                     'reference': payment_data['reference'],
                     'amount': payment_data['amount'],
                     'date': payment_data['date'],
@@ -206,7 +241,8 @@ class FileOperations:
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                     'company': payment_data['company'],
                     'beneficiary': payment_data['beneficiary']
-                })
+                }
+            )
             return True, "Payment added to Treasury successfully"
         except Exception as e:
             error_msg = f"Error saving to Treasury: {str(e)}"
@@ -0,0 +1,109 @@
+import os
+import threading
+import uuid
+from amount_index import parse_cents
+from storage_backend import StorageBackend
+
+class MemoryBackend(StorageBackend):
+    def __init__(self):
+        """Storage backend keeping every dataset in memory, for tests and benchmarks"""
+        self._datasets = {}
+        self._lock = threading.RLock()
+
+    def _entry(self, dataset):
+        """Get the stored entry of a dataset, None if it does not exist"""
+        return self._datasets.get(os.path.abspath(dataset))
+
+    def _new_entry(self, dataset, fieldnames):
+        """Create an empty dataset with the given columns"""
+        entry = {
+            'fieldnames': list(fieldnames),
+            'records': [],
+            'cents': [],
+            'by_reference': {},
+            # Identifies this version of the dataset, also against checkpoints saved by other processes
+            'generation': uuid.uuid4().hex
+        }
+        self._datasets[os.path.abspath(dataset)] = entry
+        return entry
+
+    def _add(self, entry, record):
+        """Store a record the way a CSV round trip would: only known columns, as strings"""
+        row = {field: '' if record.get(field) is None else str(record.get(field))
+               for field in entry['fieldnames']}
+        entry['by_reference'].setdefault(row.get('reference', '').strip(), []).append(len(entry['records']))
+        entry['records'].append(row)
+        entry['cents'].append(parse_cents(row.get('amount')))
+
+    def exists(self, dataset):
+        """Check whether a dataset has been created"""
+        with self._lock:
+            return self._entry(dataset) is not None
+
+    def get_fieldnames(self, dataset):
+        """Get the columns of a dataset"""
+        with self._lock:
+            entry = self._entry(dataset)
+            return list(entry['fieldnames']) if entry else []
+
+    def get_records(self, dataset):
+        """Get all records of a dataset; the returned rows are shared and must not be modified"""
+        with self._lock:
+            entry = self._entry(dataset)
+            return list(entry['records']) if entry else []
+
+    def find(self, dataset, reference):
+        """Get records with the given stripped reference"""
+        with self._lock:
+            entry = self._entry(dataset)
+            if entry is None:
+                return []
+            rows = entry['by_reference'].get(str(reference).strip(), [])
+            return [entry['records'][row] for row in rows]
+
+    def append_records(self, dataset, fieldnames, records):
+        """Append records, creating the dataset with fieldnames if needed"""
+        with self._lock:
+            entry = self._entry(dataset) or self._new_entry(dataset, fieldnames)
+            for record in records:
+                self._add(entry, record)
+
+    def write_records(self, dataset, fieldnames, records):
+        """Replace all records of a dataset"""
+        with self._lock:
+            entry = self._new_entry(dataset, fieldnames)
+            for record in records:
+                self._add(entry, record)
+
+    def update_status(self, dataset, updates, where_status=None, fill_fields=()):
+        """Update many records in one write, holding the lock so no append lands between the read and the write"""
+        with self._lock:
+            return super().update_status(dataset, updates, where_status, fill_fields)
+
+    def read_position(self, dataset):
+        """Get (row count, row count, generation) of a dataset"""
+        with self._lock:
+            entry = self._entry(dataset)
+            if entry is None:
+                return 0, 0, ''
+            return len(entry['records']), len(entry['records']), entry['generation']
+
+    def position_valid(self, dataset, position, fingerprint):
+        """Check that a dataset was only appended to since position was read"""
+        with self._lock:
+            entry = self._entry(dataset)
+            return entry is not None and entry['generation'] == fingerprint and position <= len(entry['records'])
+
+    def row_at(self, dataset, position):
+        """Positions are row numbers"""
+        return position
+
+    def lookup_amounts(self, dataset, reference, first_row=0):
+        """Get (amount cents, status) of the rows with reference from first_row on, in dataset order"""
+        with self._lock:
+            entry = self._entry(dataset)
+            if entry is None:
+                return []
+            return [(entry['cents'][row], entry['records'][row].get('status', '').strip())
+                    for row in entry['by_reference'].get(str(reference).strip(), [])
+                    if row >= first_row and entry['cents'][row] is not None]
@@ -3,24 +3,36 @@ from tkinter import ttk, messagebox
 from datetime import datetime
 import csv
 import os
+import queue
+import threading
+import time
 from validation_system import ValidationSystem
 from file_operations import FileOperations
 from status_tracker import StatusTracker
 from exception_handler import ExceptionHandler
 from audit_trail import AuditTrail
+from data_repository import DataRepository
+from async_logger import AsyncLogQueue
+
+CNP_FIELDS = ['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary',
+              'explanation', 'approver', 'signature']
 
 class PaymentSystem:
-    def __init__(self, root):
+    def __init__(self, root, repository=None):
         self.root = root
         self.root.title("Payment Processing System - ACTIVE")
         self.root.geometry("800x600")
         
-        # Initialize Components
+        # Initialize Components sharing one storage backend, the cached CSV files by default
+        self.repository = repository or DataRepository()
+        # Audit and exception writes run on a background thread, off the Tk callbacks
+        self.log_queue = AsyncLogQueue()
         self.validator = ValidationSystem()
-        self.file_ops = FileOperations()
-        self.status_tracker = StatusTracker()
-        self.exception_handler = ExceptionHandler()
-        self.audit_trail = AuditTrail()
+        self.file_ops = FileOperations(repository=self.repository)
+        self.status_tracker = StatusTracker(repository=self.repository)
+        self.exception_handler = ExceptionHandler(repository=self.repository, async_queue=self.log_queue)
+        # Audit events are group-committed; the writer flushes within a second and on exit
+        self.audit_trail = AuditTrail(durability='batch', async_queue=self.log_queue, repository=self.repository)
         
         # Setup Variables
         self.setup_variables()
@@ -174,8 +186,25 @@ class PaymentSystem:
         ttk.Button(file_frame, text="Treasury", command=lambda: self.open_file("Treasury")).grid(row=0, column=4, padx=5)
 
         # Update Status button
-        ttk.Button(file_frame, text="Update All Statuses", command=self.update_all_statuses).grid(
-            row=1, column=0, columnspan=5, pady=10)
+        self.update_button = ttk.Button(file_frame, text="Update All Statuses", command=self.update_all_statuses)
+        self.update_button.grid(row=1, column=0, columnspan=5, pady=10)
+
+        # Progress of the background status update
+        progress_frame = ttk.Frame(file_frame)
+        progress_frame.grid(row=2, column=0, columnspan=5, sticky="ew")
+        progress_frame.grid_columnconfigure(0, weight=1)
+
+        self.update_progress = ttk.Progressbar(progress_frame, mode='determinate')
+        self.update_progress.grid(row=0, column=0, sticky="ew", padx=5)
+        self.update_eta_label = ttk.Label(progress_frame, text="")
+        self.update_eta_label.grid(row=0, column=1, padx=5)
+        self.cancel_update_button = ttk.Button(progress_frame, text="Cancel", command=self.cancel_status_update)
+        self.cancel_update_button.grid(row=0, column=2, padx=5)
+        self.cancel_update_button.state(['disabled'])
+
+        self.update_thread = None
+        self.update_queue = queue.Queue()
+        self.update_cancel_event = threading.Event()
 
     def validate_payment(self):
         """Validate payment details"""
@@ -342,10 +371,9 @@ Do you want to proceed with this payment?"""
         try:
             self.log_audit('Status_Check', 'Checking payment status', reference, 'Started')
 
-            status_data = self.status_tracker.update_status(reference)
-            exceptions = self.exception_handler.get_open_exceptions(reference)
+            status_data = self.status_tracker.update_status(reference, self.exception_handler)
 
-            self.display_status_results(status_data, exceptions)
+            self.display_status_results(status_data, status_data['exceptions'])
 
             self.log_audit('Status_Check', 
                           f"Status: {status_data['status']}",
@@ -356,14 +384,101 @@ Do you want to proceed with this payment?"""
             self.handle_exception('Status_Check_Error', str(e), reference)
 
     def update_all_statuses(self):
-        """Update status for all payments"""
+        """Start updating status for all payments in a background thread"""
+        if self.update_thread is not None and self.update_thread.is_alive():
+            self.show_in_results("Status update already running")
+            return
+
+        self.update_queue = queue.Queue()
+        self.update_cancel_event = threading.Event()
+        self.update_started = time.monotonic()
+        self.update_progress.config(value=0, maximum=1)
+        self.update_eta_label.config(text="Starting...")
+        self.update_button.state(['disabled'])
+        self.cancel_update_button.state(['!disabled'])
+        self.log_audit('Bulk_Update', 'Status update started', 'N/A', 'Started')
+
+        self.update_thread = threading.Thread(target=self._run_status_update, daemon=True)
+        self.update_thread.start()
+        self.root.after(100, self._poll_status_update)
+
+    def _run_status_update(self):
+        """Run reconciliation on the worker thread, reporting through the queue"""
+        last_report = [0.0]
+
+        def report_progress(done, total):
+            # Throttle progress messages so the UI queue does not flood on big runs
+            now = time.monotonic()
+            if done == total or now - last_report[0] >= 0.1:
+                last_report[0] = now
+                self.update_queue.put(('progress', (done, total)))
+
         try:
-            results = self.status_tracker.update_all_statuses()
+            results = self.status_tracker.update_all_statuses(
+                progress_callback=report_progress,
+                cancel_event=self.update_cancel_event
+            )
+            self.update_queue.put(('done', results))
+        except Exception as e:
+            self.update_queue.put(('error', str(e)))
 
+    def _poll_status_update(self):
+        """Apply worker messages on the Tk thread and reschedule until the run ends"""
+        try:
+            while True:
+                kind, payload = self.update_queue.get_nowait()
+                if kind == 'progress':
+                    self._show_update_progress(*payload)
+                elif kind == 'done':
+                    self._finish_status_update()
+                    self.display_update_results(payload)
+                    return
+                elif kind == 'error':
+                    self._finish_status_update()
+                    self.handle_exception('Bulk_Update_Error', payload)
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self._poll_status_update)
+
+    def _show_update_progress(self, done, total):
+        """Update progress bar and ETA"""
+        self.update_progress.config(maximum=max(total, 1), value=done)
+        elapsed = time.monotonic() - self.update_started
+        if done and done < total:
+            remaining = elapsed / done * (total - done)
+            self.update_eta_label.config(text=f"{done}/{total} - ETA {int(remaining // 60)}m {int(remaining % 60)}s")
+        else:
+            self.update_eta_label.config(text=f"{done}/{total}")
+
+    def _finish_status_update(self):
+        """Reset controls after the worker finished"""
+        self.update_button.state(['!disabled'])
+        self.cancel_update_button.state(['disabled'])
+        self.update_eta_label.config(text="")
+
+    def cancel_status_update(self):
+        """Ask the worker to stop before the next payment"""
+        if self.update_thread is not None and self.update_thread.is_alive():
+            self.update_cancel_event.set()
+            self.update_eta_label.config(text="Cancelling...")
+
+    def stop_status_update(self):
+        """Cancel a running status update and wait for it, so a Treasury write is never cut short"""
+        if self.update_thread is not None:
+            self.update_cancel_event.set()
+            self.update_thread.join()
+            self.update_thread = None
+
+    def display_update_results(self, results):
+        """Display results of the status update"""
+        try:
             # Format results nicely
             output = "\n=== Updating All Statuses ===\n\n"
 
-            if results['updated'] > 0:
+            if results.get('cancelled'):
+                output += "Status update cancelled - no changes written\n"
+            elif results['updated'] > 0:
                 output += f"Successfully updated {results['updated']} payment(s)\n\n"
                 for detail in results['details']:
                     output += f"• {detail}\n"
@@ -378,6 +493,18 @@ Do you want to proceed with this payment?"""
 
             self.show_in_results(output)
 
+            # Audit each Treasury row change from the returned change set
+            for change in results.get('changes', []):
+                self.log_audit('Status_Updated',
+                               f"Treasury row {change['row']}: {change['old_status']} -> {change['new_status']}"
+                               f" (Company: {change['company']})",
+                               change['reference'])
+
+            self.log_audit('Bulk_Update',
+                           'Status update cancelled' if results.get('cancelled') else f"Updated {results['updated']} payment(s)",
+                           'N/A',
+                           'Cancelled' if results.get('cancelled') else 'Completed')
+
         except Exception as e:
             self.handle_exception('Bulk_Update_Error', str(e))
 
@@ -572,27 +699,19 @@ Do you want to proceed with this payment?"""
                 'TREASURY_CURRENT.csv'
             )
             
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(treasury_file), exist_ok=True)
-            
-            # Check if file exists and create with headers if it doesn't
-            if not os.path.exists(treasury_file):
-                with open(treasury_file, 'w', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary'])
-            
-            # Append payment data
-            with open(treasury_file, 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    payment_data['reference'],
-                    payment_data['amount'],
-                    payment_data['date'],
-                    payment_data['status'],
-                    payment_data['timestamp'],
-                    payment_data['company'],
-                    payment_data['beneficiary']
-                ])
+            # Append payment data, creating the file with headers if needed
+            self.repository.append_payment(
+                treasury_file,
+                {
+                    'reference': payment_data['reference'],
+                    'amount': payment_data['amount'],
+                    'date': payment_data['date'],
+                    'status': payment_data['status'],
+                    'timestamp': payment_data['timestamp'],
+                    'company': payment_data['company'],
+                    'beneficiary': payment_data['beneficiary']
+                }
+            )
                 
         except Exception as e:
             raise Exception(f"Error saving to treasury: {str(e)}")
@@ -607,30 +726,23 @@ Do you want to proceed with this payment?"""
                 f"CNP_{payment_data['company']}_CURRENT.csv"
             )
             
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(cnp_file), exist_ok=True)
-            
-            # Check if file exists and create with headers if it doesn't
-            if not os.path.exists(cnp_file):
-                with open(cnp_file, 'w', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary', 'explanation', 'approver', 'signature'])
-            
-            # Append payment data
-            with open(cnp_file, 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    payment_data['reference'],
-                    payment_data['amount'],
-                    payment_data['date'],
-                    payment_data['status'],
-                    payment_data['timestamp'],
-                    payment_data['company'],
-                    payment_data['beneficiary'],
-                    payment_data.get('cnp_explanation', ''),
-                    payment_data.get('cnp_approver', ''),
-                    payment_data.get('cnp_signature', '')
-                ])
+            # Append payment data, creating the file with headers if needed
+            self.repository.append_payment(
+                cnp_file,
+                {
+                    'reference': payment_data['reference'],
+                    'amount': payment_data['amount'],
+                    'date': payment_data['date'],
+                    'status': payment_data['status'],
+                    'timestamp': payment_data['timestamp'],
+                    'company': payment_data['company'],
+                    'beneficiary': payment_data['beneficiary'],
+                    'explanation': payment_data.get('cnp_explanation', ''),
+                    'approver': payment_data.get('cnp_approver', ''),
+                    'signature': payment_data.get('cnp_signature', '')
+                },
+                CNP_FIELDS
+            )
                 
         except Exception as e:
             raise Exception(f"Error saving to CNP: {str(e)}")
@@ -744,15 +856,13 @@ Do you want to proceed with this payment?"""
             f'CNP_{company}_CURRENT.csv'
         )
         
-        if not os.path.exists(cnp_file):
+        if not self.repository.exists(cnp_file):
             return False
             
         try:
-            with open(cnp_file, 'r', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    if row['reference'].strip() == reference:
-                        return True
+            for row in self.repository.find(cnp_file, reference):
+                if row['reference'].strip() == reference:
+                    return True
         except Exception as e:
             print(f"Error checking CNP file: {e}")
             
@@ -763,6 +873,9 @@ def main():
         root = tk.Tk()
         app = PaymentSystem(root)
         root.mainloop()
+        app.stop_status_update()
+        app.log_queue.close()
+        app.audit_trail.close()
     except Exception as e:
         messagebox.showerror("Fatal Error", str(e))
         raise
@@ -0,0 +1,189 @@
+from contextlib import redirect_stdout
+import argparse
+import csv
+import itertools
+import json
+import sys
+from audit_trail import AuditTrail, PARTITION_SCHEMES
+from exception_handler import ExceptionHandler
+from status_tracker import StatusTracker
+
+# Scheduled jobs run this without the GUI: tkinter is never imported
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_USAGE = 2
+
+def open_repository(args):
+    """Get the storage backend selected on the command line, None for the CSV files"""
+    if not args.database:
+        return None
+    from sqlite_backend import SQLiteBackend
+    return SQLiteBackend(args.database)
+
+def create_tracker(args):
+    """Create a StatusTracker on the selected data directory and backend"""
+    return StatusTracker(repository=open_repository(args), data_dir=args.data_dir)
+
+def reconcile(args):
+    """Update the status of every Treasury payment"""
+    results = create_tracker(args).update_all_statuses(full=args.full, workers=args.workers)
+    return results, EXIT_ERRORS if results['errors'] else EXIT_OK
+
+def read_payments(input_file):
+    """Yield (reference, amount) pairs to check from a CSV file with reference and amount columns"""
+    if input_file == '-':
+        for row in csv.DictReader(sys.stdin):
+            yield row['reference'], row['amount']
+        return
+    with open(input_file, 'r', newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            yield row['reference'], row['amount']
+
+def check(args):
+    """
+    Check the status of Treasury references and of (reference, amount) pairs from an input file
+    Input rows are read, checked and written to stdout one at a time, so any number fits in memory
+    """
+    tracker = create_tracker(args)
+    items = itertools.chain(read_payments(args.input) if args.input else [], args.references)
+    output = args.output
+    errors = 0
+    output.write('{\n  "payments": [')
+    try:
+        for number, result in enumerate(tracker.iter_statuses(items)):
+            if result['status'] == 'Not Found':
+                errors += 1
+            output.write(',\n    ' if number else '\n    ')
+            output.write(json.dumps(result, default=str))
+        output.write('\n  ],\n')
+    except Exception as e:
+        # Keep the output valid JSON when a row fails halfway
+        errors += 1
+        output.write(f'\n  ],\n  "error": {json.dumps(str(e))},\n')
+    output.write(f'  "errors": {errors}\n}}\n')
+    return None, EXIT_ERRORS if errors else EXIT_OK
+
+def export_audit(args):
+    """Export a filtered audit trail"""
+    audit_trail = AuditTrail(partition=args.partition, repository=open_repository(args), data_dir=args.data_dir)
+    try:
+        rows = audit_trail.export_audit_trails([{
+            'output_file': args.output_file,
+            'reference': args.reference,
+            'action_type': args.action,
+            'start_date': args.start_date,
+            'end_date': args.end_date,
+            'compression': args.compression
+        }])[args.output_file]
+    finally:
+        audit_trail.close()
+    return {'output_file': args.output_file, 'rows': rows}, EXIT_OK
+
+def migrate(args):
+    """
+    Copy CSV files into the database, by default every dataset of the data directory
+    Those are the Treasury, BS and CNP files, the exception log with its pending resolutions
+    folded in and the audit log with its partitions merged into it
+    """
+    repository = open_repository(args)
+    if args.files:
+        return {'database': repository.database, 'migrated': repository.migrate_from_csv(args.files)}, EXIT_OK
+
+    tracker = StatusTracker(repository=repository, data_dir=args.data_dir)
+    exception_handler = ExceptionHandler(data_dir=args.data_dir)
+    # The database resolves exceptions in place, so events left in the resolution log would be lost
+    exception_handler.compact_exceptions()
+    counts = repository.migrate_from_csv([tracker.treasury_file] + list(tracker.bs_files.values()) +
+                                         list(tracker.cnp_files.values()) + [exception_handler.exception_file])
+
+    # AuditTrail reads a database's audit log as one dataset; any scheme lists every partition when undated
+    audit_trail = AuditTrail(partition='monthly', data_dir=args.data_dir)
+    try:
+        rows = list(audit_trail.iter_actions())
+    finally:
+        audit_trail.close()
+    if rows:
+        repository.write_records(audit_trail.audit_file, audit_trail.fieldnames, rows)
+        counts[audit_trail.audit_file] = len(rows)
+    return {'database': repository.database, 'migrated': counts}, EXIT_OK
+
+def export(args):
+    """Write a dataset of the database to CSV for Excel"""
+    repository = open_repository(args)
+    if not repository.exists(args.dataset):
+        return {'error': f"Dataset not found: {args.dataset}"}, EXIT_ERRORS
+    output_file = args.output_file or args.dataset
+    return {'output_file': output_file, 'rows': repository.export_csv(args.dataset, output_file)}, EXIT_OK
+
+def build_parser():
+    """Build the command line parser"""
+    parser = argparse.ArgumentParser(prog='reconcile_cli', description='Headless payment reconciliation')
+    parser.add_argument('--data-dir', help='Data directory to use instead of the one next to the program')
+    parser.add_argument('--database', help='SQLite database to use instead of the CSV files')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    reconcile_parser = commands.add_parser('reconcile', help='Update the status of all Treasury payments')
+    reconcile_parser.add_argument('--full', action='store_true', help='Ignore the checkpoint and re-match everything')
+    reconcile_parser.add_argument('--workers', type=int, help='Match sharded payments in this many processes')
+    reconcile_parser.set_defaults(handler=reconcile)
+
+    check_parser = commands.add_parser('check', help='Check the status of payments')
+    check_parser.add_argument('references', nargs='*', help='Treasury references to check')
+    check_parser.add_argument('--input', help='CSV file of references and amounts to check, - for stdin')
+    check_parser.set_defaults(handler=check)
+
+    export_parser = commands.add_parser('export-audit', help='Export a filtered audit trail')
+    export_parser.add_argument('output_file')
+    export_parser.add_argument('--reference')
+    export_parser.add_argument('--action')
+    export_parser.add_argument('--start-date')
+    export_parser.add_argument('--end-date')
+    export_parser.add_argument('--compression', choices=['gzip', 'lzma'])
+    export_parser.add_argument('--partition', choices=sorted(PARTITION_SCHEMES))
+    export_parser.set_defaults(handler=export_audit)
+
+    migrate_parser = commands.add_parser('migrate', help='Copy CSV files into the --database')
+    migrate_parser.add_argument('files', nargs='*', help='CSV files to copy, by default every dataset of the data directory')
+    migrate_parser.set_defaults(handler=migrate)
+
+    export_csv_parser = commands.add_parser('export', help='Write a dataset of the --database to CSV')
+    export_csv_parser.add_argument('dataset', help='CSV path the dataset was migrated from')
+    export_csv_parser.add_argument('--output-file', help='CSV file to write instead of the dataset path')
+    export_csv_parser.set_defaults(handler=export)
+    return parser
+
+def main(argv=None):
+    """
+    Run one command and print its result as JSON on stdout
+    Returns 0 on success, 1 when the command reported errors and 2 for invalid arguments
+    """
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return e.code
+    if args.command == 'check' and not (args.references or args.input):
+        parser.print_usage(sys.stderr)
+        print('reconcile_cli check: give references or --input', file=sys.stderr)
+        return EXIT_USAGE
+    if args.command in ('migrate', 'export') and not args.database:
+        parser.print_usage(sys.stderr)
+        print(f'reconcile_cli {args.command}: --database is required', file=sys.stderr)
+        return EXIT_USAGE
+
+    # Commands that stream their result write it to args.output and return None
+    args.output = sys.stdout
+    try:
+        # Components report progress with print; keep stdout for the JSON result
+        with redirect_stdout(sys.stderr):
+            result, code = args.handler(args)
+    except Exception as e:
+        result, code = {'error': str(e)}, EXIT_ERRORS
+    if result is None:
+        return code
+    json.dump(result, sys.stdout, indent=2, default=str)
+    sys.stdout.write('\n')
+    return code
+
+if __name__ == '__main__':
+    sys.exit(main())
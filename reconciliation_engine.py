@@ -0,0 +1,198 @@
+from amount_index import parse_cents
+from data_repository import DataRepository
+
+class ReconciliationEngine:
+    def __init__(self, bs_files, cnp_files, tolerance=0.01, repository=None):
+        """Match Treasury payments against the BS/CNP data through the storage backend's amount lookups"""
+        self.repository = repository or DataRepository()
+        self.bs_files = bs_files
+        self.cnp_files = cnp_files
+        self.tolerance = tolerance
+        self.tolerance_cents = parse_cents(tolerance)
+
+        # {source: {company: first row to match, or None for a missing file}}
+        self.first_rows = {'BS': {}, 'CNP': {}}
+
+        # {file_path: {'offset', 'rows', 'fingerprint'}} for the data read by load()
+        self.checkpoints = {}
+
+        # {(source, company, reference, amount cents, first row): status or None} found by prefetch()
+        self.matches = {}
+
+        # {(source, company): stripped references of the rows from the first row to match}, filled on first use
+        self.appended = {}
+
+    def _files(self, source):
+        """Get the company -> file mapping for a source"""
+        return self.bs_files if source == 'BS' else self.cnp_files
+
+    def load(self, start_offsets=None):
+        """
+        Note where every BS and CNP file ends, and where matching starts
+        Files listed in start_offsets only contribute rows after that position
+        """
+        start_offsets = start_offsets or {}
+        for source in ('BS', 'CNP'):
+            for company, file_path in self._files(source).items():
+                self.first_rows[source][company] = self._first_row(file_path, start_offsets.get(file_path))
+        return self
+
+    def adopt(self, first_rows, checkpoints):
+        """Take the first rows and checkpoints another engine loaded for the same files, without reading them again"""
+        self.first_rows = {source: dict(rows) for source, rows in first_rows.items()}
+        self.checkpoints = {file_path: dict(checkpoint) for file_path, checkpoint in checkpoints.items()}
+        return self
+
+    def _first_row(self, file_path, start=None):
+        """Get the first row to match in one file; rows before it were matched by an earlier run"""
+        if not self.repository.exists(file_path):
+            self.checkpoints[file_path] = {'offset': 0, 'rows': 0, 'fingerprint': ''}
+            return None
+
+        try:
+            position, rows, fingerprint = self.repository.read_position(file_path)
+            first_row = 0 if start is None else self.repository.row_at(file_path, start)
+            self.checkpoints[file_path] = {'offset': position, 'rows': rows - first_row, 'fingerprint': fingerprint}
+            return first_row
+        except Exception as e:
+            print(f"Error reading file {file_path}: {e}")
+            return None
+
+    def prefetch(self, lookups):
+        """
+        Match many payments at once with one set-based match_amounts call per BS/CNP file
+        lookups: (payment, company, indexed) as match_payment will be called with; lookup then
+        answers from the results of the last prefetch instead of querying the repository per payment.
+        Backends without batch matching are left to their point lookups.
+        """
+        self.matches = {}
+        if not self.repository.batch_matching:
+            return self
+        queries = {}
+        for payment, company, indexed in lookups:
+            reference, payment_amount, companies = self._parse_payment(payment, company)
+            if payment_amount is None:
+                continue
+            for source in ('BS', 'CNP'):
+                for comp in companies:
+                    first_row = self.first_rows[source].get(comp)
+                    if first_row is not None and (indexed or self._may_match(source, comp, reference)):
+                        queries.setdefault((source, comp), set()).add(
+                            (reference, payment_amount, 0 if indexed else first_row))
+
+        for (source, comp), keys in queries.items():
+            keys = list(keys)
+            try:
+                statuses = self.repository.match_amounts(self._files(source)[comp], keys, self.tolerance_cents)
+            except Exception as e:
+                # lookup falls back to one query per payment
+                print(f"Error matching {source}-{comp}: {e}")
+                continue
+            for key, status in zip(keys, statuses):
+                self.matches[(source, comp) + key] = status
+        return self
+
+    def _may_match(self, source, company, reference):
+        """
+        Check whether the rows loaded for this run can hold the reference
+        When matching resumes from a checkpoint, only the references of the appended rows can match, so
+        a file with no appended rows is skipped without a lookup
+        """
+        first_row = self.first_rows[source][company]
+        if not first_row:
+            return True
+        key = (source, company)
+        if key not in self.appended:
+            file_path = self._files(source)[company]
+            if self.checkpoints[file_path]['rows'] <= 0:
+                self.appended[key] = set()
+            else:
+                self.appended[key] = self.repository.references_from(file_path, first_row)
+        return reference in self.appended[key]
+
+    def may_match_appended(self, reference, company):
+        """Check whether any BS or CNP file of the company got rows with the reference since the checkpoint"""
+        for source in ('BS', 'CNP'):
+            for comp in ([company] if company else ['SALAM', 'MVNO']):
+                if self.first_rows[source].get(comp) is not None and self._may_match(source, comp, reference):
+                    return True
+        return False
+
+    def lookup(self, source, company, reference, amount, indexed=False):
+        """
+        Return status of the first row matching reference and amount, like check_file_for_payment
+        With indexed=True the whole file is searched instead of only the rows loaded for this run
+        """
+        if company not in self.first_rows[source]:
+            # Unknown company behaves like a missing file lookup in StatusTracker
+            raise KeyError(company)
+        first_row = self.first_rows[source][company]
+        if first_row is None:
+            return None
+
+        if not indexed and not self._may_match(source, company, reference):
+            return None
+        first_row = 0 if indexed else first_row
+        key = (source, company, reference, amount, first_row)
+        if key in self.matches:
+            return self.matches[key]
+        file_path = self._files(source)[company]
+        for row_amount, status in self.repository.lookup_amounts(file_path, reference, first_row):
+            if abs(row_amount - amount) < self.tolerance_cents:
+                return status
+        return None
+
+    def _parse_payment(self, payment, company):
+        """Get (reference, amount cents, companies) for a payment, amount is None if invalid"""
+        reference = payment['reference'].strip()
+        payment_amount = parse_cents(payment.get('amount', '0'))
+        companies = [company] if company else ['SALAM', 'MVNO']
+        return reference, payment_amount, companies
+
+    def match_payment(self, payment, company, is_old_payment, indexed=False):
+        """
+        Match one Treasury payment against the loaded files
+        Returns tuple: (found_status, found_in, company)
+        """
+        reference, payment_amount, companies = self._parse_payment(payment, company)
+        if payment_amount is None:
+            return None, None, None
+
+        for comp in companies:
+            # For old payments, check CNP first
+            if is_old_payment:
+                cnp_status = self.lookup('CNP', comp, reference, payment_amount, indexed)
+                if cnp_status:
+                    return 'CNP', 'CNP', comp
+
+                bs_status = self.lookup('BS', comp, reference, payment_amount, indexed)
+                if bs_status and bs_status.lower() == 'completed':
+                    return 'Paid', 'BS', comp
+
+            # For current payments, check BS first
+            else:
+                bs_status = self.lookup('BS', comp, reference, payment_amount, indexed)
+                if bs_status and bs_status.lower() == 'completed':
+                    return 'Paid', 'BS', comp
+
+                cnp_status = self.lookup('CNP', comp, reference, payment_amount, indexed)
+                if cnp_status:
+                    return 'CNP', 'CNP', comp
+
+        return None, None, None
+
+    def match_bank_statement(self, payment, company):
+        """
+        Match a payment against the loaded BS files only, for payments already in CNP
+        Returns tuple: (found_status, found_in, company)
+        """
+        reference, payment_amount, companies = self._parse_payment(payment, company)
+        if payment_amount is None:
+            return None, None, None
+
+        for comp in companies:
+            bs_status = self.lookup('BS', comp, reference, payment_amount)
+            if bs_status and bs_status.lower() == 'completed':
+                return 'Paid', 'BS', comp
+
+        return None, None, None
@@ -0,0 +1,207 @@
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import argparse
+import json
+import sys
+import threading
+from exception_handler import ExceptionHandler
+from file_operations import FileOperations
+from reconcile_cli import create_tracker
+from validation_system import ValidationSystem
+
+PAYMENT_INPUT_FIELDS = ['company', 'beneficiary', 'reference', 'amount', 'date']
+
+class ReconciliationService:
+    def __init__(self, tracker, file_ops=None, exception_handler=None, refresh_interval=5.0):
+        """
+        Long-running reconciliation service sharing one repository between components
+        The repository keeps parsed files and indexes warm between requests and reloads
+        a file when it changes; a background thread refreshes them every refresh_interval
+        seconds so requests rarely pay for the reload. Writes are serialized.
+        """
+        self.tracker = tracker
+        self.repository = tracker.repository
+        self.file_ops = file_ops or FileOperations(self.repository)
+        self.exception_handler = exception_handler or ExceptionHandler(self.repository)
+        self.validator = ValidationSystem()
+        self.refresh_interval = refresh_interval
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def data_files(self):
+        """List the Treasury, BS and CNP files the service keeps warm"""
+        return ([self.tracker.treasury_file] + list(self.tracker.bs_files.values()) +
+                list(self.tracker.cnp_files.values()))
+
+    def warm(self):
+        """Load every data file and index, or reload the ones that changed"""
+        for file_path in self.data_files():
+            if not self.repository.exists(file_path):
+                continue
+            self.repository.get_records(file_path)
+            self.repository.snapshot(file_path)
+        if self.repository.file_indexes:
+            self.exception_handler.get_open_exceptions()
+
+    def start(self):
+        """Warm the indexes and start refreshing them in the background"""
+        self.warm()
+        if self.refresh_interval and self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def stop(self):
+        """Stop the background refresh"""
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def _refresh_loop(self):
+        """Refresh the indexes until stopped"""
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.warm()
+            except Exception as e:
+                print(f"Error refreshing indexes: {e}")
+
+    def status(self, reference):
+        """Resolve the status of a reference, with its open exceptions; reads only, so never waits for writes"""
+        status_data = self.tracker.update_status(reference, self.exception_handler)
+        status_data['found'] = status_data['status'] != 'Not Found'
+        return status_data
+
+    def submit_payment(self, payment):
+        """Validate a payment and save it to Treasury; returns (saved, result)"""
+        payment = {field: str(payment.get(field) or '') for field in PAYMENT_INPUT_FIELDS}
+        validation = self.validator.validate_input(payment)
+        if not validation['valid']:
+            return False, {'errors': validation['errors']}
+        with self._write_lock:
+            saved, message = self.file_ops.save_payment(payment)
+        return saved, {'message': message, 'warnings': validation['warnings']}
+
+    def reconcile(self, full=False):
+        """Run a status update; concurrent requests wait for the running one"""
+        with self._write_lock:
+            return self.tracker.update_all_statuses(full=full)
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of a ReconciliationService, set as the server's service attribute"""
+    server_version = 'ReconciliationService/1.0'
+
+    def do_GET(self):
+        """Route GET requests"""
+        self._handle(self._get)
+
+    def do_POST(self):
+        """Route POST requests"""
+        self._handle(self._post)
+
+    def _handle(self, route):
+        """Run a route, answering unexpected errors with a 500"""
+        try:
+            route()
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+
+    def _get(self):
+        """Answer status, exception and health queries"""
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        service = self.server.service
+        if url.path == '/health':
+            self._reply(200, {'status': 'ok'})
+        elif url.path.startswith('/status/') and len(url.path) > len('/status/'):
+            result = service.status(unquote(url.path[len('/status/'):]))
+            self._reply(200 if result['found'] else 404, result)
+        elif url.path == '/exceptions':
+            reference = query.get('reference', [None])[0]
+            self._reply(200, {'open_exceptions': service.exception_handler.get_open_exceptions(reference)})
+        else:
+            self._reply(404, {'error': f"Unknown path: {url.path}"})
+
+    def _post(self):
+        """Answer payment submissions and reconciliation triggers"""
+        service = self.server.service
+        try:
+            body = self._read_json()
+        except ValueError as e:
+            self._reply(400, {'error': f"Invalid JSON body: {e}"})
+            return
+
+        if self.path == '/payments':
+            saved, result = service.submit_payment(body)
+            if saved:
+                self._reply(201, result)
+            else:
+                self._reply(400 if 'errors' in result else 500, result)
+        elif self.path == '/reconcile':
+            results = service.reconcile(full=bool(body.get('full')))
+            self._reply(500 if results['errors'] else 200, results)
+        else:
+            self._reply(404, {'error': f"Unknown path: {self.path}"})
+
+    def _read_json(self):
+        """Read the request body as a JSON object, {} when empty"""
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise ValueError("expected an object")
+        return body
+
+    def _reply(self, code, result):
+        """Send a JSON response"""
+        data = json.dumps(result, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Log requests to stderr"""
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+def create_server(service, host='127.0.0.1', port=8765):
+    """Create the HTTP server of a service; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def main(argv=None):
+    """Run the service on localhost until interrupted"""
+    parser = argparse.ArgumentParser(prog='reconciliation_service', description='Reconciliation service')
+    parser.add_argument('--data-dir', help='Data directory to use instead of the one next to the program')
+    parser.add_argument('--database', help='SQLite database to use instead of the CSV files')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--refresh-interval', type=float, default=5.0,
+                        help='Seconds between index refreshes, 0 to refresh on access only')
+    args = parser.parse_args(argv)
+
+    # Component messages are logs of the service
+    with redirect_stdout(sys.stderr):
+        tracker = create_tracker(args)
+        file_ops = FileOperations(tracker.repository, data_dir=args.data_dir)
+        exception_handler = ExceptionHandler(tracker.repository, data_dir=args.data_dir)
+
+        service = ReconciliationService(tracker, file_ops, exception_handler, args.refresh_interval)
+        service.start()
+        server = create_server(service, port=args.port)
+        print(f"Serving on http://127.0.0.1:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.stop()
+            exception_handler.flush()
+
+if __name__ == '__main__':
+    main()
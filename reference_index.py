@@ -0,0 +1,132 @@
+import csv
+import io
+import os
+from sidecar_index import SidecarIndex, iter_records, make_row
+
+INDEX_SUFFIX = '.idx'
+ENTRIES_SUFFIX = '.entries'
+INDEX_VERSION = 3
+
+class ReferenceIndex(SidecarIndex):
+    SUFFIX = INDEX_SUFFIX
+    VERSION = INDEX_VERSION
+    _instances = {}
+
+    def __init__(self, file_path):
+        """
+        Reference -> byte offsets index persisted next to a data CSV
+        The (offset, reference) entries go to an append-only file; the small JSON sidecar
+        records how many bytes of it are valid, so a refresh only writes the new entries
+        """
+        self.entries_path = os.path.abspath(file_path) + INDEX_SUFFIX + ENTRIES_SUFFIX
+        super().__init__(file_path)
+
+    @classmethod
+    def invalidate(cls, file_path):
+        """Drop the index for a file that has been rewritten"""
+        super().invalidate(file_path)
+        try:
+            os.remove(os.path.abspath(file_path) + INDEX_SUFFIX + ENTRIES_SUFFIX)
+        except OSError:
+            pass
+
+    def _reset(self):
+        """Clear the in-memory index"""
+        super()._reset()
+        self.offsets = {}
+        # Entries not yet in the entries file, and its valid length; None rewrites it
+        self._pending = []
+        self._entries_size = None
+
+    def _sidecar_data(self):
+        """Get what the sidecar persists"""
+        return dict(super()._sidecar_data(), entries_size=self._entries_size)
+
+    def _restore(self, data):
+        """Restore the in-memory index from the sidecar and its entries file"""
+        with open(self.entries_path, 'rb') as f:
+            entries = f.read(data['entries_size'])
+        if len(entries) != data['entries_size']:
+            raise ValueError("Index entries file is shorter than recorded")
+        offsets = {}
+        for offset, reference in csv.reader(io.StringIO(entries.decode('utf-8'), newline='')):
+            offsets.setdefault(reference, []).append(int(offset))
+        super()._restore(data)
+        self.offsets = offsets
+        self._pending = []
+        self._entries_size = data['entries_size']
+
+    def _save(self):
+        """Append the new entries, or rewrite them after a rebuild, then save the sidecar"""
+        try:
+            if self._entries_size is None:
+                # The old sidecar must not describe the new entries file
+                if os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+                entries = [(offset, reference) for reference, offsets in self.offsets.items()
+                           for offset in offsets]
+                temp_path = self.entries_path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(self._encode_entries(sorted(entries)))
+                    size = f.tell()
+                os.replace(temp_path, self.entries_path)
+            else:
+                with open(self.entries_path, 'r+b') as f:
+                    # Entries past the recorded size were never committed by a sidecar
+                    f.truncate(self._entries_size)
+                    f.seek(self._entries_size)
+                    f.write(self._encode_entries(self._pending))
+                    size = f.tell()
+        except OSError as e:
+            # The in-memory index still works without a sidecar
+            print(f"Error saving index {self.entries_path}: {e}")
+            return False
+        self._entries_size = size
+        self._pending = []
+        return super()._save()
+
+    def _encode_entries(self, entries):
+        """Encode (offset, reference) entries as CSV lines"""
+        buffer = io.StringIO(newline='')
+        csv.writer(buffer).writerows(entries)
+        return buffer.getvalue().encode('utf-8')
+
+    def _extend(self, file, start):
+        """Add records from start to end of file to the index"""
+        try:
+            ref_pos = self.fieldnames.index('reference')
+        except ValueError:
+            file.seek(0, os.SEEK_END)
+            return file.tell()
+
+        for offset, values in iter_records(file, start):
+            if len(values) > ref_pos:
+                reference = values[ref_pos].strip()
+                self.offsets.setdefault(reference, []).append(offset)
+                if self._entries_size is not None:
+                    self._pending.append((offset, reference))
+        file.seek(0, os.SEEK_END)
+        return file.tell()
+
+    def lookup(self, reference):
+        """Return the rows whose stripped reference matches, read by seeking to their offsets"""
+        with self._lock:
+            if not self.refresh():
+                return []
+            offsets = list(self.offsets.get(str(reference).strip(), ()))
+            fieldnames = self.fieldnames
+        if not offsets:
+            return []
+
+        rows = []
+        with open(self.file_path, 'rb') as f:
+            for offset in offsets:
+                for _, values in iter_records(f, offset):
+                    rows.append(make_row(fieldnames, values))
+                    break
+        return rows
+
+    def __contains__(self, reference):
+        """Check whether any row has the given reference"""
+        with self._lock:
+            return self.refresh() and str(reference).strip() in self.offsets
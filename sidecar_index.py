@@ -0,0 +1,275 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import csv
+import hashlib
+import json
+import os
+import threading
+try:
+    import fcntl
+except ImportError:
+    # Windows locks a byte range instead
+    fcntl = None
+    import msvcrt
+
+FINGERPRINT_BYTES = 4096
+PREFIX_CHUNK_BYTES = 1 << 20
+
+def read_header(file):
+    """Read the CSV header from a binary file handle, return (fieldnames, data offset)"""
+    file.seek(0)
+    line = file.readline()
+    if not line:
+        return None, 0
+    fieldnames = next(csv.reader([line.decode('utf-8-sig', errors='replace')]), None)
+    return fieldnames, len(line)
+
+def iter_records(file, start):
+    """Yield (byte offset, values) for each CSV record from start, honouring quoted newlines"""
+    file.seek(start)
+    position = [start]
+
+    def lines():
+        for raw in iter(file.readline, b''):
+            position[0] += len(raw)
+            yield raw.decode('utf-8', errors='replace')
+
+    reader = csv.reader(lines())
+    while True:
+        offset = position[0]
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        if values:
+            yield offset, values
+
+def make_row(fieldnames, values):
+    """Build a row dict the same way csv.DictReader does"""
+    row = dict(zip(fieldnames, values))
+    if len(values) > len(fieldnames):
+        row[None] = values[len(fieldnames):]
+    elif len(values) < len(fieldnames):
+        for key in fieldnames[len(values):]:
+            row[key] = None
+    return row
+
+def file_fingerprint(file, size):
+    """Hash the head and the tail of the first size bytes of a file"""
+    digest = hashlib.sha1()
+    file.seek(0)
+    digest.update(file.read(min(size, FINGERPRINT_BYTES)))
+    file.seek(max(0, size - FINGERPRINT_BYTES))
+    digest.update(file.read(min(size, FINGERPRINT_BYTES)))
+    return digest.hexdigest()
+
+def prefix_digest(file, size, digest=None, start=0):
+    """Hash bytes start up to size of a file into digest, a new one unless given"""
+    digest = digest or hashlib.sha1()
+    file.seek(start)
+    remaining = size - start
+    while remaining > 0:
+        chunk = file.read(min(remaining, PREFIX_CHUNK_BYTES))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest
+
+def prefix_fingerprint(file, size):
+    """Hash all of the first size bytes of a file, so an edit anywhere in them changes it"""
+    return prefix_digest(file, size).hexdigest()
+
+@contextmanager
+def file_lock(lock_path):
+    """Hold an exclusive lock on lock_path, shared with other processes, creating the file if needed"""
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def empty_state():
+    """Indexed state of a file of which nothing is indexed yet"""
+    return {'size': 0, 'mtime_ns': 0, 'end': 0, 'fingerprint': '', 'ends_with_newline': True}
+
+def file_stat(file_path):
+    """Get os.stat of a file, None if it does not exist"""
+    try:
+        return os.stat(file_path)
+    except OSError:
+        return None
+
+def is_unchanged(state, stat):
+    """Check whether a file has the size and mtime it had when state was recorded"""
+    return stat.st_size == state['size'] and stat.st_mtime_ns == state['mtime_ns']
+
+def append_digest(file, state, stat):
+    """
+    Get the running hash of the indexed part of a file if the file only grew past it, else None
+    Anything else, a same-size edit included, means the index has to be rebuilt
+    """
+    if not (state['end'] > 0 and state['ends_with_newline'] and stat.st_size > state['end']):
+        return None
+    digest = prefix_digest(file, state['end'])
+    return digest if digest.hexdigest() == state['fingerprint'] else None
+
+def record_state(file, state, stat, end, digest=None):
+    """
+    Remember size, mtime and fingerprint of a file indexed up to end
+    A digest from append_digest is continued from the old end instead of hashing the file again
+    """
+    if digest is None:
+        digest = prefix_digest(file, end)
+    else:
+        digest = prefix_digest(file, end, digest, state['end'])
+    state['size'] = stat.st_size
+    state['mtime_ns'] = stat.st_mtime_ns
+    state['end'] = end
+    state['fingerprint'] = digest.hexdigest()
+    if end:
+        file.seek(end - 1)
+        state['ends_with_newline'] = file.read(1) in (b'\n', b'\r')
+
+class SidecarIndex(ABC):
+    """
+    Index of an append-only data file persisted next to it
+    Subclasses set SUFFIX, VERSION and their own _instances, index rows in _extend and
+    list what they persist in _sidecar_data/_restore
+    """
+    SUFFIX = ''
+    VERSION = 1
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, file_path):
+        """Load the saved index of a data file, if there is one"""
+        self.file_path = os.path.abspath(file_path)
+        self.index_path = self.sidecar_path(self.file_path)
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._reset()
+        self._load()
+
+    @classmethod
+    def sidecar_path(cls, file_path):
+        """Get the path of the saved index of a data file"""
+        return file_path + cls.SUFFIX
+
+    @classmethod
+    def for_file(cls, file_path):
+        """Get the shared index for a file, creating it on first use"""
+        key = os.path.abspath(file_path)
+        with cls._instances_lock:
+            index = cls._instances.get(key)
+            if index is None:
+                index = cls._instances[key] = cls(key)
+            return index
+
+    @classmethod
+    def invalidate(cls, file_path):
+        """Drop the index of a file that has been rewritten"""
+        key = os.path.abspath(file_path)
+        with cls._instances_lock:
+            index = cls._instances.pop(key, None)
+        if index is not None:
+            index.close()
+        try:
+            os.remove(cls.sidecar_path(key))
+        except OSError:
+            pass
+
+    def close(self):
+        """Release resources held by the index"""
+
+    def _reset(self):
+        """Clear the in-memory index"""
+        self.fieldnames = None
+        self.state = empty_state()
+
+    def _sidecar_data(self):
+        """Get what the sidecar persists"""
+        return {'fieldnames': self.fieldnames, 'state': self.state}
+
+    def _restore(self, data):
+        """Restore the in-memory index from sidecar data"""
+        self.fieldnames = data['fieldnames']
+        self.state = data['state']
+
+    def _load(self):
+        """Load the sidecar if there is one"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                return
+            self._restore(data)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Error loading index {self.index_path}: {e}")
+            self.close()
+            self._reset()
+
+    def _save(self):
+        """Persist the sidecar atomically, returning whether it was saved"""
+        data = dict(self._sidecar_data(), version=self.VERSION)
+        temp_path = self.index_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            # The in-memory index still works without a sidecar
+            print(f"Error saving index {self.index_path}: {e}")
+            return False
+        self._dirty = False
+        return True
+
+    def refresh(self, save=True):
+        """
+        Validate the index against the file, extending it for appends or rebuilding it otherwise
+        save=False leaves the sidecar to be written by the next refresh that saves
+        """
+        with self._lock:
+            stat = file_stat(self.file_path)
+            if stat is None:
+                self.close()
+                self._reset()
+                return False
+
+            if not is_unchanged(self.state, stat):
+                with open(self.file_path, 'rb') as f:
+                    digest = append_digest(f, self.state, stat) if self.fieldnames is not None else None
+                    if digest is not None:
+                        end = self._extend(f, self.state['end'])
+                    else:
+                        end = self._rebuild(f)
+                    record_state(f, self.state, stat, end, digest)
+                self._dirty = True
+
+            if save and self._dirty:
+                self._save()
+            return True
+
+    def _rebuild(self, file):
+        """Index a file from scratch, returning the end of the indexed part"""
+        self.close()
+        self._reset()
+        self.fieldnames, data_offset = read_header(file)
+        if not self.fieldnames:
+            return data_offset
+        return self._extend(file, data_offset)
+
+    @abstractmethod
+    def _extend(self, file, start):
+        """Index the records from start, returning the end of the indexed part"""
@@ -0,0 +1,356 @@
+from array import array
+from contextlib import contextmanager
+import csv
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from amount_index import INVALID_CENTS, parse_cents
+from data_repository import DataRepository
+from storage_backend import StorageBackend
+
+# Fields indexed in every dataset that has them, besides the reference
+INDEXED_FIELDS = ['company', 'status', 'date']
+
+def quote(name):
+    """Quote an SQL identifier"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def strip_text(value):
+    """Strip a value the way references are stripped in Python"""
+    return (value or '').strip()
+
+class SQLiteBackend(StorageBackend):
+    batch_matching = True
+
+    def __init__(self, database):
+        """
+        Storage backend keeping every dataset in one SQLite database in WAL mode
+        Each dataset is a table with one TEXT column per field, plus the row number,
+        the stripped reference and the amount in cents; readers never block the writer.
+        """
+        self.database = os.path.abspath(database)
+        os.makedirs(os.path.dirname(self.database), exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS datasets ("
+                "name TEXT PRIMARY KEY, table_name TEXT NOT NULL, fieldnames TEXT NOT NULL, "
+                "generation TEXT NOT NULL, rows INTEGER NOT NULL)"
+            )
+
+    def _connect(self):
+        """Get this thread's connection, opening it on first use"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.create_function('parse_cents', 1, parse_cents, deterministic=True)
+            db.create_function('strip_text', 1, strip_text, deterministic=True)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self, write=True):
+        """Run statements in one transaction; write transactions take the write lock up front"""
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def close(self):
+        """Close this thread's connection"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _dataset(self, db, dataset):
+        """Get {'table', 'fieldnames', 'generation', 'rows'} of a dataset, None if it does not exist"""
+        row = db.execute(
+            "SELECT table_name, fieldnames, generation, rows FROM datasets WHERE name = ?",
+            (os.path.abspath(dataset),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'table': row[0], 'fieldnames': json.loads(row[1]), 'generation': row[2], 'rows': row[3]}
+
+    def _create(self, db, dataset, fieldnames):
+        """Create the table of a dataset, replacing any earlier one"""
+        old = self._dataset(db, dataset)
+        if old is not None:
+            db.execute(f"DROP TABLE IF EXISTS {quote(old['table'])}")
+
+        fieldnames = list(dict.fromkeys(fieldnames))
+        table = 'dataset_' + uuid.uuid4().hex
+        columns = ', '.join(f"{quote(field)} TEXT" for field in fieldnames)
+        db.execute(f"CREATE TABLE {quote(table)} (_row INTEGER PRIMARY KEY, _ref TEXT NOT NULL, _cents INTEGER"
+                   f"{', ' + columns if columns else ''})")
+        db.execute(f"CREATE INDEX {quote(table + '_reference')} ON {quote(table)} (_ref)")
+        for field in INDEXED_FIELDS:
+            if field in fieldnames:
+                db.execute(f"CREATE INDEX {quote(table + '_' + field)} ON {quote(table)} ({quote(field)})")
+
+        info = {'table': table, 'fieldnames': fieldnames, 'generation': uuid.uuid4().hex, 'rows': 0}
+        db.execute(
+            "INSERT OR REPLACE INTO datasets (name, table_name, fieldnames, generation, rows) VALUES (?, ?, ?, ?, 0)",
+            (os.path.abspath(dataset), table, json.dumps(fieldnames), info['generation'])
+        )
+        return info
+
+    def _insert(self, db, dataset, info, records):
+        """Append records to a dataset's table, as strings like a CSV round trip"""
+        fieldnames = info['fieldnames']
+        columns = ', '.join(['_row', '_ref', '_cents'] + [quote(field) for field in fieldnames])
+        placeholders = ', '.join('?' * (len(fieldnames) + 3))
+
+        rows = []
+        for number, record in enumerate(records, start=info['rows']):
+            values = ['' if record.get(field) is None else str(record.get(field)) for field in fieldnames]
+            row = dict(zip(fieldnames, values))
+            rows.append([number, strip_text(row.get('reference')), parse_cents(row.get('amount'))] + values)
+
+        db.executemany(f"INSERT INTO {quote(info['table'])} ({columns}) VALUES ({placeholders})", rows)
+        info['rows'] += len(rows)
+        db.execute("UPDATE datasets SET rows = ? WHERE name = ?", (info['rows'], os.path.abspath(dataset)))
+
+    def _select(self, db, info, where='', parameters=()):
+        """Select records of a dataset in row order"""
+        fieldnames = info['fieldnames']
+        columns = ', '.join(quote(field) for field in fieldnames) or "''"
+        cursor = db.execute(f"SELECT {columns} FROM {quote(info['table'])} {where} ORDER BY _row", parameters)
+        return [dict(zip(fieldnames, row)) for row in cursor]
+
+    def exists(self, dataset):
+        """Check whether a dataset has been created"""
+        with self._transaction(write=False) as db:
+            return self._dataset(db, dataset) is not None
+
+    def get_fieldnames(self, dataset):
+        """Get the columns of a dataset"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            return info['fieldnames'] if info else []
+
+    def get_records(self, dataset):
+        """Get all records of a dataset"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            return self._select(db, info) if info else []
+
+    def find(self, dataset, reference):
+        """Get records with the given stripped reference through the reference index"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            if info is None:
+                return []
+            return self._select(db, info, "WHERE _ref = ?", (strip_text(str(reference)),))
+
+    def scan(self, dataset, **filters):
+        """Yield records matching the filters; equality on the dataset's fields is done in SQL"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            if info is None:
+                return
+            sql_filters = {field: value for field, value in filters.items()
+                           if field in info['fieldnames'] and isinstance(value, str)}
+            where = ' AND '.join(f"{quote(field)} = ?" for field in sql_filters)
+            records = self._select(db, info, f"WHERE {where}" if where else '', tuple(sql_filters.values()))
+
+        other_filters = {field: value for field, value in filters.items() if field not in sql_filters}
+        for record in records:
+            for field, expected in other_filters.items():
+                value = record.get(field)
+                if not (expected(value) if callable(expected) else value == expected):
+                    break
+            else:
+                yield record
+
+    def append_records(self, dataset, fieldnames, records):
+        """Append records in one transaction, creating the dataset with fieldnames if needed"""
+        with self._transaction() as db:
+            info = self._dataset(db, dataset) or self._create(db, dataset, fieldnames)
+            self._insert(db, dataset, info, records)
+
+    def write_records(self, dataset, fieldnames, records):
+        """Replace all records of a dataset in one transaction"""
+        with self._transaction() as db:
+            info = self._create(db, dataset, fieldnames)
+            self._insert(db, dataset, info, records)
+
+    def update_status(self, dataset, updates, where_status=None, fill_fields=()):
+        """
+        Update many records with one set-based UPDATE ... FROM a temporary table of updates
+        Same contract as StorageBackend.update_status
+        """
+        with self._transaction() as db:
+            info = self._dataset(db, dataset)
+            if info is None or not updates:
+                return []
+            fieldnames = info['fieldnames']
+            fields = sorted({field for values in updates.values() for field in values})
+            unknown = [field for field in fields if field not in fieldnames]
+            if unknown:
+                raise ValueError(f"Fields not in {dataset}: {', '.join(unknown)}")
+
+            db.execute("DROP TABLE IF EXISTS temp.status_updates")
+            db.execute("CREATE TEMP TABLE status_updates (_key TEXT PRIMARY KEY"
+                       + ''.join(f", {quote(field)} TEXT" for field in fields) + ")")
+            db.executemany(
+                f"INSERT INTO temp.status_updates VALUES ({', '.join('?' * (len(fields) + 1))})",
+                [[reference] + [None if values.get(field) is None else str(values[field]) for field in fields]
+                 for reference, values in updates.items()]
+            )
+
+            table = quote(info['table'])
+            condition = f"{table}._ref = status_updates._key"
+            parameters = ()
+            if where_status is not None:
+                condition += f" AND {table}.status = ?"
+                parameters = (where_status,)
+
+            columns = ', '.join(f"{table}.{quote(field)}" for field in fieldnames) or "''"
+            before = db.execute(
+                f"SELECT {table}._row, {columns} FROM {table} JOIN temp.status_updates ON {condition} "
+                f"ORDER BY {table}._row", parameters
+            ).fetchall()
+
+            assignments = []
+            for field in fields:
+                new_value = f"coalesce(status_updates.{quote(field)}, {table}.{quote(field)})"
+                if field in fill_fields:
+                    new_value = (f"CASE WHEN coalesce({table}.{quote(field)}, '') = '' "
+                                 f"THEN {new_value} ELSE {table}.{quote(field)} END")
+                assignments.append(f"{quote(field)} = {new_value}")
+            # Keep the derived columns in step when the fields they come from change
+            if 'reference' in fields:
+                assignments.append(f"_ref = strip_text(coalesce(status_updates.reference, {table}.reference))")
+            if 'amount' in fields:
+                assignments.append(f"_cents = parse_cents(coalesce(status_updates.amount, {table}.amount))")
+
+            db.execute(f"UPDATE {table} SET {', '.join(assignments)} FROM temp.status_updates WHERE {condition}",
+                       parameters)
+            db.execute("DROP TABLE temp.status_updates")
+
+        return [(row[0] + 1, dict(zip(fieldnames, row[1:]))) for row in before]
+
+    def read_position(self, dataset):
+        """Get (row count, row count, generation) of a dataset"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            if info is None:
+                return 0, 0, ''
+            return info['rows'], info['rows'], info['generation']
+
+    def position_valid(self, dataset, position, fingerprint):
+        """Check that a dataset was only appended to since position was read"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            return info is not None and info['generation'] == fingerprint and position <= info['rows']
+
+    def row_at(self, dataset, position):
+        """Positions are row numbers"""
+        return position
+
+    def lookup_amounts(self, dataset, reference, first_row=0):
+        """Get (amount cents, status) of the rows with reference from first_row on, in dataset order"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            if info is None:
+                return []
+            status = quote('status') if 'status' in info['fieldnames'] else "''"
+            cursor = db.execute(
+                f"SELECT _cents, {status} FROM {quote(info['table'])} "
+                f"WHERE _ref = ? AND _row >= ? AND _cents IS NOT NULL ORDER BY _row",
+                (strip_text(str(reference)), first_row)
+            )
+            return [(cents, strip_text(status)) for cents, status in cursor]
+
+    def references_from(self, dataset, first_row=0):
+        """Get the set of stripped references of the rows from first_row on through the row number key"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            if info is None:
+                return set()
+            cursor = db.execute(f"SELECT DISTINCT _ref FROM {quote(info['table'])} WHERE _row >= ?", (first_row,))
+            return {reference for reference, in cursor}
+
+    def match_amounts(self, dataset, lookups, tolerance_cents=1):
+        """
+        Answer all lookups with one join of a temporary lookup table against the dataset
+        The tolerance is applied in SQL and min(_row) picks the first matching row of each lookup;
+        same contract as StorageBackend.match_amounts
+        """
+        lookups = list(lookups)
+        statuses = [None] * len(lookups)
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            if info is None or not lookups:
+                return statuses
+            table = quote(info['table'])
+            status = f"{table}.{quote('status')}" if 'status' in info['fieldnames'] else "''"
+
+            db.execute("DROP TABLE IF EXISTS temp.amount_lookups")
+            db.execute("CREATE TEMP TABLE amount_lookups (_number INTEGER PRIMARY KEY, _ref TEXT, "
+                       "_cents INTEGER, _first_row INTEGER)")
+            db.executemany("INSERT INTO temp.amount_lookups VALUES (?, ?, ?, ?)",
+                           [(number, strip_text(str(reference)), amount, first_row)
+                            for number, (reference, amount, first_row) in enumerate(lookups)])
+            # A bare column next to min() comes from the row holding the minimum
+            cursor = db.execute(
+                f"SELECT amount_lookups._number, {status}, min({table}._row) "
+                f"FROM temp.amount_lookups JOIN {table} ON {table}._ref = amount_lookups._ref "
+                f"AND {table}._row >= amount_lookups._first_row "
+                f"WHERE abs({table}._cents - amount_lookups._cents) < ? "
+                f"GROUP BY amount_lookups._number", (tolerance_cents,)
+            )
+            for number, row_status, _ in cursor:
+                statuses[number] = strip_text(row_status)
+            db.execute("DROP TABLE temp.amount_lookups")
+        return statuses
+
+    def amount_cents(self, dataset):
+        """Get the amounts of a dataset's records as an array('q') of cents from the stored column"""
+        with self._transaction(write=False) as db:
+            info = self._dataset(db, dataset)
+            if info is None:
+                return array('q')
+            cursor = db.execute(f"SELECT _cents FROM {quote(info['table'])} ORDER BY _row")
+            return array('q', (INVALID_CENTS if cents is None else cents for cents, in cursor))
+
+    def migrate_from_csv(self, file_paths, source=None):
+        """
+        Copy CSV files into the database, each as the dataset named by its path
+        Returns {file_path: rows copied}; missing files are skipped
+        """
+        source = source or DataRepository()
+        counts = {}
+        for file_path in file_paths:
+            if not source.exists(file_path):
+                continue
+            records = source.get_records(file_path)
+            self.write_records(file_path, source.get_fieldnames(file_path), records)
+            counts[file_path] = len(records)
+        return counts
+
+    def export_csv(self, dataset, output_file=None):
+        """
+        Write a dataset to CSV for Excel, to its own path unless output_file is given
+        The file is UTF-8 with a byte order mark so Excel detects the encoding; returns rows written
+        """
+        output_file = output_file or dataset
+        records = self.get_records(dataset)
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        temp_file = output_file + '.tmp'
+        with open(temp_file, 'w', newline='', encoding='utf-8-sig') as file:
+            writer = csv.DictWriter(file, fieldnames=self.get_fieldnames(dataset))
+            writer.writeheader()
+            writer.writerows(records)
+        os.replace(temp_file, output_file)
+        return len(records)
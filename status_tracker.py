@@ -1,28 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 import csv
+import json
 import os
+from amount_index import parse_cents
+from column_snapshot import reference_hash
+from data_repository import DataRepository
+from reconciliation_engine import ReconciliationEngine
+
+# Payments whose lookups are prefetched together between progress reports
+PREFETCH_CHUNK = 2000
 
 class StatusTracker:
-    def __init__(self):
-        """Initialize status tracker"""
+    def __init__(self, repository=None, data_dir=None):
+        """Initialize status tracker on data_dir, by default the data directory next to the program"""
+        self.repository = repository or DataRepository()
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
-        print(f"Base directory: {self.base_dir}")
+        self.data_dir = data_dir or os.path.join(self.base_dir, 'data')
+        print(f"Data directory: {self.data_dir}")
         
         # Update file paths
-        self.treasury_file = os.path.join(self.base_dir, 'data', 'treasury', 'TREASURY_CURRENT.csv')
+        self.treasury_file = os.path.join(self.data_dir, 'treasury', 'TREASURY_CURRENT.csv')
         
         # Bank Statement files
         self.bs_files = {
-            'SALAM': os.path.join(self.base_dir, 'data', 'bank_statements', 'SALAM', 'BS_SALAM_CURRENT.csv'),
-            'MVNO': os.path.join(self.base_dir, 'data', 'bank_statements', 'MVNO', 'BS_MVNO_CURRENT.csv')
+            'SALAM': os.path.join(self.data_dir, 'bank_statements', 'SALAM', 'BS_SALAM_CURRENT.csv'),
+            'MVNO': os.path.join(self.data_dir, 'bank_statements', 'MVNO', 'BS_MVNO_CURRENT.csv')
         }
         
         # CNP (Check Not Presented) files
         self.cnp_files = {
-            'SALAM': os.path.join(self.base_dir, 'data', 'cnp', 'SALAM', 'CNP_SALAM_CURRENT.csv'),
-            'MVNO': os.path.join(self.base_dir, 'data', 'cnp', 'MVNO', 'CNP_MVNO_CURRENT.csv')
+            'SALAM': os.path.join(self.data_dir, 'cnp', 'SALAM', 'CNP_SALAM_CURRENT.csv'),
+            'MVNO': os.path.join(self.data_dir, 'cnp', 'MVNO', 'CNP_MVNO_CURRENT.csv')
         }
         
+        # Offsets of BS/CNP data already reconciled and payments still waiting for a match
+        self.checkpoint_file = os.path.join(self.data_dir, 'treasury', 'RECONCILIATION_CHECKPOINT.json')
+        
         self.delay_threshold = 30  # days to consider payment as previous month
         
         # Ensure directories exist
@@ -41,15 +55,15 @@ class StatusTracker:
             print(f"Error parsing date {payment_date_str}: {e}")
             return False
             
-    def check_payment_status(self, payment, company=None):
+    def check_payment_status(self, payment, company=None, source_rows=None):
         """
         Check payment status in BS and CNP files based on payment date
+        source_rows: rows already looked up by _source_rows, to match against instead of the files
         Returns tuple: (found_status, found_in, company)
         """
         reference = payment['reference'].strip()
-        try:
-            payment_amount = float(payment.get('amount', '0').strip())
-        except ValueError:
+        payment_amount = parse_cents(payment.get('amount', '0'))
+        if payment_amount is None:
             return None, None, None
             
         payment_date = payment.get('date', '').strip()
@@ -57,7 +71,7 @@ class StatusTracker:
         companies = [company] if company else ['SALAM', 'MVNO']
         
         print(f"\nChecking payment: {reference}")
-        print(f"Amount: {payment_amount}")
+        print(f"Amount: {payment_amount / 100:.2f}")
         print(f"Date: {payment_date}")
         print(f"Is old payment: {is_old_payment}")
         
@@ -65,15 +79,15 @@ class StatusTracker:
             # For old payments, check CNP first
             if is_old_payment:
                 # Check CNP
-                cnp_status = self.check_file_for_payment(
-                    self.cnp_files[comp], reference, payment_amount
+                cnp_status = self._matching_status(
+                    'CNP', comp, reference, payment_amount, source_rows
                 )
                 if cnp_status:
                     return 'CNP', 'CNP', comp
                     
                 # Fallback to BS
-                bs_status = self.check_file_for_payment(
-                    self.bs_files[comp], reference, payment_amount
+                bs_status = self._matching_status(
+                    'BS', comp, reference, payment_amount, source_rows
                 )
                 if bs_status and bs_status.lower() == 'completed':
                     return 'Paid', 'BS', comp
@@ -81,15 +95,15 @@ class StatusTracker:
             # For current payments, check BS first
             else:
                 # Check BS
-                bs_status = self.check_file_for_payment(
-                    self.bs_files[comp], reference, payment_amount
+                bs_status = self._matching_status(
+                    'BS', comp, reference, payment_amount, source_rows
                 )
                 if bs_status and bs_status.lower() == 'completed':
                     return 'Paid', 'BS', comp
                     
                 # Fallback to CNP
-                cnp_status = self.check_file_for_payment(
-                    self.cnp_files[comp], reference, payment_amount
+                cnp_status = self._matching_status(
+                    'CNP', comp, reference, payment_amount, source_rows
                 )
                 if cnp_status:
                     return 'CNP', 'CNP', comp
@@ -98,32 +112,158 @@ class StatusTracker:
         
     def check_file_for_payment(self, file_path, reference, amount):
         """Check if payment exists in given file and return its status"""
-        if not os.path.exists(file_path):
+        if not self.repository.exists(file_path):
             return None
             
         try:
-            with open(file_path, 'r', newline='') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if (row['reference'].strip() == reference and 
-                        abs(float(row['amount'].strip()) - amount) < 0.01):
-                        return row.get('status', '').strip()
+            # Amounts are compared in integer cents
+            for row_amount, status in self.repository.lookup_amounts(file_path, reference):
+                if row_amount == amount:
+                    return status
         except Exception as e:
             print(f"Error checking file {file_path}: {e}")
             
         return None
         
-    def update_all_statuses(self):
-        """Update status for all payments in Treasury"""
+    def _matching_status(self, source, company, reference, amount, source_rows=None):
+        """Status of the first row of a BS or CNP file matching the amount, from source_rows when given"""
+        if source_rows is None:
+            files = self.bs_files if source == 'BS' else self.cnp_files
+            return self.check_file_for_payment(files[company], reference, amount)
+        for row_amount, status in source_rows[(source, company)]:
+            if row_amount == amount:
+                return status
+        return None
+
+    def _source_rows(self, reference):
+        """Look a reference up once in every BS and CNP file, keyed by (source, company)"""
+        source_rows = {}
+        for source, files in (('BS', self.bs_files), ('CNP', self.cnp_files)):
+            for comp, file_path in files.items():
+                try:
+                    rows = self.repository.lookup_amounts(file_path, reference) if self.repository.exists(file_path) else []
+                except Exception as e:
+                    print(f"Error checking file {file_path}: {e}")
+                    rows = []
+                source_rows[(source, comp)] = rows
+        return source_rows
+
+    def update_status(self, reference, exception_handler=None):
+        """
+        Resolve the status of one payment with point lookups in the Treasury, BS and CNP indexes
+        Nothing is written: a Treasury payment that now matches is returned with the status
+        update_all_statuses would give it, and that run records the change.
+        Open exceptions come from exception_handler's index when one is given.
+        Returns dict: reference, status, timestamp, company, sources, details, exceptions
+        """
+        reference = reference.strip()
+        status_data = {
+            'reference': reference,
+            'status': 'Not Found',
+            'timestamp': '',
+            'company': '',
+            'sources': [],
+            'exceptions': []
+        }
+
+        payments = self.repository.find(self.treasury_file, reference) if self.repository.exists(self.treasury_file) else []
+        source_rows = self._source_rows(reference)
+        if payments:
+            # The latest Treasury entry for the reference is the one shown
+            payment = payments[-1]
+            current_status = (payment.get('status') or '').strip()
+            company = (payment.get('company') or '').strip()
+            status_data.update({
+                'status': current_status,
+                'timestamp': payment.get('timestamp') or '',
+                'company': company,
+                'sources': ['Treasury']
+            })
+
+            if current_status != 'Paid':
+                new_status, found_in, found_company = self.check_payment_status(payment, company or None, source_rows)
+                # A CNP payment only moves on once it shows up as completed in the bank statement
+                if new_status and new_status != current_status:
+                    status_data.update({
+                        'status': new_status,
+                        'company': company or found_company,
+                        'details': (f"Treasury shows {current_status or 'no status'}: found in "
+                                    f"{found_in}-{found_company}, recorded by the next status update")
+                    })
+
+        for (source, comp), rows in source_rows.items():
+            if rows:
+                status_data['sources'].append(f"{source}-{comp}")
+
+        if exception_handler is not None:
+            status_data['exceptions'] = exception_handler.get_open_exceptions(reference)
+        return status_data
+
+    def iter_statuses(self, items):
+        """
+        Yield the status of many references without changing Treasury
+        items: references or (reference, amount) pairs; a bare reference is checked with the
+        amount of its latest Treasury payment. Treasury is read once and every BS/CNP file
+        is loaded once up front, then items are resolved and yielded as they are consumed.
+        Yields dicts: reference, amount, status, treasury_status, found_in, company
+        """
+        treasury = {}
+        if self.repository.exists(self.treasury_file):
+            for payment in self.repository.get_records(self.treasury_file):
+                treasury[(payment.get('reference') or '').strip()] = payment
+        engine = ReconciliationEngine(self.bs_files, self.cnp_files, repository=self.repository).load()
+
+        for item in items:
+            reference, amount = (item, None) if isinstance(item, str) else item
+            reference = str(reference).strip()
+            payment = treasury.get(reference)
+            treasury_status = (payment.get('status') or '').strip() if payment else None
+            status_data = {
+                'reference': reference,
+                'amount': amount if amount is not None else (payment or {}).get('amount'),
+                'status': treasury_status or 'Not Found',
+                'treasury_status': treasury_status,
+                'found_in': None,
+                'company': (payment.get('company') or '').strip() if payment else ''
+            }
+            if payment is None and amount is None:
+                yield status_data
+                continue
+
+            company = status_data['company']
+            is_old_payment = payment is not None and self.is_previous_month_payment((payment.get('date') or '').strip())
+            new_status, found_in, found_company = engine.match_payment(
+                {'reference': reference, 'amount': str(status_data['amount'])}, company or None, is_old_payment)
+            if new_status and not (treasury_status == 'Paid' or (treasury_status == 'CNP' and new_status == 'CNP')):
+                status_data.update({'status': new_status, 'found_in': found_in, 'company': company or found_company})
+            yield status_data
+
+    def update_all_statuses(self, full=False, progress_callback=None, cancel_event=None, workers=None,
+                            hash_shards=None):
+        """
+        Update status for all payments in Treasury
+        Only BS/CNP rows appended since the last checkpoint are matched against payments
+        that were already checked; new payments are looked up in the whole files.
+        Pass full=True to ignore the checkpoint and re-match everything.
+        progress_callback(done, total) is called after each payment; setting cancel_event
+        stops the run before the next payment without writing anything.
+        With workers > 1 the payments are split by company and reference hash into shards
+        matched in a process pool (CSV backend only); the change sets are merged into one
+        Treasury write. hash_shards defaults to workers. Matching stays serial unless workers
+        is given, since the pool only pays off with spare cores.
+        """
         results = {
             'updated': 0,
             'errors': 0,
-            'details': []
+            'details': [],
+            'changes': [],
+            'mode': 'full',
+            'cancelled': False
         }
         
         print("\n=== Starting Status Update ===")
         
-        if not os.path.exists(self.treasury_file):
+        if not self.repository.exists(self.treasury_file):
             print("Treasury file not found")
             results['details'].append("Treasury file not found")
             return results
@@ -131,9 +271,7 @@ class StatusTracker:
         try:
             # Read all payments from Treasury
             payments_to_update = []
-            with open(self.treasury_file, 'r', newline='') as file:
-                reader = csv.DictReader(file)
-                payments = list(reader)
+            payments = self.repository.get_records(self.treasury_file)
                 
             if not payments:
                 print("No payments found in Treasury")
@@ -142,70 +280,53 @@ class StatusTracker:
             
             print(f"\nFound {len(payments)} payments in Treasury")
             
-            # Check each payment's status
-            for payment in payments:
-                try:
-                    reference = payment['reference'].strip()
-                    current_status = payment.get('status', '').strip()
-                    company = payment.get('company', '').strip()
-                    
-                    print(f"\nChecking Treasury payment: {reference}")
-                    print(f"Current Status: {current_status}")
-                    
-                    # Skip if already paid
-                    if current_status == 'Paid':
-                        print(f"Skipping {reference} - already Paid")
-                        continue
-                    
-                    # Check status in BS/CNP based on date
-                    new_status, found_in, found_company = self.check_payment_status(payment, company)
-                    
-                    if new_status:
-                        print(f"Found in {found_in} for {found_company}")
-                        update_data = {
-                            'reference': reference,
-                            'old_status': current_status,
-                            'new_status': new_status,
-                            'company': found_company if not company else company,
-                            'details': [f"Found in {found_in}-{found_company}"]
-                        }
-                        payments_to_update.append(update_data)
-                    else:
-                        print(f"No matching payment found")
-                                
-                except Exception as e:
-                    print(f"Error processing payment {reference}: {str(e)}")
+            checkpoint = None if full else self._load_checkpoint()
+            start_offsets = self._valid_start_offsets(checkpoint)
+            if start_offsets is None:
+                checkpoint = {'files': {}, 'pending': {}}
+            else:
+                results['mode'] = 'incremental'
+            print(f"Reconciliation mode: {results['mode']}")
+            
+            # Read each BS/CNP file once, or only the rows appended since the checkpoint
+            engine = ReconciliationEngine(self.bs_files, self.cnp_files, repository=self.repository)
+            engine.load(start_offsets)
+            
+            if workers and workers > 1 and self.repository.process_workers:
+                outcomes = self._match_in_processes(engine, payments, start_offsets, checkpoint, workers,
+                                                    hash_shards, progress_callback, cancel_event)
+            else:
+                outcomes = self._match_serially(engine, payments, start_offsets, checkpoint,
+                                                progress_callback, cancel_event)
+            if outcomes is None:
+                print("Status update cancelled")
+                results['cancelled'] = True
+                results['details'].append("Status update cancelled - no changes written")
+                return results
+            
+            pending = {}
+            for payment, outcome in zip(payments, outcomes):
+                if isinstance(outcome, Exception):
+                    reference = (payment.get('reference') or '').strip()
+                    print(f"Error processing payment {reference}: {str(outcome)}")
                     results['errors'] += 1
-                    results['details'].append(f"Error checking {reference}: {str(e)}")
+                    results['details'].append(f"Error checking {reference}: {str(outcome)}")
+                    continue
+                
+                update_data, payment_key, pending_status = outcome
+                if update_data:
+                    payments_to_update.append(update_data)
+                if pending_status is not None:
+                    pending[payment_key] = pending_status
+            
+            if progress_callback:
+                progress_callback(len(payments), len(payments))
             
             # Update Treasury file if needed
             if payments_to_update:
                 print(f"\nUpdating {len(payments_to_update)} payments in Treasury...")
                 
-                # Read current Treasury content
-                with open(self.treasury_file, 'r', newline='') as file:
-                    reader = csv.DictReader(file)
-                    all_rows = list(reader)
-                    fieldnames = reader.fieldnames
-                
-                # Update statuses and companies
-                for row in all_rows:
-                    for update in payments_to_update:
-                        if row['reference'].strip() == update['reference']:
-                            print(f"Updating {row['reference']}:")
-                            print(f"  Status: {row['status']} -> {update['new_status']}")
-                            print(f"  Company: {row.get('company', '')} -> {update['company']}")
-                            
-                            row['status'] = update['new_status']
-                            if not row.get('company'):
-                                row['company'] = update['company']
-                            row['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Write back to Treasury
-                with open(self.treasury_file, 'w', newline='') as file:
-                    writer = csv.DictWriter(file, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(all_rows)
+                results['changes'] = self.apply_status_updates(payments_to_update)
                 
                 results['updated'] = len(payments_to_update)
                 for update in payments_to_update:
@@ -218,6 +339,7 @@ class StatusTracker:
                 print("No payments needed updating")
                 results['details'].append("No payments needed updating")
             
+            self._save_checkpoint(engine, checkpoint, pending)
             return results
             
         except Exception as e:
@@ -226,6 +348,225 @@ class StatusTracker:
             results['details'].append(f"Error updating statuses: {str(e)}")
             return results
 
+    def _match_serially(self, engine, payments, start_offsets, checkpoint, progress_callback, cancel_event):
+        """
+        Match payments one by one; returns an outcome per payment, None when cancelled
+        Lookups are prefetched a chunk at a time, so progress and cancellation are never held up for long
+        """
+        outcomes = []
+        total = len(payments)
+        for done, payment in enumerate(payments):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if progress_callback:
+                progress_callback(done, total)
+            if done % PREFETCH_CHUNK == 0:
+                engine.prefetch(self._lookups(payments[done:done + PREFETCH_CHUNK], start_offsets, checkpoint))
+            try:
+                outcomes.append(self._match_treasury_payment(engine, payment, start_offsets, checkpoint))
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    def _match_in_processes(self, engine, payments, start_offsets, checkpoint, workers, hash_shards,
+                            progress_callback, cancel_event):
+        """
+        Match payments in a process pool, sharded by company and reference hash
+        Returns an outcome per payment in Treasury order, None when cancelled
+        """
+        # Snapshots were refreshed and saved by the caller's engine, so workers only map them
+        shards = {}
+        hash_shards = hash_shards or workers
+        for position, payment in enumerate(payments):
+            key = ((payment.get('company') or '').strip(),
+                   reference_hash(payment.get('reference') or '') % hash_shards)
+            shards.setdefault(key, []).append(position)
+
+        settings = {
+            'bs_files': self.bs_files,
+            'cnp_files': self.cnp_files,
+            'delay_threshold': self.delay_threshold,
+            'first_rows': engine.first_rows,
+            'checkpoints': engine.checkpoints
+        }
+        pending = checkpoint['pending']
+        outcomes = [None] * len(payments)
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker,
+                                 initargs=(settings, start_offsets)) as executor:
+            futures = {}
+            for positions in shards.values():
+                shard = [payments[position] for position in positions]
+                shard_pending = {key: pending[key] for key in map(self._payment_key, shard) if key in pending}
+                futures[executor.submit(_match_shard, shard, shard_pending)] = positions
+
+            for future in as_completed(futures):
+                if cancel_event is not None and cancel_event.is_set():
+                    executor.shutdown(cancel_futures=True)
+                    return None
+                positions = futures[future]
+                for position, outcome in zip(positions, future.result()):
+                    outcomes[position] = outcome
+                done += len(positions)
+                if progress_callback:
+                    progress_callback(done, len(payments))
+        return outcomes
+
+    def _lookups(self, payments, start_offsets, checkpoint):
+        """Yield the (payment, company, indexed) lookups _match_treasury_payment makes, for engine.prefetch"""
+        for payment in payments:
+            if (payment.get('status') or '').strip() == 'Paid':
+                continue
+            already_checked = start_offsets is not None and self._payment_key(payment) in checkpoint['pending']
+            yield payment, (payment.get('company') or '').strip(), start_offsets is not None and not already_checked
+
+    def _match_treasury_payment(self, engine, payment, start_offsets, checkpoint):
+        """
+        Decide the new status of one Treasury payment
+        Returns tuple: (update or None, payment key, status to keep pending or None)
+        """
+        reference = payment['reference'].strip()
+        current_status = payment.get('status', '').strip()
+        company = payment.get('company', '').strip()
+
+        print(f"\nChecking Treasury payment: {reference}")
+        print(f"Current Status: {current_status}")
+
+        # Skip if already paid
+        if current_status == 'Paid':
+            print(f"Skipping {reference} - already Paid")
+            return None, None, None
+
+        payment_key = self._payment_key(payment)
+        already_checked = start_offsets is not None and payment_key in checkpoint['pending']
+        if already_checked and not engine.may_match_appended(reference, company):
+            # None of the rows appended since the last run has its reference
+            print("No new statement rows for this payment")
+            return None, payment_key, current_status
+
+        is_old_payment = self.is_previous_month_payment(payment.get('date', '').strip())
+
+        if current_status == 'CNP':
+            # Old payments resolve to CNP first anyway; current ones can only move to Paid
+            if is_old_payment:
+                new_status, found_in, found_company = None, None, None
+            elif already_checked:
+                new_status, found_in, found_company = engine.match_bank_statement(payment, company)
+            else:
+                new_status, found_in, found_company = engine.match_payment(
+                    payment, company, is_old_payment, indexed=start_offsets is not None)
+                if new_status == 'CNP':
+                    new_status = None
+        elif already_checked:
+            # Earlier rows were already searched, only appended rows can match
+            new_status, found_in, found_company = engine.match_payment(payment, company, is_old_payment)
+        else:
+            # Check status in BS/CNP based on date
+            new_status, found_in, found_company = engine.match_payment(
+                payment, company, is_old_payment, indexed=start_offsets is not None)
+
+        update_data = None
+        if new_status:
+            print(f"Found in {found_in} for {found_company}")
+            update_data = {
+                'reference': reference,
+                'old_status': current_status,
+                'new_status': new_status,
+                'company': found_company if not company else company,
+                'details': [f"Found in {found_in}-{found_company}"]
+            }
+        else:
+            print(f"No matching payment found")
+
+        return update_data, payment_key, (new_status or current_status) if new_status != 'Paid' else None
+
+    def _payment_key(self, payment):
+        """Identify a Treasury payment by the fields that decide its match"""
+        return '|'.join((payment.get(field) or '').strip() for field in ('reference', 'amount', 'date', 'company'))
+
+    def _load_checkpoint(self):
+        """Load the reconciliation checkpoint, None if missing or unreadable"""
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if 'files' in checkpoint and 'pending' in checkpoint:
+                return checkpoint
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _valid_start_offsets(self, checkpoint):
+        """
+        Get file -> offset to resume from for every BS/CNP file
+        Returns None when any file was rewritten or truncated since the checkpoint
+        """
+        if checkpoint is None:
+            return None
+        
+        start_offsets = {}
+        for file_path in list(self.bs_files.values()) + list(self.cnp_files.values()):
+            saved = checkpoint['files'].get(file_path)
+            if saved is None:
+                return None
+            if saved['offset'] == 0:
+                start_offsets[file_path] = 0
+                continue
+            if not self.repository.position_valid(file_path, saved['offset'], saved['fingerprint']):
+                return None
+            start_offsets[file_path] = saved['offset']
+        return start_offsets
+
+    def _save_checkpoint(self, engine, checkpoint, pending):
+        """Save file offsets and row counts reached by this run along with unmatched payments"""
+        files = {}
+        for file_path in list(self.bs_files.values()) + list(self.cnp_files.values()):
+            read = engine.checkpoints.get(file_path)
+            if read is None:
+                # A file could not be read, so the next run has to start over
+                return
+            previous_rows = checkpoint['files'].get(file_path, {}).get('rows', 0) if read['offset'] else 0
+            files[file_path] = dict(read, rows=previous_rows + read['rows'])
+        
+        try:
+            temp_file = self.checkpoint_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'files': files, 'pending': pending}, f)
+            os.replace(temp_file, self.checkpoint_file)
+        except OSError as e:
+            print(f"Error saving reconciliation checkpoint: {e}")
+
+    def apply_status_updates(self, payments_to_update):
+        """
+        Apply status updates to Treasury in a single pass keyed by reference
+        Returns list of per-row changes: row number, reference, old/new status and company
+        """
+        # Later updates for the same reference win, as with the old nested loop
+        updates = {update['reference']: update for update in payments_to_update}
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        # One bulk update in the storage backend; a missing company is filled in, never replaced
+        applied = self.repository.update_status(self.treasury_file, {
+            reference: {'status': update['new_status'], 'company': update['company'], 'timestamp': timestamp}
+            for reference, update in updates.items()
+        }, fill_fields=('company',))
+        
+        changes = []
+        for row_number, row in applied:
+            update = updates[row['reference'].strip()]
+            old_company = row.get('company') or ''
+            changes.append({
+                'row': row_number,
+                'reference': update['reference'],
+                'old_status': row['status'],
+                'new_status': update['new_status'],
+                'old_company': old_company,
+                'company': old_company or update['company'],
+                'timestamp': timestamp,
+                'details': list(update.get('details', []))
+            })
+        
+        return changes
+
     def create_empty_file(self, file_path):
         """Create new file with headers"""
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -237,12 +578,55 @@ class StatusTracker:
     def _ensure_directories(self):
         """Ensure all required directories exist"""
         directories = [
-            'data/treasury',
-            'data/bank_statements/SALAM',
-            'data/bank_statements/MVNO',
-            'data/cnp/SALAM',
-            'data/cnp/MVNO'
+            'treasury',
+            'bank_statements/SALAM',
+            'bank_statements/MVNO',
+            'cnp/SALAM',
+            'cnp/MVNO'
         ]
         for directory in directories:
-            dir_path = os.path.join(self.base_dir, directory)
+            dir_path = os.path.join(self.data_dir, directory)
             os.makedirs(dir_path, exist_ok=True)
+
+# Tracker, engines and checkpoint offsets of a process pool worker, set once per process
+_shard_worker = {}
+
+def _init_shard_worker(settings, start_offsets):
+    """
+    Create the tracker and engine a worker process matches its shards with
+    The tracker is made without __init__, so workers neither print nor create directories.
+    The engine takes the parent's positions and the snapshots the parent saved are used
+    as they are, so workers never re-read or re-check the BS/CNP files.
+    """
+    tracker = StatusTracker.__new__(StatusTracker)
+    tracker.repository = DataRepository()
+    tracker.bs_files = settings['bs_files']
+    tracker.cnp_files = settings['cnp_files']
+    tracker.delay_threshold = settings['delay_threshold']
+
+    # Payments of a company only look up its own files, so one engine serves every shard
+    engine = ReconciliationEngine(tracker.bs_files, tracker.cnp_files, repository=tracker.repository)
+    engine.adopt(settings['first_rows'], settings['checkpoints'])
+    for file_path, checkpoint in engine.checkpoints.items():
+        if checkpoint['offset']:
+            tracker.repository.pin_snapshot(file_path, checkpoint['offset'])
+
+    _shard_worker['tracker'] = tracker
+    _shard_worker['engine'] = engine
+    _shard_worker['start_offsets'] = start_offsets
+
+def _match_shard(payments, pending):
+    """Match one shard of Treasury payments against its company's BS/CNP files in a worker process"""
+    tracker = _shard_worker['tracker']
+    start_offsets = _shard_worker['start_offsets']
+    engine = _shard_worker['engine']
+    checkpoint = {'pending': pending}
+    engine.prefetch(tracker._lookups(payments, start_offsets, checkpoint))
+
+    outcomes = []
+    for payment in payments:
+        try:
+            outcomes.append(tracker._match_treasury_payment(engine, payment, start_offsets, checkpoint))
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes
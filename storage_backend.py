@@ -0,0 +1,145 @@
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from amount_index import AmountIndex, cents_column
+
+PAYMENT_FIELDS = ['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary']
+
+class StorageBackend(ABC):
+    """
+    Record store behind FileOperations, StatusTracker, ExceptionHandler, AuditTrail and PaymentSystem
+    Datasets are named by the CSV path each component already uses; a backend that keeps
+    them elsewhere maps those paths to its own storage. Subclasses implement the abstract
+    methods; the rest are built on them and may be overridden.
+    Components check the capabilities below instead of the backend's type.
+    """
+    # Datasets are the CSV files themselves, so sidecar indexes and buffered writers can be kept on them
+    file_indexes = False
+
+    # Worker processes can open the datasets on their own, so matching can be sharded over a process pool
+    process_workers = False
+
+    # match_amounts answers a batch of lookups with one query, so matching prefetches in batches
+    batch_matching = False
+
+    def snapshot(self, dataset):
+        """Get the columnar snapshot of a dataset brought up to date, None for backends without snapshots"""
+        return None
+
+    @abstractmethod
+    def exists(self, dataset):
+        """Check whether a dataset has been created"""
+
+    @abstractmethod
+    def get_fieldnames(self, dataset):
+        """Get the columns of a dataset"""
+
+    @abstractmethod
+    def get_records(self, dataset):
+        """Get all records of a dataset; the returned rows are shared and must not be modified"""
+
+    @abstractmethod
+    def find(self, dataset, reference):
+        """Get records with the given stripped reference"""
+
+    @abstractmethod
+    def append_records(self, dataset, fieldnames, records):
+        """Append records, creating the dataset with fieldnames if needed"""
+
+    @abstractmethod
+    def write_records(self, dataset, fieldnames, records):
+        """Replace all records of a dataset"""
+
+    def locked(self):
+        """Get a context manager keeping this process's other writers out during a read-modify-write"""
+        return nullcontext()
+
+    def invalidate(self, dataset=None):
+        """Drop anything cached for one dataset or for all of them"""
+
+    @abstractmethod
+    def read_position(self, dataset):
+        """Get (position, rows, fingerprint) of the end of a dataset, for resuming reconciliation"""
+
+    @abstractmethod
+    def position_valid(self, dataset, position, fingerprint):
+        """Check that a dataset still starts with the data read up to a saved position"""
+
+    @abstractmethod
+    def row_at(self, dataset, position):
+        """Get the number of the first row at or after a position from read_position"""
+
+    @abstractmethod
+    def lookup_amounts(self, dataset, reference, first_row=0):
+        """Get (amount cents, status) of the rows with reference from first_row on, in dataset order"""
+
+    def references_from(self, dataset, first_row=0):
+        """Get the set of stripped references of the rows from first_row on"""
+        return {(record.get('reference') or '').strip() for record in self.get_records(dataset)[first_row:]}
+
+    def match_amounts(self, dataset, lookups, tolerance_cents=1):
+        """
+        Get the status of the first row matching each (reference, amount cents, first row) lookup
+        A row matches when its amount differs by less than tolerance_cents; None when no row does.
+        Backends that can should answer all lookups with one query.
+        """
+        rows = {}
+        statuses = []
+        for reference, amount, first_row in lookups:
+            key = (reference, first_row)
+            if key not in rows:
+                rows[key] = self.lookup_amounts(dataset, reference, first_row)
+            statuses.append(next((status for row_amount, status in rows[key]
+                                  if abs(row_amount - amount) < tolerance_cents), None))
+        return statuses
+
+    def append_record(self, dataset, fieldnames, record):
+        """Append a record, creating the dataset with fieldnames if needed"""
+        self.append_records(dataset, fieldnames, [record])
+
+    def append_payment(self, dataset, payment, fieldnames=PAYMENT_FIELDS):
+        """Append a payment; fields not in fieldnames are dropped"""
+        self.append_record(dataset, fieldnames, payment)
+
+    def scan(self, dataset, **filters):
+        """
+        Yield records whose fields equal the given values
+        A callable filter is called with the field value instead
+        """
+        for record in self.get_records(dataset):
+            for field, expected in filters.items():
+                value = record.get(field)
+                if not (expected(value) if callable(expected) else value == expected):
+                    break
+            else:
+                yield record
+
+    def update_status(self, dataset, updates, where_status=None, fill_fields=()):
+        """
+        Update many records in one write
+        updates: {stripped reference: {field: value}}, applied to every record with the reference
+        whose status is where_status if given; fields in fill_fields only replace empty values.
+        Returns [(row number, record before the update), ...]
+        """
+        changes = []
+        records = [dict(record) for record in self.get_records(dataset)]
+        for row_number, record in enumerate(records, start=1):
+            fields = updates.get((record.get('reference') or '').strip())
+            if fields is None or (where_status is not None and record.get('status') != where_status):
+                continue
+            changes.append((row_number, dict(record)))
+            for field, value in fields.items():
+                if field not in fill_fields or not record.get(field):
+                    record[field] = value
+
+        if changes:
+            self.write_records(dataset, self.get_fieldnames(dataset), records)
+        return changes
+
+    def amount_cents(self, dataset):
+        """Get the amounts of a dataset's records as an array('q') of cents"""
+        return cents_column(record.get('amount') for record in self.get_records(dataset))
+
+    def amount_index(self, dataset):
+        """Get the sorted amount index of a dataset"""
+        records = self.get_records(dataset)
+        return AmountIndex(records, self.amount_cents(dataset))
@@ -0,0 +1,117 @@
+import unittest
+import os
+import csv
+import shutil
+import tempfile
+from amount_index import AmountIndex, amount_matches, parse_cents, INVALID_CENTS
+from data_repository import DataRepository
+from file_operations import FileOperations
+from validation_system import ValidationSystem
+
+class TestAmountIndex(unittest.TestCase):
+    def setUp(self):
+        """Build an index over records on both sides of the threshold"""
+        self.records = [
+            {'reference': 'REF-001', 'amount': '20000.00'},
+            {'reference': 'REF-001', 'amount': '500.00'},
+            {'reference': 'REF-002', 'amount': '20150.00'},
+            {'reference': 'REF-003', 'amount': '500.00'},
+            {'reference': 'REF-004', 'amount': '30000.00'},
+            {'reference': ' REF-005 ', 'amount': 'n/a'}
+        ]
+        self.index = AmountIndex(self.records)
+
+    def _references(self, records):
+        """Get the references of records"""
+        return [record['reference'] for record in records]
+
+    def test_1_sorted_amounts(self):
+        """Test amounts are sorted per reference and globally, skipping unparseable ones"""
+        self.assertEqual(self.index.amounts.tolist(), [50000, 50000, 2000000, 2015000, 3000000])
+        self.assertEqual(self.index.by_reference['REF-001'][0].tolist(), [50000, 2000000])
+        self.assertNotIn('REF-005', self.index.by_reference)
+
+    def test_2_find_within_reference(self):
+        """Test tolerance and exact matches within a reference"""
+        self.assertEqual(self.index.find('REF-001', 2015000), [self.records[0]])
+        self.assertEqual(self.index.find(' REF-001 ', 50000), [self.records[1]])
+        self.assertEqual(self.index.find('REF-001', 50001), [])
+        self.assertEqual(self.index.find('REF-001', 2020000), [self.records[0]])
+        self.assertEqual(self.index.find('REF-001', 2020001), [])
+
+    def test_3_same_as_linear_scan(self):
+        """Test window queries return exactly what amount_matches accepts"""
+        for payment_amount in ['-1', '0', '500', '14999.99', '15000', '19800', '19801.99', '20200',
+                               '20202.03', '20353.54', '29700', '30303.03', '30303.04', '1e12']:
+            payment_cents = parse_cents(payment_amount)
+            expected = [r for r in self.records[:5] if amount_matches(parse_cents(r['amount']), payment_cents)]
+            found = self.index.find_amount(payment_cents)
+            self.assertEqual(sorted(self._references(found)), sorted(self._references(expected)), payment_amount)
+
+    def test_4_possible_match_with_other_reference(self):
+        """Test the different-reference search excludes the payment's own reference"""
+        self.assertEqual(self._references(self.index.find_amount(2010000, exclude_reference='REF-001')), ['REF-002'])
+        self.assertEqual(self._references(self.index.find_amount(50000, exclude_reference='REF-003')), ['REF-001'])
+
+    def test_5_file_operations_possible_matches(self):
+        """Test FileOperations finds same-amount records under other references"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file_ops = FileOperations(DataRepository())
+            file_ops.file_paths = {
+                'BS-SALAM': os.path.join(temp_dir, 'BS_SALAM_CURRENT.csv'),
+                'CNP-SALAM': os.path.join(temp_dir, 'CNP_SALAM_CURRENT.csv')
+            }
+            with open(file_ops.file_paths['BS-SALAM'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
+                writer.writerow(['REF-TYPO', '25100.00', '2025-01-01', 'Completed', '2025-01-01 10:00:00'])
+                writer.writerow(['REF-OTHER', '99.00', '2025-01-01', 'Completed', '2025-01-01 10:00:00'])
+
+            payment = {'reference': 'REF-REAL', 'amount': '25000.00', 'company': 'SALAM'}
+            matches = file_ops.find_possible_matches(payment)
+            self.assertEqual([(m['file'], m['record']['reference']) for m in matches], [('BS-SALAM', 'REF-TYPO')])
+
+            # cross_reference_check takes its candidates from the same index
+            validator = ValidationSystem()
+            payment.update({'reference': 'REF-TYPO', 'amount': '25200.00'})
+            results = validator.cross_reference_check(payment, file_ops)
+            self.assertEqual([m['reference'] for m in results['matches']], ['REF-TYPO'])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_6_parse_cents(self):
+        """Test amounts parse to exact integer cents, rounding half to even"""
+        self.assertEqual(parse_cents(' 1234.56 '), 123456)
+        self.assertEqual(parse_cents('1e3'), 100000)
+        self.assertEqual(parse_cents('100.005'), 10000)
+        self.assertEqual(parse_cents('100.015'), 10002)
+        self.assertEqual(parse_cents(12), 1200)
+        # Float sums that are not exactly equal still land on the same cent
+        self.assertEqual(parse_cents(0.1 + 0.2), parse_cents('0.30'))
+        for invalid in ['', 'n/a', 'nan', 'inf', None, '1' * 30]:
+            self.assertIsNone(parse_cents(invalid), invalid)
+
+    def test_7_repository_cents_column(self):
+        """Test the repository parses amounts once and extends the cents column on append"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            repository = DataRepository()
+            file_path = os.path.join(temp_dir, 'BS.csv')
+            fieldnames = ['reference', 'amount', 'status']
+            repository.append_records(file_path, fieldnames, [
+                {'reference': 'REF-001', 'amount': '10.10', 'status': 'Completed'},
+                {'reference': 'REF-002', 'amount': 'bad', 'status': 'Completed'}
+            ])
+            cents = repository.amount_cents(file_path)
+            self.assertEqual(cents.tolist(), [1010, INVALID_CENTS])
+
+            repository.append_record(file_path, fieldnames, {'reference': 'REF-003', 'amount': '0.30', 'status': ''})
+            self.assertIs(repository.amount_cents(file_path), cents)
+            self.assertEqual(cents.tolist(), [1010, INVALID_CENTS, 30])
+            self.assertEqual(repository.amount_index(file_path).amounts.tolist(), [30, 1010])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
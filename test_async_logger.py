@@ -0,0 +1,152 @@
+import unittest
+import os
+import csv
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from async_logger import AsyncLogQueue
+from audit_trail import AuditTrail
+from exception_handler import ExceptionHandler
+
+class TestAsyncLogQueue(unittest.TestCase):
+    def setUp(self):
+        """Set up a gate that holds the worker on its first write"""
+        self.gate = threading.Event()
+        self.written = []
+        self.queues = []
+
+    def _queue(self, **kwargs):
+        """Create a queue that is closed on tearDown"""
+        log_queue = AsyncLogQueue(**kwargs)
+        self.queues.append(log_queue)
+        return log_queue
+
+    def _blocked_write(self, value):
+        """Write that waits for the gate"""
+        self.gate.wait(5)
+        self.written.append(value)
+
+    def test_1_ordered_delivery(self):
+        """Test writes run in submission order"""
+        log_queue = self._queue()
+        for i in range(50):
+            log_queue.submit(self.written.append, i)
+        log_queue.drain()
+        self.assertEqual(self.written, list(range(50)))
+        self.assertEqual(log_queue.stats()['written'], 50)
+
+    def test_2_drop_when_full(self):
+        """Test the drop policy discards events and counts them"""
+        log_queue = self._queue(maxsize=2, on_full='drop')
+        log_queue.submit(self._blocked_write, 'first')
+        while log_queue.stats()['depth']:
+            pass
+        self.assertTrue(log_queue.submit(self.written.append, 'a'))
+        self.assertTrue(log_queue.submit(self.written.append, 'b'))
+        self.assertFalse(log_queue.submit(self.written.append, 'c'))
+
+        self.gate.set()
+        log_queue.drain()
+        stats = log_queue.stats()
+        self.assertEqual(self.written, ['first', 'a', 'b'])
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['high_water'], 2)
+
+    def test_3_block_applies_back_pressure(self):
+        """Test the block policy waits for space and counts blocked callers"""
+        log_queue = self._queue(maxsize=1, on_full='block', put_timeout=5)
+        log_queue.submit(self._blocked_write, 'first')
+        while log_queue.stats()['depth']:
+            pass
+        log_queue.submit(self.written.append, 'a')
+
+        threading.Timer(0.05, self.gate.set).start()
+        self.assertTrue(log_queue.submit(self.written.append, 'b'))
+        log_queue.drain()
+        self.assertEqual(self.written, ['first', 'a', 'b'])
+        self.assertEqual(log_queue.stats()['blocked'], 1)
+
+    def test_4_block_timeout_drops(self):
+        """Test a blocked caller gives up after put_timeout"""
+        log_queue = self._queue(maxsize=1, on_full='block', put_timeout=0.01)
+        log_queue.submit(self._blocked_write, 'first')
+        while log_queue.stats()['depth']:
+            pass
+        log_queue.submit(self.written.append, 'a')
+        self.assertFalse(log_queue.submit(self.written.append, 'b'))
+        self.gate.set()
+        stats = log_queue.stats()
+        self.assertEqual(stats['blocked'], 1)
+        self.assertEqual(stats['dropped'], 1)
+
+    def test_5_close_drains_then_writes_inline(self):
+        """Test close runs pending writes and later writes go straight through"""
+        log_queue = self._queue()
+        log_queue.submit(self.written.append, 1)
+        log_queue.close()
+        log_queue.submit(self.written.append, 2)
+        self.assertEqual(self.written, [1, 2])
+
+    def test_6_errors_counted(self):
+        """Test failing writes do not stop the worker"""
+        log_queue = self._queue()
+        log_queue.submit(lambda: 1 / 0)
+        log_queue.submit(self.written.append, 'after')
+        log_queue.drain()
+        self.assertEqual(log_queue.stats()['errors'], 1)
+        self.assertEqual(self.written, ['after'])
+
+    def test_7_audit_and_exceptions_through_queue(self):
+        """Test AuditTrail and ExceptionHandler writes are visible after their reads drain the queue"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            log_queue = self._queue()
+            audit_trail = AuditTrail(async_queue=log_queue)
+            audit_trail.audit_file = os.path.join(temp_dir, 'AUDIT_LOG.csv')
+            audit_trail.writer.file_path = audit_trail.audit_file
+            handler = ExceptionHandler(async_queue=log_queue)
+            handler.exception_file = os.path.join(temp_dir, 'EXCEPTION_LOG.csv')
+            handler.audit_file = os.path.join(temp_dir, 'EXCEPTION_AUDIT.csv')
+
+            audit_trail.log_action({'action': 'Queued', 'reference': 'REF-Q'})
+            handler.log_exception({'reference': 'REF-Q', 'type': 'Queued', 'description': 'queued'})
+
+            self.assertEqual(audit_trail.get_actions('REF-Q')[0]['action'], 'Queued')
+            self.assertEqual(handler.get_open_exceptions('REF-Q')[0]['type'], 'Queued')
+            audit_trail.close()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_8_queued_writes_survive_exit(self):
+        """Test writes still queued at exit reach a batch writer that atexit closed first"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(temp_dir, 'AUDIT_LOG.csv')
+            # The writer registers its exit hook after the queue, so it is closed first
+            script = (
+                "import sys, time\n"
+                "from async_logger import AsyncLogQueue\n"
+                "from audit_writer import BufferedAuditWriter\n"
+                "log_queue = AsyncLogQueue()\n"
+                "writer = BufferedAuditWriter(sys.argv[1], ['n'], 'batch', max_delay=60)\n"
+                "log_queue.submit(time.sleep, 0.2)\n"
+                "for n in range(5):\n"
+                "    log_queue.submit(writer.write, {'n': n})\n"
+            )
+            subprocess.run([sys.executable, '-c', script, file_path], check=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+            with open(file_path, newline='') as f:
+                self.assertEqual([row['n'] for row in csv.DictReader(f)], ['0', '1', '2', '3', '4'])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def tearDown(self):
+        """Release the worker and close queues"""
+        self.gate.set()
+        for log_queue in self.queues:
+            log_queue.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import os
+import csv
+import shutil
+import tempfile
+from unittest.mock import patch
+from audit_trail import AuditTrail
+
+class TestAuditPartitions(unittest.TestCase):
+    def setUp(self):
+        """Set up a monthly partitioned audit trail in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.audit_trail = self._trail('monthly')
+
+    def _trail(self, partition):
+        """Create an audit trail writing under the temporary directory"""
+        audit_trail = AuditTrail(partition=partition)
+        audit_trail.audit_file = os.path.join(self.temp_dir, 'AUDIT_LOG.csv')
+        audit_trail.writer.file_path = audit_trail.audit_file
+        audit_trail.partition_dir = os.path.join(self.temp_dir, 'audit')
+        return audit_trail
+
+    def _event(self, timestamp, reference):
+        """Build an audit event"""
+        return {'timestamp': timestamp, 'action': 'Test', 'reference': reference,
+                'details': '', 'user': 'System', 'status': 'Completed'}
+
+    def _write(self, audit_trail, timestamps):
+        """Write one event per timestamp"""
+        for i, timestamp in enumerate(timestamps):
+            audit_trail._write_to_audit_log(self._event(timestamp, f'REF-{i}'))
+
+    def test_1_events_routed_to_partitions(self):
+        """Test events land in the partition file for their month"""
+        self._write(self.audit_trail, ['2025-01-15 10:00:00', '2025-02-01 09:00:00', '2025-02-20 12:00:00'])
+        self.audit_trail.flush()
+        self.assertEqual(sorted(os.listdir(self.audit_trail.partition_dir)),
+                         ['AUDIT_LOG_2025-01.csv', 'AUDIT_LOG_2025-02.csv'])
+        self.assertFalse(os.path.exists(self.audit_trail.audit_file))
+        self.assertEqual(len(self.audit_trail.get_actions()), 3)
+
+    def test_2_partition_pruning(self):
+        """Test date queries only open overlapping partitions"""
+        self._write(self.audit_trail, ['2025-01-15 10:00:00', '2025-02-10 09:00:00', '2025-03-05 12:00:00'])
+        self.audit_trail.flush()
+
+        opened = []
+        real_open = open
+        def tracking_open(path, *args, **kwargs):
+            opened.append(os.path.basename(path))
+            return real_open(path, *args, **kwargs)
+
+        with patch('builtins.open', side_effect=tracking_open):
+            actions = self.audit_trail.get_actions(start_date='2025-02-01', end_date='2025-02-28')
+
+        self.assertEqual([a['reference'] for a in actions], ['REF-1'])
+        self.assertEqual({name for name in opened if name.endswith('.csv')}, {'AUDIT_LOG_2025-02.csv'})
+
+    def test_3_same_results_as_monolithic(self):
+        """Test partitioned queries match the monolithic log, including the end date boundary"""
+        timestamps = ['2025-01-31 23:59:59', '2025-02-01 00:00:00', '2025-02-01 08:00:00',
+                      '2025-02-28 00:00:00', '2025-03-01 00:00:00']
+        monolithic = self._trail(None)
+        monolithic.audit_file = os.path.join(self.temp_dir, 'MONOLITHIC.csv')
+        monolithic.writer.file_path = monolithic.audit_file
+        self._write(monolithic, timestamps)
+        self._write(self.audit_trail, timestamps)
+
+        for start, end in [('2025-02-01', '2025-02-28'), ('2025-02-01', None), (None, '2025-02-01'), (None, None)]:
+            self.assertEqual(self.audit_trail.get_actions(start_date=start, end_date=end),
+                             monolithic.get_actions(start_date=start, end_date=end))
+        monolithic.close()
+
+    def test_4_daily_partitions(self):
+        """Test daily partitioning uses one file per day"""
+        daily = self._trail('daily')
+        self._write(daily, ['2025-01-01 10:00:00', '2025-01-02 10:00:00'])
+        daily.flush()
+        self.assertEqual(sorted(os.listdir(daily.partition_dir)),
+                         ['AUDIT_LOG_2025-01-01.csv', 'AUDIT_LOG_2025-01-02.csv'])
+        self.assertEqual(len(daily.get_actions(start_date='2025-01-02')), 1)
+        daily.close()
+
+    def test_5_migrate_monolithic_log(self):
+        """Test migration splits the log by month and keeps the original"""
+        with open(self.audit_trail.audit_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.audit_trail.fieldnames)
+            writer.writeheader()
+            writer.writerow(self._event('2024-12-31 10:00:00', 'OLD-1'))
+            writer.writerow(self._event('2025-01-02 10:00:00', 'OLD-2'))
+            writer.writerow(self._event('not a date', 'OLD-3'))
+
+        counts = self.audit_trail.migrate_to_partitions()
+
+        self.assertEqual(counts, {'2024-12': 1, '2025-01': 1, 'undated': 1})
+        self.assertFalse(os.path.exists(self.audit_trail.audit_file))
+        self.assertTrue(os.path.exists(self.audit_trail.audit_file + '.migrated'))
+        self.assertEqual(len(self.audit_trail.get_actions()), 3)
+        self.assertEqual([a['reference'] for a in self.audit_trail.get_actions(start_date='2025-01-01')], ['OLD-2'])
+
+    def test_6_invalid_partition(self):
+        """Test unknown partition schemes are rejected"""
+        with self.assertRaises(ValueError):
+            AuditTrail(partition='weekly')
+
+    def test_7_export_mixed_columns(self):
+        """Test exports fill missing columns and a failed export keeps the earlier output"""
+        os.makedirs(self.audit_trail.partition_dir)
+        with open(os.path.join(self.audit_trail.partition_dir, 'AUDIT_LOG_2025-01.csv'), 'w',
+                  newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['timestamp', 'action', 'reference', 'details'])
+            writer.writeheader()
+            writer.writerow({'timestamp': '2025-01-10 10:00:00', 'action': 'Exception_Logged',
+                             'reference': 'EXC-1', 'details': 'Exception: Test'})
+        self._write(self.audit_trail, ['2025-02-20 10:00:00'])
+
+        output_file = os.path.join(self.temp_dir, 'export.csv')
+        self.assertTrue(self.audit_trail.export_audit_trail(output_file))
+        with open(output_file, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row['reference'] for row in rows], ['EXC-1', 'REF-0'])
+        self.assertEqual((rows[0]['user'], rows[0]['status']), ('', ''))
+        self.assertEqual((rows[1]['user'], rows[1]['status']), ('System', 'Completed'))
+
+        def failing_rows(start_date=None, end_date=None):
+            yield self._event('2025-02-21 10:00:00', 'PARTIAL')
+            raise OSError('disk error')
+
+        with patch.object(self.audit_trail, '_iter_range', failing_rows):
+            with self.assertRaises(OSError):
+                self.audit_trail.export_audit_trail(output_file)
+        with open(output_file, newline='', encoding='utf-8') as f:
+            self.assertEqual([row['reference'] for row in csv.DictReader(f)], ['EXC-1', 'REF-0'])
+        self.assertFalse(os.path.exists(output_file + '.tmp'))
+
+    def tearDown(self):
+        """Close the audit trail and remove temporary files"""
+        self.audit_trail.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
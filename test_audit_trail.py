@@ -1,6 +1,10 @@
 import unittest
 import os
 import csv
+import gzip
+import lzma
+import shutil
+import tempfile
 from datetime import datetime
 from audit_trail import AuditTrail
 
@@ -164,5 +168,90 @@ class TestAuditTrail(unittest.TestCase):
                 writer = csv.writer(f)
                 writer.writerow(['timestamp', 'action', 'reference', 'details', 'user', 'status'])
 
+class TestAuditExport(unittest.TestCase):
+    def setUp(self):
+        """Set up an audit trail with a log in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.audit_trail = AuditTrail()
+        self.audit_trail.audit_file = os.path.join(self.temp_dir, 'AUDIT_LOG.csv')
+        self.audit_trail.writer.file_path = self.audit_trail.audit_file
+        for day in range(1, 11):
+            self.audit_trail._write_to_audit_log({
+                'timestamp': f'2025-01-{day:02d} 10:00:00',
+                'action': 'Payment_Processing' if day % 2 else 'File_Operation',
+                'reference': f'REF-{day}',
+                'details': 'details',
+                'user': 'System',
+                'status': 'Completed'
+            })
+
+    def _path(self, name):
+        """Get a path in the temporary directory"""
+        return os.path.join(self.temp_dir, name)
+
+    def _read(self, path, opener=open):
+        """Read an exported file"""
+        with opener(path, 'rt', newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def test_1_export_matches_get_actions(self):
+        """Test the streamed export writes the same rows as get_actions"""
+        output = self._path('export.csv')
+        self.assertTrue(self.audit_trail.export_audit_trail(output, start_date='2025-01-03', end_date='2025-01-06'))
+        self.assertEqual(self._read(output), self.audit_trail.get_actions(start_date='2025-01-03', end_date='2025-01-06'))
+
+    def test_2_compressed_exports(self):
+        """Test gzip and lzma output, chosen by suffix or explicitly"""
+        self.assertTrue(self.audit_trail.export_audit_trail(self._path('export.csv.gz')))
+        self.assertEqual(len(self._read(self._path('export.csv.gz'), gzip.open)), 10)
+
+        self.assertTrue(self.audit_trail.export_audit_trail(self._path('export.dat'), compression='lzma'))
+        self.assertEqual(len(self._read(self._path('export.dat'), lzma.open)), 10)
+
+        with self.assertRaises(ValueError):
+            self.audit_trail.export_audit_trail(self._path('export.zip'), compression='zip')
+
+    def test_3_no_rows_no_file(self):
+        """Test an export without matches returns False and creates nothing"""
+        output = self._path('empty.csv')
+        self.assertFalse(self.audit_trail.export_audit_trail(output, reference='REF-999'))
+        self.assertFalse(os.path.exists(output))
+
+    def test_4_progress(self):
+        """Test progress is reported as a row count"""
+        progress = []
+        self.audit_trail.export_audit_trail(self._path('export.csv'), action_type='File_Operation',
+                                            progress_callback=progress.append)
+        self.assertEqual(progress[-1], 5)
+
+    def test_5_several_filters_in_one_pass(self):
+        """Test several exports are written from a single read of the log"""
+        exports = [
+            {'output_file': self._path('payments.csv'), 'action_type': 'Payment_Processing'},
+            {'output_file': self._path('early.csv.gz'), 'end_date': '2025-01-03'},
+            {'output_file': self._path('late.csv'), 'start_date': '2025-01-09'},
+            {'output_file': self._path('none.csv'), 'reference': 'REF-999'}
+        ]
+        reads = []
+        real_read_rows = self.audit_trail._read_rows
+        def counting_read_rows(*args):
+            reads.append(args[0])
+            return real_read_rows(*args)
+        self.audit_trail._read_rows = counting_read_rows
+
+        counts = self.audit_trail.export_audit_trails(exports)
+
+        self.assertEqual(reads, [self.audit_trail.audit_file])
+        self.assertEqual(counts, {self._path('payments.csv'): 5, self._path('early.csv.gz'): 2,
+                                  self._path('late.csv'): 2, self._path('none.csv'): 0})
+        self.assertEqual([row['reference'] for row in self._read(self._path('early.csv.gz'), gzip.open)],
+                         ['REF-1', 'REF-2'])
+        self.assertFalse(os.path.exists(self._path('none.csv')))
+
+    def tearDown(self):
+        """Close the audit trail and remove temporary files"""
+        self.audit_trail.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import os
+import csv
+import gc
+import time
+import weakref
+import shutil
+import tempfile
+from unittest.mock import patch
+from audit_writer import BufferedAuditWriter
+
+class TestBufferedAuditWriter(unittest.TestCase):
+    def setUp(self):
+        """Set up a writer on a temporary audit log"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'AUDIT_LOG.csv')
+        self.fieldnames = ['timestamp', 'action', 'reference', 'details', 'user', 'status']
+        self.writers = []
+
+    def _writer(self, **kwargs):
+        """Create a writer that is closed on tearDown"""
+        writer = BufferedAuditWriter(self.file_path, self.fieldnames, **kwargs)
+        self.writers.append(writer)
+        return writer
+
+    def _read_rows(self):
+        """Read the audit log rows"""
+        if not os.path.exists(self.file_path):
+            return []
+        with open(self.file_path, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def _event(self, i):
+        """Build an audit event"""
+        return {'timestamp': '2025-01-01 10:00:00', 'action': 'Test', 'reference': f'REF-{i}',
+                'details': 'details', 'user': 'System', 'status': 'Completed'}
+
+    def test_1_event_mode_flushes_every_row(self):
+        """Test event durability writes each row immediately"""
+        writer = self._writer(durability='event')
+        writer.write(self._event(1))
+        writer.write(self._event(2))
+        self.assertEqual([row['reference'] for row in self._read_rows()], ['REF-1', 'REF-2'])
+        self.assertEqual(writer.flush_count, 2)
+
+    def test_2_batch_mode_flushes_on_size(self):
+        """Test batch durability holds rows until max_events"""
+        writer = self._writer(durability='batch', max_events=3, max_delay=60)
+        writer.write(self._event(1))
+        writer.write(self._event(2))
+        self.assertEqual(self._read_rows(), [])
+
+        writer.write(self._event(3))
+        self.assertEqual(len(self._read_rows()), 3)
+        self.assertEqual(writer.flush_count, 1)
+
+    def test_3_batch_mode_flushes_on_time(self):
+        """Test batch durability flushes after max_delay"""
+        writer = self._writer(durability='batch', max_events=100, max_delay=0.05)
+        writer.write(self._event(1))
+        deadline = time.monotonic() + 2
+        while not self._read_rows() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self._read_rows()), 1)
+
+    def test_4_fsync_mode(self):
+        """Test fsync durability syncs each group"""
+        writer = self._writer(durability='fsync', max_events=2, max_delay=60)
+        with patch('audit_writer.os.fsync') as mock_fsync:
+            writer.write(self._event(1))
+            writer.write(self._event(2))
+            mock_fsync.assert_called_once()
+
+    def test_5_close_flushes(self):
+        """Test close writes what is still buffered"""
+        writer = self._writer(durability='batch', max_events=100, max_delay=60)
+        writer.write_many([self._event(1), self._event(2)])
+        writer.write(self._event(3))
+        writer.close()
+        self.assertEqual(len(self._read_rows()), 3)
+
+    def test_6_reopens_removed_file(self):
+        """Test a removed log is recreated with headers"""
+        writer = self._writer(durability='event')
+        writer.write(self._event(1))
+        os.remove(self.file_path)
+        writer.write(self._event(2))
+        self.assertEqual([row['reference'] for row in self._read_rows()], ['REF-2'])
+
+    def test_7_invalid_mode(self):
+        """Test unknown durability modes are rejected"""
+        with self.assertRaises(ValueError):
+            BufferedAuditWriter(self.file_path, self.fieldnames, durability='sometimes')
+
+    def test_8_write_after_close(self):
+        """Test rows written after close go straight to the file and the closed writer is released"""
+        writer = BufferedAuditWriter(self.file_path, self.fieldnames, durability='batch', max_delay=60)
+        writer.close()
+        writer.write(self._event(1))
+        self.assertEqual([row['reference'] for row in self._read_rows()], ['REF-1'])
+        self.assertIsNone(writer._file)
+
+        # close unregistered the exit hook, which would otherwise keep the writer alive
+        reference = weakref.ref(writer)
+        del writer
+        gc.collect()
+        self.assertIsNone(reference())
+
+    def tearDown(self):
+        """Close writers and remove temporary files"""
+        for writer in self.writers:
+            writer.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
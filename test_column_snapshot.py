@@ -0,0 +1,176 @@
+import unittest
+import os
+import csv
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from unittest.mock import patch
+from column_snapshot import ColumnSnapshot, SNAPSHOT_SUFFIX, read_npy_header
+from sidecar_index import iter_records
+from amount_index import INVALID_CENTS
+
+class TestColumnSnapshot(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary bank statement file"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'BS_SALAM_CURRENT.csv')
+        with open(self.file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
+            writer.writerow(['REF-001', '1000.00', '2025-01-01', 'Completed', '2025-01-01 10:00:00'])
+            writer.writerow(['REF-002', 'n/a', '2025-01-02', 'Pending', '2025-01-02 10:00:00'])
+            writer.writerow(['REF-001', '75.50', 'bad', 'Completed', '2025-01-03 10:00:00'])
+
+    def _append(self, *rows):
+        """Append rows to the test file"""
+        with open(self.file_path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow(row)
+
+    def test_1_columns(self):
+        """Test rows are parsed into cents, date ordinal and status code columns"""
+        snapshot = ColumnSnapshot(self.file_path)
+        self.assertTrue(snapshot.refresh())
+        self.assertEqual(snapshot.rows, 3)
+        self.assertEqual(list(snapshot.amount_cents), [100000, INVALID_CENTS, 7550])
+        self.assertEqual(list(snapshot.date_ordinal), [date(2025, 1, 1).toordinal(), date(2025, 1, 2).toordinal(), 0])
+        self.assertEqual([snapshot.statuses[code] for code in snapshot.status_code],
+                         ['Completed', 'Pending', 'Completed'])
+
+    def test_2_lookup(self):
+        """Test lookup returns (cents, status) of the reference's valid rows in file order"""
+        snapshot = ColumnSnapshot(self.file_path)
+        self.assertEqual(snapshot.lookup(' REF-001 '), [(100000, 'Completed'), (7550, 'Completed')])
+        self.assertEqual(snapshot.lookup('REF-002'), [])
+        self.assertEqual(snapshot.lookup('REF-999'), [])
+        self.assertEqual(snapshot.lookup('REF-001', first_row=1), [(7550, 'Completed')])
+
+    def test_3_saved_as_npy_and_memory_mapped(self):
+        """Test a new instance maps the saved .npy columns instead of parsing the CSV"""
+        ColumnSnapshot(self.file_path).refresh()
+        with open(os.path.join(self.file_path + SNAPSHOT_SUFFIX, 'amount_cents.npy'), 'rb') as f:
+            descr, rows, data_offset = read_npy_header(f)
+        self.assertEqual((descr, rows, data_offset % 64), ('<i8', 3, 0))
+
+        snapshot = ColumnSnapshot(self.file_path)
+        self.assertIsInstance(snapshot.amount_cents, memoryview)
+        with patch('column_snapshot.iter_records', wraps=iter_records) as mock_iter:
+            self.assertEqual(snapshot.lookup('REF-001')[0], (100000, 'Completed'))
+        # Only the two REF-001 rows are read back from the CSV
+        self.assertEqual(mock_iter.call_count, 2)
+        snapshot.close()
+
+    def test_4_append_extends_and_rewrite_rebuilds(self):
+        """Test appended rows extend the snapshot and a rewritten file rebuilds it"""
+        snapshot = ColumnSnapshot(self.file_path)
+        snapshot.refresh()
+        end = snapshot.state['end']
+        self._append(['REF-003', '10.00', '2025-01-04', 'Completed', '2025-01-04 10:00:00'])
+        snapshot.refresh()
+        self.assertEqual(snapshot.rows, 4)
+        self.assertEqual(snapshot.row_at(end), 3)
+        self.assertEqual(snapshot.lookup('REF-003'), [(1000, 'Completed')])
+
+        with open(self.file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
+            writer.writerow(['REF-100', '5.00', '2025-02-01', 'Returned', '2025-02-01 10:00:00'])
+        self.assertEqual(ColumnSnapshot(self.file_path).lookup('REF-100'), [(500, 'Returned')])
+        self.assertEqual(ColumnSnapshot(self.file_path).lookup('REF-001'), [])
+
+    def test_5_half_written_row_waits(self):
+        """Test a row without its line ending is left for the next refresh"""
+        snapshot = ColumnSnapshot(self.file_path)
+        with open(self.file_path, 'a', newline='') as f:
+            f.write('REF-004,20.00,2025-01-05,Comp')
+        self.assertEqual(snapshot.lookup('REF-004'), [])
+        self.assertEqual(snapshot.rows, 3)
+
+        with open(self.file_path, 'a', newline='') as f:
+            f.write('leted,2025-01-05 10:00:00\r\n')
+        self.assertEqual(snapshot.lookup('REF-004'), [(2000, 'Completed')])
+        self.assertEqual(snapshot.rows, 4)
+
+    def test_6_same_size_edit_rebuilds(self):
+        """Test an edit that keeps the file size is not mistaken for an append"""
+        ColumnSnapshot(self.file_path).refresh()
+        with open(self.file_path, 'rb') as f:
+            content = f.read()
+        with open(self.file_path, 'wb') as f:
+            f.write(content.replace(b'1000.00', b'9000.00'))
+
+        snapshot = ColumnSnapshot(self.file_path)
+        self.assertEqual(snapshot.lookup('REF-001'), [(900000, 'Completed'), (7550, 'Completed')])
+        snapshot.close()
+
+    def test_7_append_replaces_files_under_other_maps(self):
+        """Test an append writes new column files, leaving the ones another reader mapped intact"""
+        other = ColumnSnapshot(self.file_path)
+        other.refresh()
+        column_path = os.path.join(self.file_path + SNAPSHOT_SUFFIX, 'amount_cents.npy')
+        inode = os.stat(column_path).st_ino
+
+        snapshot = ColumnSnapshot(self.file_path)
+        self._append(['REF-001', '20.00', '2025-01-05', 'Completed', '2025-01-05 10:00:00'])
+        self.assertEqual(snapshot.lookup('REF-001'), [(100000, 'Completed'), (7550, 'Completed'),
+                                                      (2000, 'Completed')])
+        self.assertNotEqual(os.stat(column_path).st_ino, inode)
+        self.assertIsInstance(snapshot.amount_cents, memoryview)
+        self.assertEqual(snapshot.runs, [0, 3])
+        self.assertEqual(list(other.amount_cents), [100000, INVALID_CENTS, 7550])
+        self.assertEqual(os.listdir(self.file_path + SNAPSHOT_SUFFIX).count('meta.json'), 1)
+        snapshot.close()
+        other.close()
+
+        reloaded = ColumnSnapshot(self.file_path)
+        self.assertEqual(reloaded.rows, 4)
+        self.assertEqual(reloaded.lookup('REF-001', first_row=2), [(7550, 'Completed'), (2000, 'Completed')])
+        reloaded.close()
+
+    def test_8_failed_remap_keeps_usable_columns(self):
+        """Test a remap that fails after an append rebuilds in memory instead of keeping released views"""
+        snapshot = ColumnSnapshot(self.file_path)
+        snapshot.refresh()
+        self._append(['REF-001', '20.00', '2025-01-05', 'Completed', '2025-01-05 10:00:00'])
+        with patch.object(ColumnSnapshot, '_map_columns', side_effect=ValueError('bad column')):
+            self.assertEqual(snapshot.lookup('REF-001'), [(100000, 'Completed'), (7550, 'Completed'),
+                                                          (2000, 'Completed')])
+        self.assertEqual(list(snapshot.amount_cents), [100000, INVALID_CENTS, 7550, 2000])
+        snapshot.close()
+
+    def test_9_processes_share_snapshot(self):
+        """Test processes appending to the same CSV and looking it up never see a half-written snapshot"""
+        script = (
+            "import csv, sys\n"
+            "from column_snapshot import ColumnSnapshot\n"
+            "file_path, name = sys.argv[1], sys.argv[2]\n"
+            "snapshot = ColumnSnapshot(file_path)\n"
+            "errors = 0\n"
+            "for number in range(60):\n"
+            "    with open(file_path, 'a', newline='') as f:\n"
+            "        csv.writer(f).writerow([f'{name}-{number}', '1.00', '2025-01-05', 'Completed', ''])\n"
+            "    try:\n"
+            "        assert snapshot.lookup(f'{name}-{number}') == [(100, 'Completed')]\n"
+            "    except Exception as e:\n"
+            "        errors += 1\n"
+            "        print(repr(e), file=sys.stderr)\n"
+            "sys.exit(1 if errors else 0)\n"
+        )
+        directory = os.path.dirname(os.path.abspath(__file__))
+        processes = [subprocess.Popen([sys.executable, '-c', script, self.file_path, name], cwd=directory,
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                     for name in ('A', 'B')]
+        for process in processes:
+            _, stderr = process.communicate(timeout=120)
+            self.assertEqual(process.returncode, 0, stderr)
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        ColumnSnapshot._instances.clear()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import os
+import csv
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+from data_repository import DataRepository
+
+class TestDataRepository(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary Treasury file"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'TREASURY_CURRENT.csv')
+        self.headers = ['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary']
+        with open(self.file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.headers)
+            writer.writerow(['REF-001', '1000.00', '2025-01-01', 'Under Process', '2025-01-01 10:00:00', 'SALAM', 'Test'])
+        self.repository = DataRepository()
+
+    def test_1_records_parsed_once(self):
+        """Test repeated reads reuse the cached records"""
+        first = self.repository.get_records(self.file_path)
+        with patch('data_repository.iter_records') as mock_iter:
+            second = self.repository.get_records(self.file_path)
+            mock_iter.assert_not_called()
+        self.assertIs(first, second)
+        self.assertEqual(first[0]['reference'], 'REF-001')
+
+    def test_2_external_change_invalidates(self):
+        """Test a file changed on disk is parsed again"""
+        self.repository.get_records(self.file_path)
+        with open(self.file_path, 'a', newline='') as f:
+            csv.writer(f).writerow(['REF-002', '20.00', '2025-01-02', 'Paid', '2025-01-02 10:00:00', 'MVNO', 'Other'])
+
+        records = self.repository.get_records(self.file_path)
+        self.assertEqual([r['reference'] for r in records], ['REF-001', 'REF-002'])
+
+    def test_3_append_updates_cache(self):
+        """Test records appended through the repository are visible immediately"""
+        self.repository.get_records(self.file_path)
+        self.assertEqual(self.repository.find(self.file_path, 'REF-003'), [])
+
+        self.repository.append_record(self.file_path, self.headers, {
+            'reference': 'REF-003', 'amount': '30.00', 'date': '2025-01-03',
+            'status': 'Under Process', 'timestamp': '2025-01-03 10:00:00',
+            'company': 'SALAM', 'beneficiary': 'Third'
+        })
+
+        with patch('data_repository.read_header') as mock_header:
+            records = self.repository.get_records(self.file_path)
+            mock_header.assert_not_called()
+        self.assertEqual(records[-1]['reference'], 'REF-003')
+        self.assertEqual(self.repository.find(self.file_path, 'REF-003')[0]['amount'], '30.00')
+
+    def test_4_append_creates_file(self):
+        """Test appending to a missing file writes headers first"""
+        new_file = os.path.join(self.temp_dir, 'cnp', 'CNP_SALAM_CURRENT.csv')
+        self.repository.append_record(new_file, ['reference', 'amount'], {'reference': 'REF-9', 'amount': '9'})
+
+        with open(new_file, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows, [{'reference': 'REF-9', 'amount': '9'}])
+        self.assertEqual(self.repository.get_records(new_file), rows)
+
+    def test_5_find_without_cache(self):
+        """Test find works before the file has been parsed"""
+        rows = self.repository.find(self.file_path, ' REF-001 ')
+        self.assertEqual(rows[0]['company'], 'SALAM')
+
+    def test_6_write_records(self):
+        """Test rewriting a file replaces the cached records"""
+        self.repository.get_records(self.file_path)
+        self.repository.write_records(self.file_path, ['reference', 'amount'], [{'reference': 'REF-5', 'amount': '5'}])
+
+        self.assertEqual(self.repository.get_records(self.file_path), [{'reference': 'REF-5', 'amount': '5'}])
+        self.assertEqual(self.repository.find(self.file_path, 'REF-001'), [])
+
+    def test_7_missing_file(self):
+        """Test reading a file that does not exist"""
+        missing = os.path.join(self.temp_dir, 'missing.csv')
+        self.assertEqual(self.repository.get_records(missing), [])
+        self.assertEqual(self.repository.find(missing, 'REF-001'), [])
+
+    def test_8_append_records(self):
+        """Test several records appended in one write reach the cache in order"""
+        self.repository.get_records(self.file_path)
+        self.repository.append_records(self.file_path, self.headers, [
+            {'reference': 'REF-002', 'amount': '20.00', 'status': 'Paid'},
+            {'reference': 'REF-003', 'amount': '30.00', 'status': 'Paid'}
+        ])
+        records = self.repository.get_records(self.file_path)
+        self.assertEqual([r['reference'] for r in records], ['REF-001', 'REF-002', 'REF-003'])
+        self.assertEqual(records, list(DataRepository().get_records(self.file_path)))
+
+    def test_9_update_status_blocks_appends(self):
+        """Test an append racing a status update waits for its write instead of being overwritten"""
+        appender = threading.Thread(target=self.repository.append_record, args=(
+            self.file_path, self.headers, {'reference': 'REF-002', 'amount': '20.00', 'status': 'Under Process'}))
+        get_records = self.repository.get_records
+
+        def read_then_append(file_path):
+            records = list(get_records(file_path))
+            appender.start()
+            appender.join(0.2)
+            return records
+
+        with patch.object(self.repository, 'get_records', side_effect=read_then_append):
+            self.repository.update_status(self.file_path, {'REF-001': {'status': 'Paid'}})
+        appender.join()
+
+        records = DataRepository().get_records(self.file_path)
+        self.assertEqual([(r['reference'], r['status']) for r in records],
+                         [('REF-001', 'Paid'), ('REF-002', 'Under Process')])
+
+    def test_10_interrupted_write_keeps_file(self):
+        """Test a rewrite that fails halfway leaves the old file in place and no temporary file"""
+        def records():
+            yield {'reference': 'REF-5', 'amount': '5'}
+            raise KeyboardInterrupt
+
+        before = self.repository.get_records(self.file_path)
+        with self.assertRaises(KeyboardInterrupt):
+            self.repository.write_records(self.file_path, ['reference', 'amount'], records())
+        self.assertEqual(DataRepository().get_records(self.file_path), before)
+        self.assertFalse(os.path.exists(self.file_path + '.tmp'))
+
+    def tearDown(self):
+        """Clean up temporary files"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,16 @@ import unittest
 from datetime import datetime
 import os
 import csv
+import shutil
+import tempfile
 from exception_handler import ExceptionHandler
+from exception_index import OpenExceptionIndex
 
 class TestExceptionHandler(unittest.TestCase):
     def setUp(self):
-        """Set up test environment"""
-        self.handler = ExceptionHandler()
+        """Set up test environment with data files in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.handler = ExceptionHandler(data_dir=self.temp_dir)
         self.test_reference = "TEST-2025-0001"
         self.test_data = {
             'reference': 'TST-2025-0001',
@@ -17,20 +21,10 @@ class TestExceptionHandler(unittest.TestCase):
             'status': 'Under Process'
         }
         
-        # Instead of removing, just ensure the file is empty
-        if os.path.exists(self.handler.audit_file):
-            with open(self.handler.audit_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'action', 'reference', 'details'])
-        if os.path.exists(self.handler.exception_file):
-            with open(self.handler.exception_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'reference', 'type', 'description', 'status', 'resolution'])
-        
         # Ensure test directories exist
         os.makedirs(os.path.dirname(self.handler.exception_file), exist_ok=True)
-        os.makedirs(os.path.join(self.handler.base_dir, 'data/cnp/salam'), exist_ok=True)
-        os.makedirs(os.path.join(self.handler.base_dir, 'data/bank_statements/salam'), exist_ok=True)
+        os.makedirs(os.path.join(self.handler.data_dir, 'cnp/salam'), exist_ok=True)
+        os.makedirs(os.path.join(self.handler.data_dir, 'bank_statements/salam'), exist_ok=True)
         
         # Create test files
         self._create_test_files()
@@ -38,14 +32,14 @@ class TestExceptionHandler(unittest.TestCase):
     def _create_test_files(self):
         """Create test files with sample data"""
         # Create CNP test file
-        cnp_file = os.path.join(self.handler.base_dir, 'data/cnp/salam/CNP_SALAM.csv')
+        cnp_file = os.path.join(self.handler.data_dir, 'cnp/salam/CNP_SALAM.csv')
         with open(cnp_file, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
             writer.writerow(['TST-2025-0001', '1000.00', '2025-01-01', 'Completed', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
         
         # Create Bank Statement test file
-        bs_file = os.path.join(self.handler.base_dir, 'data/bank_statements/salam/BS_SALAM.csv')
+        bs_file = os.path.join(self.handler.data_dir, 'bank_statements/salam/BS_SALAM.csv')
         with open(bs_file, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
@@ -238,7 +232,7 @@ class TestExceptionHandler(unittest.TestCase):
     def test_15_verify_old_payment_missing_bs(self):
         """Test verification when payment is missing from Bank Statement"""
         # Add to CNP only
-        cnp_file = os.path.join(self.handler.base_dir, 'data/cnp/salam/CNP_SALAM.csv')
+        cnp_file = os.path.join(self.handler.data_dir, 'cnp/salam/CNP_SALAM.csv')
         with open(cnp_file, 'a', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['TST-2025-0003', '1000.00', '2025-01-01', 'Completed', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
@@ -275,18 +269,27 @@ class TestExceptionHandler(unittest.TestCase):
         self.assertFalse(result['bs_verified'])
         self.assertTrue(result['requires_approval'])
 
-    def tearDown(self):
-        """Clean up test files"""
-        files_to_cleanup = [
-            os.path.join(self.handler.base_dir, 'data/cnp/salam/CNP_SALAM.csv'),
-            os.path.join(self.handler.base_dir, 'data/bank_statements/salam/BS_SALAM.csv'),
-            self.handler.exception_file,
-            self.handler.audit_file
+    def test_18_verify_old_payments_batch(self):
+        """Test batch verification matches single verification and logs exceptions together"""
+        payments = [
+            self.test_data,
+            dict(self.test_data, reference='TST-2025-0002'),
+            dict(self.test_data, company='INVALID')
         ]
         
-        for file in files_to_cleanup:
-            if os.path.exists(file):
-                os.remove(file)
+        results = self.handler.verify_old_payments(payments)
+        
+        self.assertEqual([r['requires_approval'] for r in results], [False, True, True])
+        self.assertEqual(results[1]['warnings'], ["Payment not found in CNP file",
+                                                  "Payment not found in Bank Statement"])
+        open_exceptions = self.handler.get_open_exceptions()
+        self.assertEqual([e['reference'] for e in open_exceptions], ['TST-2025-0002', 'TST-2025-0001'])
+        self.assertEqual({e['type'] for e in open_exceptions}, {'Old_Payment_Verification'})
+
+    def tearDown(self):
+        """Clean up test files"""
+        OpenExceptionIndex._instances.pop(os.path.abspath(self.handler.exception_file), None)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import os
+import csv
+import shutil
+import tempfile
+import threading
+from exception_handler import ExceptionHandler
+from exception_index import OpenExceptionIndex, INDEX_SUFFIX
+
+class TestOpenExceptionIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up an exception handler with logs in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.handler = ExceptionHandler()
+        self.handler.exception_file = os.path.join(self.temp_dir, 'EXCEPTION_LOG.csv')
+        self.handler.audit_file = os.path.join(self.temp_dir, 'AUDIT_LOG.csv')
+        self.resolution_file = os.path.join(self.temp_dir, 'EXCEPTION_LOG_RESOLUTIONS.csv')
+        for reference in ['REF-1', 'REF-2', 'REF-1']:
+            self.handler.log_exception({'reference': reference, 'type': 'Test', 'description': 'test'})
+
+    def _read(self, path):
+        """Read the rows of a CSV file"""
+        with open(path, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def _references(self, rows):
+        """Get the references of rows"""
+        return [row['reference'] for row in rows]
+
+    def test_1_resolve_appends_event(self):
+        """Test resolving appends an event and leaves the exception log untouched"""
+        with open(self.handler.exception_file, 'rb') as f:
+            before = f.read()
+
+        self.assertTrue(self.handler.resolve_exception('REF-1', {'resolution': 'Fixed'}))
+
+        with open(self.handler.exception_file, 'rb') as f:
+            self.assertEqual(f.read(), before)
+        events = self._read(self.resolution_file)
+        self.assertEqual([(e['reference'], e['resolution']) for e in events], [('REF-1', 'Fixed')])
+        self.assertEqual(self._references(self.handler.get_open_exceptions()), ['REF-2'])
+        self.assertEqual(self.handler.get_open_exceptions('REF-1'), [])
+        self.assertFalse(self.handler.resolve_exception('REF-1', {'resolution': 'Again'}))
+
+    def test_2_later_exceptions_stay_open(self):
+        """Test a resolution only closes exceptions logged before it"""
+        self.handler.resolve_exception('REF-1', {'resolution': 'Fixed'})
+        self.handler.log_exception({'reference': 'REF-1', 'type': 'Test', 'description': 'again'})
+        open_rows = self.handler.get_open_exceptions('REF-1')
+        self.assertEqual([row['description'] for row in open_rows], ['again'])
+
+    def test_3_sidecar_reloaded(self):
+        """Test the persisted index gives the same open set in a new process"""
+        self.handler.resolve_exception('REF-2', {'resolution': 'Fixed'})
+        self.assertTrue(os.path.exists(self.handler.exception_file + INDEX_SUFFIX))
+
+        OpenExceptionIndex._instances.clear()
+        reloaded = OpenExceptionIndex.for_file(self.handler.exception_file)
+        self.assertEqual(set(reloaded.open), {'REF-1'})
+        self.assertEqual(self._references(reloaded.open_rows()), ['REF-1', 'REF-1'])
+
+    def test_4_compaction(self):
+        """Test compaction folds resolutions into the log and clears the events"""
+        self.handler.resolve_exception('REF-1', {'resolution': 'Fixed'})
+        self.assertEqual(self.handler.compact_exceptions(), 1)
+
+        rows = self._read(self.handler.exception_file)
+        self.assertEqual([(row['reference'], row['status'], row['resolution']) for row in rows],
+                         [('REF-1', 'Resolved', 'Fixed'), ('REF-2', 'Open', ''), ('REF-1', 'Resolved', 'Fixed')])
+        self.assertEqual(self._read(self.resolution_file), [])
+        self.assertEqual(self._references(self.handler.get_open_exceptions()), ['REF-2'])
+
+    def test_5_compacts_after_threshold(self):
+        """Test resolve_exception compacts once enough events have built up"""
+        self.handler.compact_after = 2
+        self.handler.resolve_exception('REF-1', {'resolution': 'Fixed'})
+        self.assertEqual(len(self._read(self.resolution_file)), 1)
+        self.handler.resolve_exception('REF-2', {'resolution': 'Fixed'})
+        self.assertEqual(self._read(self.resolution_file), [])
+        self.assertEqual({row['status'] for row in self._read(self.handler.exception_file)}, {'Resolved'})
+
+    def test_6_rewritten_log_ignores_old_events(self):
+        """Test events written against an earlier log do not close rows of a rewritten one"""
+        self.handler.resolve_exception('REF-1', {'resolution': 'Fixed'})
+        with open(self.handler.exception_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['timestamp', 'reference', 'type', 'description', 'status', 'resolution'])
+            writer.writerow(['2025-01-01 10:00:00', 'REF-1', 'Test', 'fresh', 'Open', ''])
+        self.assertEqual([row['description'] for row in self.handler.get_open_exceptions('REF-1')], ['fresh'])
+
+    def test_7_bulk_resolve(self):
+        """Test many references are resolved with one event append and one audit append"""
+        results = self.handler.resolve_exceptions({
+            'REF-1': {'resolution': 'Month end'},
+            'REF-2': {'resolution': 'Month end'},
+            'REF-9': {'resolution': 'Unknown'}
+        })
+
+        self.assertEqual(results, {'REF-1': True, 'REF-2': True, 'REF-9': False})
+        self.assertEqual(self.handler.get_open_exceptions(), [])
+        self.assertEqual(self._references(self._read(self.resolution_file)), ['REF-1', 'REF-2'])
+        audit = [row for row in self._read(self.handler.audit_file) if row['action'] == 'Exception_Resolved']
+        self.assertEqual(self._references(audit), ['REF-1', 'REF-2'])
+        self.assertEqual(self.handler.resolve_exceptions({'REF-1': {'resolution': 'Again'}}), {'REF-1': False})
+
+    def test_8_resolution_during_compaction_kept(self):
+        """Test a resolution made while compaction rewrites the logs waits for it and is not cleared"""
+        self.handler.resolve_exception('REF-1', {'resolution': 'Fixed'})
+        repository = self.handler.repository
+        write_records = repository.write_records
+        resolver = threading.Thread(target=self.handler.resolve_exception, args=('REF-2', {'resolution': 'Later'}))
+
+        def write_during_resolve(*args):
+            if not resolver.is_alive() and resolver.ident is None:
+                resolver.start()
+                resolver.join(0.2)
+                self.assertTrue(resolver.is_alive())
+            write_records(*args)
+
+        repository.write_records = write_during_resolve
+        try:
+            self.assertEqual(self.handler.compact_exceptions(), 1)
+        finally:
+            del repository.write_records
+        resolver.join()
+
+        self.assertEqual(self._references(self._read(self.resolution_file)), ['REF-2'])
+        self.assertEqual(self.handler.get_open_exceptions(), [])
+
+    def tearDown(self):
+        """Remove temporary files"""
+        OpenExceptionIndex._instances.pop(os.path.abspath(self.handler.exception_file), None)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
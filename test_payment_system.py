@@ -1,5 +1,6 @@
 import unittest
 from unittest.mock import MagicMock, patch
+import threading
 import tkinter as tk
 from datetime import datetime
 from payment_system_v4 import PaymentSystem
@@ -779,5 +780,19 @@ class TestPaymentSystem(unittest.TestCase):
             self.payment_system.process_payment()
             self.payment_system.file_ops.save_payment.assert_called_once()
 
+    def test_stop_status_update(self):
+        """Test closing the window cancels a running status update and waits for it"""
+        finished = threading.Event()
+
+        def run():
+            self.payment_system.update_cancel_event.wait(5)
+            finished.set()
+
+        self.payment_system.update_thread = threading.Thread(target=run, daemon=True)
+        self.payment_system.update_thread.start()
+        self.payment_system.stop_status_update()
+        self.assertTrue(finished.is_set())
+        self.assertIsNone(self.payment_system.update_thread)
+
 if __name__ == '__main__':
     unittest.main()
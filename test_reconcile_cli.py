@@ -0,0 +1,156 @@
+import unittest
+import os
+import io
+import csv
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime
+from unittest.mock import patch
+from exception_handler import ExceptionHandler
+from reconcile_cli import main
+from sqlite_backend import SQLiteBackend
+
+class TestReconcileCLI(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary data directory with Treasury and bank statement files"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        self._write('treasury/TREASURY_CURRENT.csv', ['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary'], [
+            ['REF-001', '100.00', self.today, 'Under Process', '', 'SALAM', 'Test'],
+            ['REF-002', '50.00', self.today, 'Under Process', '', 'MVNO', 'Test']
+        ])
+        self._write('bank_statements/SALAM/BS_SALAM_CURRENT.csv', ['reference', 'amount', 'date', 'status', 'timestamp'], [
+            ['REF-001', '100.00', self.today, 'Completed', '']
+        ])
+
+    def _write(self, name, header, rows):
+        """Write a CSV file under the data directory"""
+        file_path = os.path.join(self.temp_dir, name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        return file_path
+
+    def _run(self, *argv):
+        """Run the CLI in process; returns (exit code, parsed stdout, stderr)"""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            code = main(['--data-dir', self.temp_dir] + list(argv))
+        return code, json.loads(stdout.getvalue()) if stdout.getvalue() else None, stderr.getvalue()
+
+    def test_1_reconcile(self):
+        """Test reconcile prints the results as JSON and sends progress messages to stderr"""
+        code, result, stderr = self._run('reconcile')
+        self.assertEqual(code, 0)
+        self.assertEqual((result['mode'], result['updated'], result['errors']), ('full', 1, 0))
+        self.assertIn('Starting Status Update', stderr)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'treasury', 'RECONCILIATION_CHECKPOINT.json')))
+        # The tracker creates its directories under --data-dir, not next to the program
+        self.assertTrue(os.path.isdir(os.path.join(self.temp_dir, 'cnp', 'MVNO')))
+
+        code, result, _ = self._run('reconcile', '--full', '--workers', '2')
+        self.assertEqual((code, result['mode'], result['updated']), (0, 'full', 0))
+
+    def test_2_check(self):
+        """Test checking references and payments from an input file"""
+        input_file = self._write('check.csv', ['reference', 'amount', 'date', 'company'], [
+            ['REF-002', '50.00', self.today, 'MVNO']
+        ])
+        code, result, _ = self._run('check', 'REF-001', '--input', input_file)
+        self.assertEqual(code, 0)
+        self.assertEqual([(p['reference'], p['status'], p['company']) for p in result['payments']],
+                         [('REF-002', 'Under Process', 'MVNO'), ('REF-001', 'Paid', 'SALAM')])
+
+        code, result, _ = self._run('check', 'REF-404')
+        self.assertEqual((code, result['errors']), (1, 1))
+        self.assertEqual(self._run('check')[0], 2)
+        self.assertEqual(self._run('unknown')[0], 2)
+
+    def test_3_export_audit(self):
+        """Test exporting the audit trail of the data directory"""
+        self._write('exceptions/AUDIT_LOG.csv', ['timestamp', 'action', 'reference', 'details', 'user', 'status'], [
+            [f'{self.today} 10:00:00', 'Payment_Saved', 'REF-001', '', 'System', 'Success'],
+            [f'{self.today} 11:00:00', 'File_Access', '', '', 'System', 'Success']
+        ])
+        output_file = os.path.join(self.temp_dir, 'export.csv')
+        code, result, _ = self._run('export-audit', output_file, '--action', 'Payment_Saved')
+        self.assertEqual((code, result['rows']), (0, 1))
+        with open(output_file, newline='') as f:
+            self.assertEqual([row['reference'] for row in csv.DictReader(f)], ['REF-001'])
+
+    def test_4_no_tkinter(self):
+        """Test the CLI runs without importing tkinter"""
+        code = ("import sys, reconcile_cli; code = reconcile_cli.main(['--data-dir', sys.argv[1], 'reconcile']); "
+                "sys.exit(3 if 'tkinter' in sys.modules else code)")
+        process = subprocess.run([sys.executable, '-c', code, self.temp_dir], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(json.loads(process.stdout)['updated'], 1)
+
+    def test_5_migrate_and_export(self):
+        """Test migrating the data directory into a database, reconciling there and exporting Treasury"""
+        database = os.path.join(self.temp_dir, 'payments.db')
+        handler = ExceptionHandler(data_dir=self.temp_dir)
+        handler.log_exceptions([{'reference': 'REF-001', 'type': 'Test', 'description': 'test'},
+                                {'reference': 'REF-002', 'type': 'Test', 'description': 'test'}])
+        handler.resolve_exception('REF-001', {'resolution': 'Fixed'})
+        self._write('exceptions/audit/AUDIT_LOG_2025-01.csv',
+                    ['timestamp', 'action', 'reference', 'details', 'user', 'status'],
+                    [['2025-01-02 10:00:00', 'Test', 'REF-001', '', 'System', 'Completed']])
+
+        self.assertEqual(self._run('migrate')[0], 2)
+        code, result, _ = self._run('--database', database, 'migrate')
+        treasury_file = os.path.join(self.temp_dir, 'treasury', 'TREASURY_CURRENT.csv')
+        exception_file = os.path.join(self.temp_dir, 'exceptions/EXCEPTION_LOG.csv')
+        audit_file = os.path.join(self.temp_dir, 'exceptions/AUDIT_LOG.csv')
+        self.assertEqual(code, 0)
+        self.assertEqual(result['migrated'], {
+            treasury_file: 2,
+            os.path.join(self.temp_dir, 'bank_statements', 'SALAM', 'BS_SALAM_CURRENT.csv'): 1,
+            exception_file: 2,
+            audit_file: 4
+        })
+        backend = SQLiteBackend(database)
+        self.assertEqual([row['status'] for row in backend.get_records(exception_file)], ['Resolved', 'Open'])
+        self.assertEqual([row['user'] for row in backend.get_records(audit_file)], ['', '', '', 'System'])
+
+        self.assertEqual(self._run('--database', database, 'reconcile')[1]['updated'], 1)
+        output_file = os.path.join(self.temp_dir, 'treasury.csv')
+        code, result, _ = self._run('--database', database, 'export', treasury_file, '--output-file', output_file)
+        self.assertEqual((code, result['rows']), (0, 2))
+        with open(output_file, newline='', encoding='utf-8-sig') as f:
+            self.assertEqual([row['status'] for row in csv.DictReader(f)], ['Paid', 'Under Process'])
+        self.assertEqual(self._run('--database', database, 'export', 'missing.csv')[0], 1)
+
+    def test_6_check_streams(self):
+        """Test check writes each result before reading the next input row"""
+        stdout = io.StringIO()
+        written = []
+
+        def stdin_lines():
+            yield 'reference,amount\n'
+            yield 'REF-002,50.00\n'
+            written.append(stdout.getvalue().count('"reference"'))
+            yield 'REF-404,1.00\n'
+
+        stderr = io.StringIO()
+        with patch('sys.stdin', stdin_lines()), redirect_stdout(stdout), redirect_stderr(stderr):
+            code = main(['--data-dir', self.temp_dir, 'check', '--input', '-'])
+        self.assertEqual(code, 1)
+        self.assertEqual(written, [1])
+        result = json.loads(stdout.getvalue())
+        self.assertEqual([p['status'] for p in result['payments']], ['Under Process', 'Not Found'])
+        self.assertEqual(result['errors'], 1)
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
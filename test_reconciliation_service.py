@@ -0,0 +1,107 @@
+import unittest
+import os
+import csv
+import json
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from data_repository import DataRepository
+from exception_handler import ExceptionHandler
+from file_operations import FileOperations
+from reconciliation_service import ReconciliationService, create_server
+from status_tracker import StatusTracker
+
+class TestReconciliationService(unittest.TestCase):
+    def setUp(self):
+        """Start a service on a free localhost port over temporary data files"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        repository = DataRepository()
+        tracker = StatusTracker(repository)
+        file_ops = FileOperations(repository)
+        handler = ExceptionHandler(repository)
+        tracker.treasury_file = self._path('TREASURY_CURRENT.csv')
+        tracker.bs_files = {'SALAM': self._path('BS_SALAM.csv'), 'MVNO': self._path('BS_MVNO.csv')}
+        tracker.cnp_files = {'SALAM': self._path('CNP_SALAM.csv'), 'MVNO': self._path('CNP_MVNO.csv')}
+        tracker.checkpoint_file = self._path('RECONCILIATION_CHECKPOINT.json')
+        file_ops.file_paths = {'Treasury': tracker.treasury_file, 'BS-SALAM': tracker.bs_files['SALAM'],
+                               'BS-MVNO': tracker.bs_files['MVNO'], 'CNP-SALAM': tracker.cnp_files['SALAM'],
+                               'CNP-MVNO': tracker.cnp_files['MVNO']}
+        handler.exception_file = self._path('EXCEPTION_LOG.csv')
+        handler.audit_file = self._path('AUDIT_LOG.csv')
+        self.handler = handler
+
+        with open(tracker.bs_files['SALAM'], 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
+            writer.writerow(['REF-009', '10.00', self.today, 'Completed', ''])
+
+        self.service = ReconciliationService(tracker, file_ops, handler, refresh_interval=0.05)
+        self.service.start()
+        self.server = create_server(self.service, port=0)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def _path(self, name):
+        """Get a file path in the temporary directory"""
+        return os.path.join(self.temp_dir, name)
+
+    def _request(self, path, body=None):
+        """Send a request; returns (status code, parsed JSON response)"""
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_1_submit_reconcile_and_status(self):
+        """Test a submitted payment is reconciled and its status served"""
+        code, result = self._request('/status/REF-001')
+        self.assertEqual((code, result['found']), (404, False))
+
+        payment = {'company': 'SALAM', 'beneficiary': 'Test', 'reference': 'REF-001', 'amount': '100.00', 'date': self.today}
+        self.assertEqual(self._request('/payments', payment)[0], 201)
+        self.assertEqual(self._request('/payments', dict(payment, reference='REF-002'))[0], 201)
+        code, result = self._request('/status/REF-001')
+        self.assertEqual((code, result['status'], result['sources']), (200, 'Under Process', ['Treasury']))
+
+        with open(self.service.tracker.bs_files['SALAM'], 'a', newline='') as f:
+            csv.writer(f).writerows([['REF-001', '100.00', self.today, 'Completed', ''],
+                                     ['REF-002', '100.00', self.today, 'Completed', '']])
+        code, result = self._request('/reconcile', {})
+        self.assertEqual((code, result['updated']), (200, 2))
+        code, result = self._request('/status/REF-001')
+        self.assertEqual((result['status'], result['company'], result['sources']), ('Paid', 'SALAM', ['Treasury', 'BS-SALAM']))
+
+    def test_2_errors(self):
+        """Test invalid payments, bodies and paths are answered with JSON errors"""
+        code, result = self._request('/payments', {'company': 'SALAM', 'reference': 'bad ref!'})
+        self.assertEqual(code, 400)
+        self.assertIn('Invalid reference format', result['errors'])
+        self.assertEqual(self._request('/payments', [1, 2])[0], 400)
+        self.assertEqual(self._request('/unknown')[0], 404)
+        self.assertEqual(self._request('/health'), (200, {'status': 'ok'}))
+
+    def test_3_open_exceptions(self):
+        """Test open exceptions are served with the status"""
+        self.handler.log_exception({'reference': 'REF-002', 'type': 'TEST'})
+        code, result = self._request('/exceptions?reference=REF-002')
+        self.assertEqual((code, [e['reference'] for e in result['open_exceptions']]), (200, ['REF-002']))
+        code, result = self._request('/status/REF-002')
+        self.assertEqual((code, len(result['exceptions'])), (404, 1))
+
+    def tearDown(self):
+        """Stop the service and remove the temporary directory"""
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
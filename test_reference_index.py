@@ -0,0 +1,128 @@
+import unittest
+import os
+import csv
+import json
+import shutil
+import tempfile
+from reference_index import ReferenceIndex, INDEX_SUFFIX, ENTRIES_SUFFIX
+
+class TestReferenceIndex(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary bank statement file"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'BS_SALAM_CURRENT.csv')
+        with open(self.file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
+            writer.writerow(['REF-001', '1000.00', '2025-01-01', 'Completed', '2025-01-01 10:00:00'])
+            writer.writerow(['REF-002', '250.00', '2025-01-02', 'Pending', '2025-01-02 10:00:00'])
+            writer.writerow(['REF-001', '75.50', '2025-01-03', 'Completed', '2025-01-03 10:00:00'])
+
+    def _append(self, *rows):
+        """Append rows to the test file"""
+        with open(self.file_path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow(row)
+
+    def test_1_lookup_returns_all_matching_rows(self):
+        """Test lookup seeks to every row with the reference"""
+        rows = ReferenceIndex(self.file_path).lookup('REF-001')
+        self.assertEqual([row['amount'] for row in rows], ['1000.00', '75.50'])
+        self.assertEqual(rows[0]['status'], 'Completed')
+
+    def test_2_lookup_missing_reference(self):
+        """Test lookup for unknown reference"""
+        index = ReferenceIndex(self.file_path)
+        self.assertEqual(index.lookup('REF-999'), [])
+        self.assertNotIn('REF-999', index)
+        self.assertIn(' REF-002 ', index)
+
+    def test_3_sidecar_persisted(self):
+        """Test the index is saved next to the CSV and reused"""
+        ReferenceIndex(self.file_path).lookup('REF-001')
+        self.assertTrue(os.path.exists(self.file_path + INDEX_SUFFIX))
+
+        reloaded = ReferenceIndex(self.file_path)
+        self.assertEqual(reloaded.state['size'], os.path.getsize(self.file_path))
+        self.assertEqual(len(reloaded.offsets['REF-001']), 2)
+
+    def test_4_append_extends_index(self):
+        """Test appended rows are indexed without a rebuild"""
+        index = ReferenceIndex(self.file_path)
+        index.refresh()
+        first_offsets = list(index.offsets['REF-001'])
+
+        self._append(['REF-003', '10.00', '2025-01-04', 'Completed', '2025-01-04 10:00:00'],
+                     ['REF-001', '20.00', '2025-01-05', 'Completed', '2025-01-05 10:00:00'])
+
+        rows = index.lookup('REF-001')
+        self.assertEqual(index.offsets['REF-001'][:2], first_offsets)
+        self.assertEqual([row['amount'] for row in rows], ['1000.00', '75.50', '20.00'])
+        self.assertEqual(index.lookup('REF-003')[0]['amount'], '10.00')
+
+    def test_5_rewrite_rebuilds_index(self):
+        """Test a rewritten file is indexed from scratch"""
+        index = ReferenceIndex(self.file_path)
+        index.refresh()
+
+        with open(self.file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
+            writer.writerow(['REF-100', '5.00', '2025-02-01', 'Completed', '2025-02-01 10:00:00'])
+
+        self.assertEqual(index.lookup('REF-001'), [])
+        self.assertEqual(index.lookup('REF-100')[0]['amount'], '5.00')
+
+    def test_6_quoted_newlines(self):
+        """Test offsets stay correct for fields containing newlines"""
+        self._append(['REF-004', '1.00', '2025-01-06', 'Completed\nManual', '2025-01-06 10:00:00'],
+                     ['REF-005', '2.00', '2025-01-07', 'Completed', '2025-01-07 10:00:00'])
+
+        index = ReferenceIndex(self.file_path)
+        self.assertEqual(index.lookup('REF-004')[0]['status'], 'Completed\nManual')
+        self.assertEqual(index.lookup('REF-005')[0]['amount'], '2.00')
+
+    def test_7_invalidate(self):
+        """Test invalidate removes the sidecar"""
+        ReferenceIndex.for_file(self.file_path).lookup('REF-001')
+        ReferenceIndex.invalidate(self.file_path)
+        self.assertFalse(os.path.exists(self.file_path + INDEX_SUFFIX))
+        self.assertFalse(os.path.exists(self.file_path + INDEX_SUFFIX + ENTRIES_SUFFIX))
+
+    def test_8_corrupt_sidecar(self):
+        """Test a corrupt sidecar is ignored and rebuilt"""
+        with open(self.file_path + INDEX_SUFFIX, 'w') as f:
+            f.write('not json')
+
+        rows = ReferenceIndex(self.file_path).lookup('REF-002')
+        self.assertEqual(rows[0]['amount'], '250.00')
+        with open(self.file_path + INDEX_SUFFIX) as f:
+            self.assertEqual(json.load(f)['state']['size'], os.path.getsize(self.file_path))
+        self.assertIn('REF-002', ReferenceIndex(self.file_path).offsets)
+
+    def test_9_append_only_writes_new_entries(self):
+        """Test a refresh after an append adds only the new entries to the entries file"""
+        ReferenceIndex(self.file_path).refresh()
+        entries_path = self.file_path + INDEX_SUFFIX + ENTRIES_SUFFIX
+        with open(entries_path, 'rb') as f:
+            entries = f.read()
+
+        offset = os.path.getsize(self.file_path)
+        self._append(['REF-003', '10.00', '2025-01-04', 'Completed', '2025-01-04 10:00:00'])
+        ReferenceIndex(self.file_path).refresh()
+        with open(entries_path, 'rb') as f:
+            appended = f.read()
+        self.assertEqual(appended, entries + f'{offset},REF-003\r\n'.encode())
+
+        reloaded = ReferenceIndex(self.file_path)
+        self.assertEqual(reloaded.lookup('REF-003')[0]['amount'], '10.00')
+        self.assertEqual(len(reloaded.offsets['REF-001']), 2)
+
+    def tearDown(self):
+        """Clean up temporary files"""
+        ReferenceIndex.invalidate(self.file_path)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
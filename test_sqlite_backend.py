@@ -0,0 +1,207 @@
+import unittest
+import os
+import csv
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+from datetime import datetime
+from data_repository import DataRepository
+from memory_backend import MemoryBackend
+from sqlite_backend import SQLiteBackend
+from status_tracker import StatusTracker
+
+class TestSQLiteBackend(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary database"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        self.backend = SQLiteBackend(os.path.join(self.temp_dir, 'payments.db'))
+
+    def _path(self, name):
+        """Get a dataset path in the temporary directory"""
+        return os.path.join(self.temp_dir, name)
+
+    def _fill(self, backend, dataset):
+        """Append the same payments to a backend"""
+        backend.append_payment(dataset, {'reference': 'REF-001', 'amount': '10.00', 'status': 'Under Process', 'company': ''})
+        backend.append_payment(dataset, {'reference': ' REF-002 ', 'amount': 20, 'status': 'Under Process', 'company': 'MVNO'})
+        backend.append_payment(dataset, {'reference': 'REF-001', 'amount': '30.00', 'status': 'Paid', 'company': 'SALAM',
+                                         'unknown': 'dropped'})
+
+    def test_1_wal_and_indexes(self):
+        """Test the database is in WAL mode and datasets are indexed on reference, company, status and date"""
+        dataset = self._path('TREASURY.csv')
+        self._fill(self.backend, dataset)
+        db = self.backend._connect()
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        table = db.execute('SELECT table_name FROM datasets WHERE name = ?', (os.path.abspath(dataset),)).fetchone()[0]
+        indexed = {db.execute(f'PRAGMA index_info("{name}")').fetchone()[2]
+                   for _, name, *_ in db.execute(f'PRAGMA index_list("{table}")')}
+        self.assertEqual(indexed, {'_ref', 'company', 'status', 'date'})
+        plan = db.execute(f'EXPLAIN QUERY PLAN SELECT * FROM "{table}" WHERE _ref = ?', ('REF-001',)).fetchall()
+        self.assertIn('USING INDEX', plan[0][-1])
+
+    def test_2_matches_memory_backend(self):
+        """Test the SQLite and in-memory backends give the same results for the protocol operations"""
+        results = []
+        for backend in (MemoryBackend(), self.backend):
+            dataset = self._path('TREASURY.csv')
+            self._fill(backend, dataset)
+            changes = backend.update_status(dataset, {
+                'REF-001': {'status': 'CNP', 'company': 'SALAM'},
+                'REF-002': {'status': 'Paid', 'company': 'SALAM'}
+            }, where_status='Under Process', fill_fields=('company',))
+            results.append((
+                changes,
+                [dict(record) for record in backend.get_records(dataset)],
+                [record['amount'] for record in backend.find(dataset, 'REF-002')],
+                [record['reference'] for record in backend.scan(dataset, status='Paid', company=lambda c: c != 'SALAM')],
+                backend.lookup_amounts(dataset, 'REF-001', first_row=1),
+                backend.amount_index(dataset).amounts.tolist(),
+                backend.get_fieldnames(dataset)
+            ))
+
+        self.assertEqual(results[0], results[1])
+        changes, records = results[1][:2]
+        self.assertEqual([row for row, _ in changes], [1, 2])
+        self.assertEqual(changes[0][1]['status'], 'Under Process')
+        self.assertEqual([(r['status'], r['company']) for r in records],
+                         [('CNP', 'SALAM'), ('Paid', 'MVNO'), ('Paid', 'SALAM')])
+
+    def test_3_update_reference_and_amount(self):
+        """Test updating the reference and amount keeps the lookup columns in step"""
+        dataset = self._path('BS_SALAM.csv')
+        self._fill(self.backend, dataset)
+        position, rows, fingerprint = self.backend.read_position(dataset)
+        self.backend.update_status(dataset, {'REF-002': {'reference': 'REF-003', 'amount': '25.50'}})
+        self.assertEqual(self.backend.find(dataset, 'REF-002'), [])
+        self.assertEqual(self.backend.lookup_amounts(dataset, 'REF-003'), [(2550, 'Under Process')])
+        self.assertTrue(self.backend.position_valid(dataset, position, fingerprint))
+        self.assertEqual(self.backend.update_status(dataset, {'REF-404': {'status': 'Paid'}}), [])
+        with self.assertRaises(ValueError):
+            self.backend.update_status(dataset, {'REF-001': {'missing': 'x'}})
+
+        self.backend.write_records(dataset, self.backend.get_fieldnames(dataset), self.backend.get_records(dataset))
+        self.assertFalse(self.backend.position_valid(dataset, position, fingerprint))
+
+    def test_4_migrate_and_export(self):
+        """Test CSV files are migrated into the database and exported back for Excel"""
+        file_path = self._path('BS_MVNO.csv')
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['reference', 'amount', 'date', 'status', 'timestamp'])
+            writer.writerow(['REF-010', '1,000.00', '2025-01-01', 'Completed', '2025-01-01 10:00:00'])
+            writer.writerow(['REF-011', '5.00', '2025-01-02', 'Pending', '2025-01-02 10:00:00'])
+
+        counts = self.backend.migrate_from_csv([file_path, self._path('MISSING.csv')])
+        self.assertEqual(counts, {file_path: 2})
+        self.assertEqual(self.backend.get_records(file_path), DataRepository().get_records(file_path))
+
+        output_file = self._path('export.csv')
+        self.assertEqual(self.backend.export_csv(file_path, output_file), 2)
+        with open(output_file, 'rb') as f:
+            self.assertTrue(f.read().startswith(b'\xef\xbb\xbfreference,amount'))
+        with open(output_file, newline='', encoding='utf-8-sig') as f:
+            self.assertEqual(list(csv.DictReader(f)), self.backend.get_records(file_path))
+
+    def test_5_status_tracker(self):
+        """Test full and incremental reconciliation run against the SQLite backend"""
+        tracker = StatusTracker(repository=self.backend)
+        tracker.treasury_file = self._path('TREASURY_CURRENT.csv')
+        tracker.bs_files = {'SALAM': self._path('BS_SALAM.csv'), 'MVNO': self._path('BS_MVNO.csv')}
+        tracker.cnp_files = {'SALAM': self._path('CNP_SALAM.csv'), 'MVNO': self._path('CNP_MVNO.csv')}
+        tracker.checkpoint_file = self._path('RECONCILIATION_CHECKPOINT.json')
+
+        self.backend.append_payment(tracker.treasury_file, {'reference': 'REF-020', 'amount': '40.00', 'date': self.today,
+                                                            'status': 'Under Process', 'company': 'SALAM'})
+        for dataset in list(tracker.bs_files.values()) + list(tracker.cnp_files.values()):
+            self.backend.write_records(dataset, ['reference', 'amount', 'date', 'status', 'timestamp'], [])
+
+        first = tracker.update_all_statuses()
+        self.assertEqual((first['mode'], first['updated']), ('full', 0))
+
+        self.backend.append_payment(tracker.bs_files['SALAM'], {'reference': 'REF-020', 'amount': '40.00',
+                                                                'date': self.today, 'status': 'Completed'})
+        second = tracker.update_all_statuses()
+        self.assertEqual((second['mode'], second['updated']), ('incremental', 1))
+        record = self.backend.find(tracker.treasury_file, 'REF-020')[0]
+        self.assertEqual((record['status'], record['company']), ('Paid', 'SALAM'))
+
+    def test_6_reader_during_write(self):
+        """Test another thread reads the last committed data while a write transaction is open"""
+        dataset = self._path('TREASURY.csv')
+        self._fill(self.backend, dataset)
+        seen = []
+        with self.backend._transaction() as db:
+            db.execute('UPDATE datasets SET rows = rows + 1')
+            reader = threading.Thread(target=lambda: seen.append(self.backend.read_position(dataset)[1]))
+            reader.start()
+            reader.join(5)
+            self.assertFalse(reader.is_alive())
+            db.execute('UPDATE datasets SET rows = rows - 1')
+        self.assertEqual(seen, [3])
+
+    def test_7_match_amounts_join(self):
+        """Test the set-based amount match agrees with the per-reference lookups and reconciliation uses it"""
+        dataset = self._path('BS_SALAM.csv')
+        self._fill(self.backend, dataset)
+        self.backend.append_payment(dataset, {'reference': 'REF-001', 'amount': '10.00', 'status': 'Completed'})
+        lookups = [('REF-001', 1000, 0), ('REF-001', 1000, 1), ('REF-001', 1001, 0), (' REF-002', 2000, 0),
+                   ('REF-001', 3000, 0), ('REF-404', 1000, 0)]
+        expected = ['Under Process', 'Completed', None, 'Under Process', 'Paid', None]
+        self.assertEqual(self.backend.match_amounts(dataset, lookups), expected)
+        self.assertEqual(MemoryBackend.match_amounts(self.backend, dataset, lookups), expected)
+        self.assertEqual(self.backend.match_amounts(dataset, lookups, tolerance_cents=2)[2], 'Under Process')
+
+        tracker = StatusTracker(repository=self.backend)
+        tracker.treasury_file = self._path('TREASURY_CURRENT.csv')
+        tracker.bs_files = {'SALAM': dataset, 'MVNO': self._path('BS_MVNO.csv')}
+        tracker.cnp_files = {'SALAM': self._path('CNP_SALAM.csv'), 'MVNO': self._path('CNP_MVNO.csv')}
+        tracker.checkpoint_file = self._path('RECONCILIATION_CHECKPOINT.json')
+        self.backend.append_payment(dataset, {'reference': 'REF-003', 'amount': '5.00', 'status': 'Completed'})
+        for reference in ('REF-001', 'REF-003'):
+            self.backend.append_payment(tracker.treasury_file, {'reference': reference, 'amount': '5.00',
+                                                                'date': self.today, 'status': 'Under Process'})
+        # Every lookup is answered by the join, none row by row
+        self.backend.lookup_amounts = None
+        results = tracker.update_all_statuses()
+        self.assertEqual((results['updated'], results['errors']), (1, 0))
+        self.assertEqual([(r['status'], r['company']) for r in self.backend.get_records(tracker.treasury_file)],
+                         [('Under Process', ''), ('Paid', 'SALAM')])
+
+    def test_8_prefetch_in_chunks(self):
+        """Test matching prefetches a chunk at a time, reporting progress and stopping on cancel between chunks"""
+        tracker = StatusTracker(repository=self.backend)
+        tracker.treasury_file = self._path('TREASURY_CURRENT.csv')
+        tracker.bs_files = {'SALAM': self._path('BS_SALAM.csv'), 'MVNO': self._path('BS_MVNO.csv')}
+        tracker.cnp_files = {'SALAM': self._path('CNP_SALAM.csv'), 'MVNO': self._path('CNP_MVNO.csv')}
+        tracker.checkpoint_file = self._path('RECONCILIATION_CHECKPOINT.json')
+        self.backend.write_records(tracker.treasury_file, ['reference', 'amount', 'date', 'status', 'company'], [
+            {'reference': f'REF-{number}', 'amount': '1.00', 'date': self.today, 'status': 'Under Process',
+             'company': 'SALAM'} for number in range(10)
+        ])
+        self.backend.write_records(tracker.bs_files['SALAM'], ['reference', 'amount', 'date', 'status'], [])
+
+        cancel_event = threading.Event()
+        progress = []
+
+        def report(done, total):
+            progress.append(done)
+            if done == 4:
+                cancel_event.set()
+
+        with patch('status_tracker.PREFETCH_CHUNK', 3), \
+             patch.object(SQLiteBackend, 'match_amounts', autospec=True, return_value=[]) as match_amounts:
+            results = tracker.update_all_statuses(progress_callback=report, cancel_event=cancel_event)
+        self.assertTrue(results['cancelled'])
+        self.assertEqual(progress, [0, 1, 2, 3, 4])
+        self.assertEqual(match_amounts.call_count, 2)
+
+    def tearDown(self):
+        """Close the database and remove the temporary directory"""
+        self.backend.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,448 @@
+import unittest
+import os
+import csv
+import json
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from column_snapshot import ColumnSnapshot
+from data_repository import DataRepository
+from reconciliation_engine import ReconciliationEngine
+from status_tracker import StatusTracker, _init_shard_worker, _match_shard, _shard_worker
+from reconciliation_engine import ReconciliationEngine
+
+class TestStatusTracker(unittest.TestCase):
+    def setUp(self):
+        """Set up tracker pointing at temporary data files"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.tracker = StatusTracker()
+        self.tracker.treasury_file = os.path.join(self.temp_dir, 'TREASURY_CURRENT.csv')
+        self.tracker.bs_files = {
+            'SALAM': os.path.join(self.temp_dir, 'BS_SALAM_CURRENT.csv'),
+            'MVNO': os.path.join(self.temp_dir, 'BS_MVNO_CURRENT.csv')
+        }
+        self.tracker.cnp_files = {
+            'SALAM': os.path.join(self.temp_dir, 'CNP_SALAM_CURRENT.csv'),
+            'MVNO': os.path.join(self.temp_dir, 'CNP_MVNO_CURRENT.csv')
+        }
+        self.tracker.checkpoint_file = os.path.join(self.temp_dir, 'RECONCILIATION_CHECKPOINT.json')
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        self.old_date = (datetime.now() - timedelta(days=45)).strftime('%Y-%m-%d')
+
+    def _write_rows(self, file_path, rows, headers=None):
+        """Write rows to a CSV file with the standard headers"""
+        headers = headers or ['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary']
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=headers, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+
+    def _read_treasury(self):
+        """Read Treasury rows keyed by reference"""
+        with open(self.tracker.treasury_file, 'r', newline='') as f:
+            return {row['reference']: row for row in csv.DictReader(f)}
+
+    def test_1_current_payment_prefers_bank_statement(self):
+        """Test current payments are matched against BS before CNP"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-001', 'amount': '1000.00', 'date': self.today, 'status': 'Under Process', 'company': 'SALAM'}
+        ])
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-001', 'amount': '1000.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self._write_rows(self.tracker.cnp_files['SALAM'], [
+            {'reference': 'REF-001', 'amount': '1000.00', 'date': self.today, 'status': 'Pending'}
+        ])
+
+        results = self.tracker.update_all_statuses()
+
+        self.assertEqual(results['updated'], 1)
+        self.assertEqual(self._read_treasury()['REF-001']['status'], 'Paid')
+
+    def test_2_old_payment_prefers_cnp(self):
+        """Test old payments are matched against CNP before BS"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-002', 'amount': '500.00', 'date': self.old_date, 'status': 'Under Process', 'company': 'SALAM'}
+        ])
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-002', 'amount': '500.00', 'date': self.old_date, 'status': 'Completed'}
+        ])
+        self._write_rows(self.tracker.cnp_files['SALAM'], [
+            {'reference': 'REF-002', 'amount': '500.00', 'date': self.old_date, 'status': 'Pending'}
+        ])
+
+        self.tracker.update_all_statuses()
+
+        self.assertEqual(self._read_treasury()['REF-002']['status'], 'CNP')
+
+    def test_3_amount_tolerance(self):
+        """Test amounts must agree within 0.01"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-003', 'amount': '100.00', 'date': self.today, 'status': 'Under Process', 'company': 'MVNO'},
+            {'reference': 'REF-004', 'amount': '100.00', 'date': self.today, 'status': 'Under Process', 'company': 'MVNO'}
+        ])
+        self._write_rows(self.tracker.bs_files['MVNO'], [
+            {'reference': 'REF-003', 'amount': '100.005', 'date': self.today, 'status': 'Completed'},
+            {'reference': 'REF-004', 'amount': '100.50', 'date': self.today, 'status': 'Completed'}
+        ])
+
+        self.tracker.update_all_statuses()
+
+        treasury = self._read_treasury()
+        self.assertEqual(treasury['REF-003']['status'], 'Paid')
+        self.assertEqual(treasury['REF-004']['status'], 'Under Process')
+
+    def test_4_engine_matches_check_payment_status(self):
+        """Test the engine agrees with the per-payment file scan"""
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-005', 'amount': '250.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self._write_rows(self.tracker.cnp_files['MVNO'], [
+            {'reference': 'REF-006', 'amount': '75.00', 'date': self.old_date, 'status': 'Pending'}
+        ])
+        engine = ReconciliationEngine(self.tracker.bs_files, self.tracker.cnp_files).load()
+
+        payments = [
+            {'reference': 'REF-005', 'amount': '250.00', 'date': self.today},
+            {'reference': 'REF-006', 'amount': '75.00', 'date': self.old_date},
+            {'reference': 'REF-007', 'amount': '10.00', 'date': self.today}
+        ]
+        for payment in payments:
+            is_old = self.tracker.is_previous_month_payment(payment['date'])
+            self.assertEqual(
+                engine.match_payment(payment, '', is_old),
+                self.tracker.check_payment_status(payment)
+            )
+
+    def test_5_change_set(self):
+        """Test update returns one change per updated Treasury row"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-010', 'amount': '10.00', 'date': self.today, 'status': 'Under Process', 'company': ''},
+            {'reference': 'REF-011', 'amount': '20.00', 'date': self.today, 'status': 'Paid', 'company': 'SALAM'},
+            {'reference': 'REF-012', 'amount': '30.00', 'date': self.today, 'status': 'Under Process', 'company': 'SALAM'}
+        ])
+        self._write_rows(self.tracker.bs_files['MVNO'], [
+            {'reference': 'REF-010', 'amount': '10.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-012', 'amount': '30.00', 'date': self.today, 'status': 'Completed'}
+        ])
+
+        results = self.tracker.update_all_statuses()
+
+        changes = {change['reference']: change for change in results['changes']}
+        self.assertEqual(set(changes), {'REF-010', 'REF-012'})
+        self.assertEqual(changes['REF-010']['row'], 1)
+        self.assertEqual(changes['REF-010']['old_status'], 'Under Process')
+        self.assertEqual(changes['REF-010']['new_status'], 'Paid')
+        self.assertEqual(changes['REF-010']['company'], 'MVNO')
+        self.assertEqual(changes['REF-012']['row'], 3)
+
+        treasury = self._read_treasury()
+        self.assertEqual(treasury['REF-010']['company'], 'MVNO')
+        self.assertEqual(treasury['REF-011']['status'], 'Paid')
+
+    def _append_rows(self, file_path, rows):
+        """Append rows to an existing CSV file"""
+        headers = ['reference', 'amount', 'date', 'status', 'timestamp', 'company', 'beneficiary']
+        with open(file_path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=headers, extrasaction='ignore')
+            for row in rows:
+                writer.writerow(row)
+
+    def test_6_incremental_run_matches_appended_rows(self):
+        """Test a second run only reads statement rows appended since the checkpoint"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-020', 'amount': '40.00', 'date': self.today, 'status': 'Under Process', 'company': 'SALAM'}
+        ])
+        for file_path in list(self.tracker.bs_files.values()) + list(self.tracker.cnp_files.values()):
+            self._write_rows(file_path, [])
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-OTHER', 'amount': '1.00', 'date': self.today, 'status': 'Completed'}
+        ])
+
+        first = self.tracker.update_all_statuses()
+        self.assertEqual(first['mode'], 'full')
+        self.assertEqual(first['updated'], 0)
+
+        self._append_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-020', 'amount': '40.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        with patch.object(ReconciliationEngine, 'load', autospec=True,
+                          side_effect=ReconciliationEngine.load) as mock_load:
+            second = self.tracker.update_all_statuses()
+
+        self.assertEqual(second['mode'], 'incremental')
+        start_offsets = mock_load.call_args[0][1]
+        self.assertGreater(start_offsets[self.tracker.bs_files['SALAM']], 0)
+        self.assertEqual(self._read_treasury()['REF-020']['status'], 'Paid')
+
+        with open(self.tracker.checkpoint_file) as f:
+            checkpoint = json.load(f)
+        self.assertEqual(checkpoint['files'][self.tracker.bs_files['SALAM']]['rows'], 2)
+        self.assertEqual(checkpoint['pending'], {})
+
+    def test_7_incremental_run_checks_new_payments_fully(self):
+        """Test payments added after the checkpoint are matched against earlier rows"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-030', 'amount': '15.00', 'date': self.today, 'status': 'Under Process', 'company': 'MVNO'}
+        ])
+        self._write_rows(self.tracker.bs_files['MVNO'], [
+            {'reference': 'REF-031', 'amount': '16.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self.tracker.update_all_statuses()
+
+        self._append_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-031', 'amount': '16.00', 'date': self.today, 'status': 'Under Process', 'company': 'MVNO'}
+        ])
+        results = self.tracker.update_all_statuses()
+
+        self.assertEqual(results['mode'], 'incremental')
+        treasury = self._read_treasury()
+        self.assertEqual(treasury['REF-031']['status'], 'Paid')
+        self.assertEqual(treasury['REF-030']['status'], 'Under Process')
+
+    def test_8_old_cnp_payments_not_rechecked(self):
+        """Test old payments already in CNP are left alone"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-040', 'amount': '70.00', 'date': self.old_date, 'status': 'CNP', 'company': 'SALAM'}
+        ])
+        self._write_rows(self.tracker.cnp_files['SALAM'], [
+            {'reference': 'REF-040', 'amount': '70.00', 'date': self.old_date, 'status': 'Pending'}
+        ])
+
+        results = self.tracker.update_all_statuses()
+
+        self.assertEqual(results['updated'], 0)
+        self.assertEqual(results['changes'], [])
+
+    def test_9_rewritten_statement_forces_full_run(self):
+        """Test a statement file that no longer extends the checkpoint triggers a full run"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-050', 'amount': '5.00', 'date': self.today, 'status': 'Under Process', 'company': 'SALAM'}
+        ])
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-051', 'amount': '5.00', 'date': self.today, 'status': 'Completed'},
+            {'reference': 'REF-052', 'amount': '5.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self.tracker.update_all_statuses()
+
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-050', 'amount': '5.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        results = self.tracker.update_all_statuses()
+
+        self.assertEqual(results['mode'], 'full')
+        self.assertEqual(self._read_treasury()['REF-050']['status'], 'Paid')
+
+    def test_10_progress_and_cancel(self):
+        """Test progress is reported per payment and cancel stops without writing"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': f'REF-06{i}', 'amount': '1.00', 'date': self.today, 'status': 'Under Process', 'company': 'SALAM'}
+            for i in range(3)
+        ])
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': f'REF-06{i}', 'amount': '1.00', 'date': self.today, 'status': 'Completed'}
+            for i in range(3)
+        ])
+        cancel_event = threading.Event()
+        progress = []
+
+        def on_progress(done, total):
+            progress.append((done, total))
+            if done == 1:
+                cancel_event.set()
+
+        results = self.tracker.update_all_statuses(progress_callback=on_progress, cancel_event=cancel_event)
+
+        self.assertTrue(results['cancelled'])
+        self.assertEqual(progress, [(0, 3), (1, 3)])
+        self.assertEqual(self._read_treasury()['REF-060']['status'], 'Under Process')
+        self.assertFalse(os.path.exists(self.tracker.checkpoint_file))
+
+        progress.clear()
+        results = self.tracker.update_all_statuses(progress_callback=lambda done, total: progress.append(done))
+        self.assertFalse(results['cancelled'])
+        self.assertEqual(progress[-1], 3)
+        self.assertEqual(results['updated'], 3)
+
+    def test_11_missing_treasury(self):
+        """Test update with no Treasury file"""
+        results = self.tracker.update_all_statuses()
+        self.assertEqual(results['updated'], 0)
+        self.assertIn("Treasury file not found", results['details'])
+
+    def test_12_update_status_point_lookup(self):
+        """Test one reference is resolved without a write and returned with its sources and exceptions"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-001', 'amount': '1000.00', 'date': self.today, 'status': 'Under Process',
+             'timestamp': '2025-01-01 10:00:00', 'company': ''},
+            {'reference': 'REF-002', 'amount': '50.00', 'date': self.today, 'status': 'Under Process', 'company': 'MVNO'}
+        ])
+        self._write_rows(self.tracker.bs_files['MVNO'], [
+            {'reference': 'REF-001', 'amount': '1000.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self._write_rows(self.tracker.cnp_files['SALAM'], [
+            {'reference': 'REF-001', 'amount': '999.00', 'date': self.today, 'status': 'Pending'}
+        ])
+
+        class Exceptions:
+            def get_open_exceptions(self, reference):
+                return [{'reference': reference, 'type': 'TEST'}]
+
+        with patch.object(self.tracker.repository, 'lookup_amounts',
+                          wraps=self.tracker.repository.lookup_amounts) as mock_lookup:
+            status_data = self.tracker.update_status(' REF-001 ', Exceptions())
+        self.assertEqual((status_data['status'], status_data['company']), ('Paid', 'MVNO'))
+        self.assertEqual(status_data['sources'], ['Treasury', 'BS-MVNO', 'CNP-SALAM'])
+        self.assertEqual(status_data['exceptions'], [{'reference': 'REF-001', 'type': 'TEST'}])
+        self.assertEqual(status_data['timestamp'], '2025-01-01 10:00:00')
+        # Each existing BS/CNP file is looked up once, for the match and the sources alike
+        self.assertEqual(mock_lookup.call_count, 2)
+        treasury = self._read_treasury()
+        self.assertEqual((treasury['REF-001']['status'], treasury['REF-002']['status']),
+                         ('Under Process', 'Under Process'))
+
+        unchanged = self.tracker.update_status('REF-002')
+        self.assertEqual((unchanged['status'], unchanged['sources'], unchanged['exceptions']),
+                         ('Under Process', ['Treasury'], []))
+        self.assertEqual(self.tracker.update_status('REF-404')['status'], 'Not Found')
+
+    def test_13_iter_statuses(self):
+        """Test batch statuses load each file once and stream results for references and pairs"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': 'REF-001', 'amount': '1000.00', 'date': self.today, 'status': 'Under Process', 'company': 'SALAM'},
+            {'reference': 'REF-002', 'amount': '50.00', 'date': self.old_date, 'status': 'CNP', 'company': 'MVNO'},
+            {'reference': 'REF-003', 'amount': '75.00', 'date': self.today, 'status': 'Under Process', 'company': ''}
+        ])
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-001', 'amount': '1000.00', 'date': self.today, 'status': 'Completed'},
+            {'reference': 'REF-009', 'amount': '20.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self._write_rows(self.tracker.cnp_files['MVNO'], [
+            {'reference': 'REF-002', 'amount': '50.00', 'date': self.old_date, 'status': 'Pending'}
+        ])
+
+        items = iter(['REF-001', 'REF-002', ('REF-009', '20.00'), ('REF-009', 30), 'REF-003', 'REF-404'])
+        with patch.object(ReconciliationEngine, 'load', autospec=True, side_effect=ReconciliationEngine.load) as load:
+            statuses = self.tracker.iter_statuses(items)
+            first = next(statuses)
+            # Later items are not read before they are needed
+            self.assertEqual(next(items), 'REF-002')
+            rest = list(statuses)
+        self.assertEqual(load.call_count, 1)
+
+        self.assertEqual((first['status'], first['found_in'], first['company']), ('Paid', 'BS', 'SALAM'))
+        self.assertEqual([(s['reference'], s['status'], s['treasury_status'], s['company']) for s in rest], [
+            ('REF-009', 'Paid', None, 'SALAM'),
+            ('REF-009', 'Not Found', None, ''),
+            ('REF-003', 'Under Process', 'Under Process', ''),
+            ('REF-404', 'Not Found', None, '')
+        ])
+        self.assertEqual(self._read_treasury()['REF-001']['status'], 'Under Process')
+
+    def test_14_parallel_matches_serial(self):
+        """Test sharded process-pool runs give the same changes and checkpoint as a serial run"""
+        payments = []
+        bs_rows = {'SALAM': [], 'MVNO': []}
+        cnp_rows = {'SALAM': [], 'MVNO': []}
+        for number in range(40):
+            company = ('SALAM', 'MVNO', '')[number % 3]
+            date = self.old_date if number % 4 == 0 else self.today
+            payments.append({'reference': f'REF-{number:03d}', 'amount': f'{number + 1}.00', 'date': date,
+                             'status': 'CNP' if number % 10 == 0 else 'Under Process', 'company': company})
+            statement = {'reference': f'REF-{number:03d}', 'amount': f'{number + 1}.00', 'date': date, 'status': 'Completed'}
+            if number % 5 == 1:
+                bs_rows[company or 'MVNO'].append(statement)
+            elif number % 5 == 2:
+                cnp_rows[company or 'SALAM'].append(dict(statement, status='Pending'))
+        payments.append({'reference': 'REF-999', 'amount': '1.00', 'date': self.today, 'status': 'Under Process',
+                         'company': 'OTHER'})
+        for company in ('SALAM', 'MVNO'):
+            self._write_rows(self.tracker.bs_files[company], bs_rows[company])
+            self._write_rows(self.tracker.cnp_files[company], cnp_rows[company])
+
+        runs = []
+        for workers in (None, 2):
+            self._write_rows(self.tracker.treasury_file, payments)
+            if os.path.exists(self.tracker.checkpoint_file):
+                os.remove(self.tracker.checkpoint_file)
+            progress = []
+            results = self.tracker.update_all_statuses(workers=workers, hash_shards=3,
+                                                       progress_callback=lambda done, total: progress.append(done))
+            with open(self.tracker.checkpoint_file, 'r') as f:
+                checkpoint = json.load(f)
+            changes = [{key: value for key, value in change.items() if key != 'timestamp'} for change in results['changes']]
+            runs.append((results['updated'], results['errors'], changes, checkpoint['pending'],
+                         {ref: row['status'] for ref, row in self._read_treasury().items()}))
+            self.assertEqual(progress[-1], len(payments))
+
+        self.assertEqual(runs[0], runs[1])
+        updated, errors, _, _, statuses = runs[1]
+        self.assertEqual(errors, 1)
+        self.assertGreater(updated, 10)
+        self.assertEqual(statuses['REF-001'], 'Paid')
+
+    def test_15_shard_worker_setup(self):
+        """Test a worker takes the parent's positions and uses the saved snapshots without checking the files"""
+        self._write_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-001', 'amount': '10.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        self._write_rows(self.tracker.cnp_files['SALAM'], [])
+        engine = ReconciliationEngine(self.tracker.bs_files, self.tracker.cnp_files,
+                                      repository=self.tracker.repository).load()
+        settings = {'bs_files': self.tracker.bs_files, 'cnp_files': self.tracker.cnp_files, 'delay_threshold': 30,
+                    'first_rows': engine.first_rows, 'checkpoints': engine.checkpoints}
+        payment = {'reference': 'REF-001', 'amount': '10.00', 'date': self.today, 'status': 'Under Process',
+                   'company': 'SALAM'}
+
+        # A fresh worker has no snapshots of its own yet
+        with patch.dict(ColumnSnapshot._instances, clear=True), \
+                patch.object(DataRepository, 'read_position') as read_position, \
+                patch('column_snapshot.file_stat') as file_stat:
+            with patch('builtins.print') as printed, patch('os.makedirs') as makedirs:
+                _init_shard_worker(settings, None)
+            printed.assert_not_called()
+            # Only the snapshot lock files are opened, in directories the parent created
+            self.assertTrue(all(call.args[0].endswith('.columns') for call in makedirs.call_args_list))
+            outcomes = _match_shard([payment], {})
+        read_position.assert_not_called()
+        file_stat.assert_not_called()
+        self.assertEqual(_shard_worker['engine'].first_rows, engine.first_rows)
+        self.assertEqual(outcomes[0][0]['new_status'], 'Paid')
+
+    def test_16_incremental_run_scales_with_appended_rows(self):
+        """Test a resumed run only looks up pending payments whose references were appended"""
+        self._write_rows(self.tracker.treasury_file, [
+            {'reference': f'REF-{number:03d}', 'amount': '10.00', 'date': self.today, 'status': 'Under Process',
+             'company': ('SALAM', 'MVNO', '')[number % 3]} for number in range(30)
+        ])
+        for file_path in list(self.tracker.bs_files.values()) + list(self.tracker.cnp_files.values()):
+            self._write_rows(file_path, [{'reference': 'REF-OTHER', 'amount': '1.00', 'date': self.today,
+                                          'status': 'Completed'}])
+        self.assertEqual(self.tracker.update_all_statuses()['updated'], 0)
+
+        repository = self.tracker.repository
+        with patch.object(repository, 'lookup_amounts', wraps=repository.lookup_amounts) as lookup_amounts:
+            results = self.tracker.update_all_statuses()
+        self.assertEqual((results['mode'], results['updated']), ('incremental', 0))
+        self.assertEqual(lookup_amounts.call_count, 0)
+
+        self._append_rows(self.tracker.bs_files['SALAM'], [
+            {'reference': 'REF-003', 'amount': '10.00', 'date': self.today, 'status': 'Completed'}
+        ])
+        with patch.object(repository, 'lookup_amounts', wraps=repository.lookup_amounts) as lookup_amounts:
+            results = self.tracker.update_all_statuses()
+        self.assertEqual((results['mode'], results['updated']), ('incremental', 1))
+        self.assertEqual({call.args[1] for call in lookup_amounts.call_args_list}, {'REF-003'})
+        self.assertEqual(self._read_treasury()['REF-003']['status'], 'Paid')
+
+    def tearDown(self):
+        """Clean up temporary files"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from audit_trail import AuditTrail
+from data_repository import DataRepository
+from exception_handler import ExceptionHandler
+from file_operations import FileOperations
+from memory_backend import MemoryBackend
+from status_tracker import StatusTracker
+from storage_backend import StorageBackend
+
+class TestStorageBackend(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary directory for dataset paths"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.today = datetime.now().strftime('%Y-%m-%d')
+
+    def _path(self, name):
+        """Get a dataset path in the temporary directory"""
+        return os.path.join(self.temp_dir, name)
+
+    def _fill(self, backend, dataset):
+        """Append the same payments to a backend"""
+        backend.append_payment(dataset, {'reference': 'REF-001', 'amount': '10.00', 'status': 'Under Process', 'company': ''})
+        backend.append_payment(dataset, {'reference': 'REF-002', 'amount': 20, 'status': 'Under Process', 'company': 'MVNO'})
+        backend.append_payment(dataset, {'reference': 'REF-001', 'amount': '30.00', 'status': 'Paid', 'company': 'SALAM',
+                                         'unknown': 'dropped'})
+
+    def test_1_backends_agree(self):
+        """Test the CSV and in-memory backends give the same results for the protocol operations"""
+        results = []
+        for backend in (DataRepository(), MemoryBackend()):
+            dataset = self._path(f'TREASURY_{type(backend).__name__}.csv')
+            self._fill(backend, dataset)
+            changes = backend.update_status(dataset, {
+                'REF-001': {'status': 'CNP', 'company': 'SALAM'},
+                'REF-002': {'status': 'Paid', 'company': 'SALAM'}
+            }, where_status='Under Process', fill_fields=('company',))
+            results.append((
+                [row for row, _ in changes],
+                [dict(record) for record in backend.get_records(dataset)],
+                [record['reference'] for record in backend.find(dataset, ' REF-001 ')],
+                [record['amount'] for record in backend.scan(dataset, status='Paid')],
+                backend.lookup_amounts(dataset, 'REF-001', first_row=1),
+                backend.amount_index(dataset).amounts.tolist()
+            ))
+
+        self.assertEqual(results[0], results[1])
+        rows, records, found, scanned, amounts, index = results[1]
+        self.assertEqual(rows, [1, 2])
+        self.assertEqual([(r['status'], r['company']) for r in records],
+                         [('CNP', 'SALAM'), ('Paid', 'MVNO'), ('Paid', 'SALAM')])
+        self.assertEqual(found, ['REF-001', 'REF-001'])
+        self.assertEqual(scanned, ['20', '30.00'])
+        self.assertEqual(amounts, [(3000, 'Paid')])
+        self.assertEqual(index, [1000, 2000, 3000])
+
+    def test_2_memory_positions(self):
+        """Test positions survive appends and are invalidated by a rewrite"""
+        backend = MemoryBackend()
+        dataset = self._path('BS.csv')
+        self.assertFalse(backend.exists(dataset))
+        self.assertEqual(backend.read_position(dataset), (0, 0, ''))
+
+        self._fill(backend, dataset)
+        position, rows, fingerprint = backend.read_position(dataset)
+        self.assertEqual((position, rows), (3, 3))
+        backend.append_payment(dataset, {'reference': 'REF-003', 'amount': '5.00', 'status': 'Completed'})
+        self.assertTrue(backend.position_valid(dataset, position, fingerprint))
+        self.assertEqual(backend.lookup_amounts(dataset, 'REF-003', backend.row_at(dataset, position)), [(500, 'Completed')])
+
+        backend.write_records(dataset, backend.get_fieldnames(dataset), backend.get_records(dataset))
+        self.assertFalse(backend.position_valid(dataset, position, fingerprint))
+
+    def test_3_status_tracker_in_memory(self):
+        """Test full and incremental reconciliation run against the in-memory backend"""
+        backend = MemoryBackend()
+        tracker = StatusTracker(repository=backend)
+        tracker.treasury_file = self._path('TREASURY_CURRENT.csv')
+        tracker.bs_files = {'SALAM': self._path('BS_SALAM.csv'), 'MVNO': self._path('BS_MVNO.csv')}
+        tracker.cnp_files = {'SALAM': self._path('CNP_SALAM.csv'), 'MVNO': self._path('CNP_MVNO.csv')}
+        tracker.checkpoint_file = self._path('RECONCILIATION_CHECKPOINT.json')
+
+        backend.append_payment(tracker.treasury_file, {'reference': 'REF-010', 'amount': '40.00', 'date': self.today,
+                                                       'status': 'Under Process', 'company': 'SALAM'})
+        for dataset in list(tracker.bs_files.values()) + list(tracker.cnp_files.values()):
+            backend.write_records(dataset, ['reference', 'amount', 'date', 'status', 'timestamp'], [])
+
+        first = tracker.update_all_statuses()
+        self.assertEqual((first['mode'], first['updated']), ('full', 0))
+
+        backend.append_payment(tracker.bs_files['SALAM'], {'reference': 'REF-010', 'amount': '40.00',
+                                                           'date': self.today, 'status': 'Completed'})
+        second = tracker.update_all_statuses()
+        self.assertEqual((second['mode'], second['updated']), ('incremental', 1))
+        self.assertEqual(backend.find(tracker.treasury_file, 'REF-010')[0]['status'], 'Paid')
+        self.assertEqual(os.listdir(self.temp_dir), ['RECONCILIATION_CHECKPOINT.json'])
+
+    def test_4_exceptions_and_audit_in_memory(self):
+        """Test exceptions and audit events are kept in the in-memory backend"""
+        backend = MemoryBackend()
+        handler = ExceptionHandler(repository=backend)
+        handler.exception_file = self._path('EXCEPTION_LOG.csv')
+        handler.audit_file = self._path('AUDIT_LOG.csv')
+        audit_trail = AuditTrail(repository=backend)
+        audit_trail.audit_file = self._path('AUDIT_TRAIL.csv')
+
+        handler.log_exceptions([{'reference': 'REF-020', 'type': 'TEST'}, {'reference': 'REF-021', 'type': 'TEST'}])
+        self.assertTrue(handler.resolve_exception('REF-020', {'resolution': 'Fixed'}))
+        self.assertFalse(handler.resolve_exception('REF-020', {'resolution': 'Again'}))
+        self.assertEqual([e['reference'] for e in handler.get_open_exceptions()], ['REF-021'])
+        self.assertEqual(handler.resolve_exceptions({'REF-021': {}, 'REF-404': {}}), {'REF-021': True, 'REF-404': False})
+        self.assertEqual([row['action'] for row in backend.get_records(handler.audit_file)],
+                         ['Exception_Logged', 'Exception_Logged', 'Exception_Resolved', 'Exception_Resolved'])
+
+        audit_trail.log_action({'action': 'Payment_Saved', 'reference': 'REF-020'})
+        audit_trail.log_action({'action': 'File_Access'})
+        self.assertEqual([row['reference'] for row in audit_trail.get_actions(action_type='Payment_Saved',
+                                                                               start_date=self.today)], ['REF-020'])
+        self.assertEqual(audit_trail.get_actions(end_date='2000-01-01'), [])
+        self.assertEqual([row['action'] for row in audit_trail.get_actions(reference='REF-020')], ['Payment_Saved'])
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_5_file_operations_in_memory(self):
+        """Test saving and verifying a payment through FileOperations with the in-memory backend"""
+        backend = MemoryBackend()
+        file_ops = FileOperations(backend)
+        file_ops.file_paths = {key: self._path(f'{key}.csv') for key in file_ops.file_paths}
+
+        success, _ = file_ops.save_payment({'reference': 'REF-030', 'amount': '25000.00', 'date': self.today,
+                                            'company': 'SALAM', 'beneficiary': 'Test'})
+        self.assertTrue(success)
+        self.assertEqual(backend.find(file_ops.file_paths['Treasury'], 'REF-030')[0]['status'], 'Under Process')
+
+        backend.append_payment(file_ops.file_paths['BS-SALAM'], {'reference': 'REF-030', 'amount': '25100.00',
+                                                                  'date': self.today, 'status': 'Completed'})
+        result = file_ops.verify_payment({'reference': 'REF-030', 'amount': '25000.00', 'date': self.today,
+                                          'company': 'SALAM'})
+        self.assertTrue(result['matches'])
+        self.assertEqual(result['files'], ['BS-SALAM'])
+
+    def test_6_abstract_interface_and_capabilities(self):
+        """Test backends must implement the abstract methods and declare their capabilities"""
+        with self.assertRaises(TypeError):
+            StorageBackend()
+
+        class PartialBackend(StorageBackend):
+            def exists(self, dataset):
+                return False
+
+        with self.assertRaises(TypeError):
+            PartialBackend()
+
+        memory, csv_files = MemoryBackend(), DataRepository()
+        self.assertEqual((memory.file_indexes, memory.process_workers), (False, False))
+        self.assertEqual((csv_files.file_indexes, csv_files.process_workers), (True, True))
+        self.assertFalse(memory.batch_matching or csv_files.batch_matching)
+        dataset = self._path('BS_SALAM.csv')
+        self._fill(memory, dataset)
+        self._fill(csv_files, dataset)
+        self.assertIsNone(memory.snapshot(dataset))
+        self.assertEqual(csv_files.snapshot(dataset).find('REF-001'), [0, 2])
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import os
+import csv
+import shutil
+import tempfile
+from audit_trail import AuditTrail
+from timestamp_index import TimestampIndex, INDEX_SUFFIX
+
+class TestTimestampIndex(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary audit log with one row per day of January"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'AUDIT_LOG.csv')
+        self.fieldnames = ['timestamp', 'action', 'reference', 'details', 'user', 'status']
+        with open(self.file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.fieldnames)
+        self._append(*[f'2025-01-{day:02d} 10:00:00' for day in range(1, 32)])
+
+    def _append(self, *timestamps):
+        """Append one audit row per timestamp"""
+        with open(self.file_path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for timestamp in timestamps:
+                writer.writerow([timestamp, 'Test', f'REF-{timestamp}', 'line1\nline2', 'System', 'Completed'])
+
+    def _timestamps(self, rows):
+        """Get the timestamps of rows"""
+        return [row['timestamp'] for row in rows]
+
+    def test_1_range_query(self):
+        """Test a range returns exactly the rows inside it"""
+        index = TimestampIndex(self.file_path, block_rows=4)
+        rows = list(index.iter_range('2025-01-10 00:00:00', '2025-01-12 00:00:00'))
+        self.assertEqual(self._timestamps(rows), ['2025-01-10 10:00:00', '2025-01-11 10:00:00'])
+        self.assertEqual(rows[0]['details'], 'line1\nline2')
+
+    def test_2_bisects_to_blocks(self):
+        """Test only the blocks overlapping the range are read"""
+        index = TimestampIndex(self.file_path, block_rows=4)
+        index.refresh()
+        self.assertEqual(len(index.blocks), 8)
+        self.assertEqual(index._block_bounds('2025-01-10 00:00:00', '2025-01-12 00:00:00'), (2, 3))
+        self.assertEqual(index._block_bounds('2025-02-01 00:00:00', None), (8, 8))
+        self.assertEqual(index._block_bounds(None, '2024-12-31 00:00:00'), (0, 0))
+
+    def test_3_out_of_order_rows(self):
+        """Test rows written slightly out of order are still found"""
+        self._append('2025-02-02 10:00:00', '2025-02-01 10:00:00', '2025-01-15 12:00:00')
+        index = TimestampIndex(self.file_path, block_rows=4)
+        rows = list(index.iter_range('2025-01-15 11:00:00', '2025-01-16 00:00:00'))
+        self.assertEqual(self._timestamps(rows), ['2025-01-15 12:00:00'])
+        rows = list(index.iter_range('2025-02-01 00:00:00'))
+        self.assertEqual(sorted(self._timestamps(rows)), ['2025-02-01 10:00:00', '2025-02-02 10:00:00'])
+
+    def test_4_append_extends_index(self):
+        """Test appended rows extend the saved index without a rebuild"""
+        index = TimestampIndex(self.file_path, block_rows=4)
+        index.refresh()
+        first_blocks = [list(block) for block in index.blocks]
+        self.assertTrue(os.path.exists(self.file_path + INDEX_SUFFIX))
+
+        self._append('2025-02-01 10:00:00', '2025-02-02 10:00:00')
+        reloaded = TimestampIndex(self.file_path, block_rows=4)
+        rows = list(reloaded.iter_range('2025-02-01 00:00:00'))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(reloaded.rows, 33)
+        self.assertEqual(reloaded.blocks[:7], first_blocks[:7])
+
+    def test_5_malformed_timestamps_fall_back(self):
+        """Test a log with malformed timestamps is not served from the index"""
+        self._append('yesterday')
+        index = TimestampIndex(self.file_path, block_rows=4)
+        self.assertIsNone(index.iter_range('2025-01-01 00:00:00'))
+
+    def test_6_audit_trail_uses_index(self):
+        """Test date queries through AuditTrail match the full scan and writes extend the index"""
+        audit_trail = AuditTrail()
+        audit_trail.audit_file = self.file_path
+        audit_trail.writer.file_path = self.file_path
+        try:
+            actions = audit_trail.get_actions(start_date='2025-01-05', end_date='2025-01-07')
+            self.assertEqual(self._timestamps(actions), ['2025-01-05 10:00:00', '2025-01-06 10:00:00'])
+
+            audit_trail._write_to_audit_log({'timestamp': '2025-02-01 09:00:00', 'action': 'Late',
+                                             'reference': 'REF-LATE', 'details': '', 'user': 'System',
+                                             'status': 'Completed'})
+            self.assertEqual(TimestampIndex.for_file(self.file_path).rows, 32)
+            actions = audit_trail.get_actions(start_date='2025-02-01')
+            self.assertEqual([action['reference'] for action in actions], ['REF-LATE'])
+        finally:
+            audit_trail.close()
+
+    def test_7_block_bounds_cached(self):
+        """Test the bisect lists are built once and updated for appended blocks"""
+        index = TimestampIndex(self.file_path, block_rows=4)
+        index.refresh()
+        maxima, suffix_min = index._bounds_lists()
+        self.assertIs(index._bounds_lists()[0], maxima)
+
+        self._append('2025-02-01 10:00:00', '2025-01-20 12:00:00')
+        index.refresh()
+        self.assertIs(index._bounds_lists()[0], maxima)
+        self.assertEqual(maxima, [block[2] for block in index.blocks])
+        # The late row in the new last block lowers the suffix minima of the blocks before it
+        self.assertEqual(suffix_min[4:], ['2025-01-17 10:00:00'] + ['2025-01-20 12:00:00'] * 4)
+        self.assertEqual(index._block_bounds('2025-01-20 11:00:00', '2025-01-20 13:00:00'), (5, 9))
+
+    def tearDown(self):
+        """Remove temporary files"""
+        TimestampIndex._instances.pop(os.path.abspath(self.file_path), None)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from datetime import datetime, timedelta
-from validation_system import ValidationSystem
+from validation_system import ValidationSystem, ERROR_REFERENCE, ERROR_AMOUNT_FORMAT, WARNING_CNP_REQUIRED
 import csv
 import os
 
@@ -163,5 +163,78 @@ class TestValidationSystem(unittest.TestCase):
         result = self.validator.cross_reference_check(data, MockFileHandler())
         self.assertEqual(len(result['matches']), 0)  # Should not match as amounts must be exact below threshold
 
+    def _batch_rows(self):
+        """Build payment rows covering every validation rule"""
+        today = datetime.now()
+        variations = [
+            {},
+            {'company': ''},
+            {'beneficiary': '   '},
+            {'reference': 'TEST@2025'},
+            {'reference': ' '},
+            {'amount': '-5'},
+            {'amount': '0'},
+            {'amount': '1000000000.00'},
+            {'amount': 'abc'},
+            {'date': (today + timedelta(days=1)).strftime('%Y-%m-%d')},
+            {'date': (today - timedelta(days=400)).strftime('%Y-%m-%d')},
+            {'date': '2025-13-45'},
+            {'company': '', 'reference': 'BAD REF', 'amount': 'x', 'date': 'bad'}
+        ]
+        return [dict(self.base_test_data, **variation) for variation in variations]
+
+    def test_16_validate_batch_matches_validate_input(self):
+        """Test batch validation gives the same errors and warnings as validate_input per row"""
+        rows = self._batch_rows()
+        columns = {key: [row[key] for row in rows] for key in self.base_test_data}
+        result = self.validator.validate_batch(columns)
+
+        for i, row in enumerate(rows):
+            expected = self.validator.validate_input(row)
+            described = self.validator.describe_codes(result['errors'][i], result['warnings'][i])
+            self.assertEqual(described['errors'], expected['errors'])
+            self.assertEqual(described['warnings'], expected['warnings'])
+            self.assertEqual(result['errors'][i] == 0, expected['valid'])
+
+    def test_17_validate_batch_summary(self):
+        """Test batch validation summary counts"""
+        rows = self._batch_rows()
+        columns = {key: [row[key] for row in rows] for key in self.base_test_data}
+        result = self.validator.validate_batch(columns)
+        summary = result['summary']
+
+        self.assertEqual(summary['rows'], 13)
+        self.assertEqual(summary['valid'], 2)
+        self.assertEqual(summary['invalid'], 11)
+        self.assertEqual(summary['errors']['Invalid reference format'], 3)
+        self.assertEqual(summary['errors']['Invalid amount format'], 2)
+        self.assertEqual(summary['warnings']['CNP verification required for old payment'], 1)
+        self.assertTrue(result['errors'][3] & ERROR_REFERENCE)
+        self.assertTrue(result['errors'][8] & ERROR_AMOUNT_FORMAT)
+        self.assertEqual(result['warnings'][10], WARNING_CNP_REQUIRED)
+
+    def test_18_validate_batch_column_lengths(self):
+        """Test batch validation rejects columns of different lengths"""
+        columns = {key: [value] for key, value in self.base_test_data.items()}
+        columns['amount'] = []
+        with self.assertRaises(ValueError):
+            self.validator.validate_batch(columns)
+
+    def test_19_validate_batch_edge_values(self):
+        """Test the column-wise amount and date checks agree with validate_input on unusual values"""
+        today = datetime.now()
+        amounts = ['1e3', ' 5 ', '-0', 'nan', 'inf', '999999999.99', '999999999.995', '', '1_000', '.5', 'abc']
+        dates = ['2024-02-29', '2023-02-29', '2025-04-31', '0000-01-01', '2025-1-5', ' 2025-01-01',
+                 today.strftime('%Y-%m-%d'), today.strftime('%Y-%m-01'),
+                 (today + timedelta(days=1)).strftime('%Y-%m-%d'), '2025-12-31', 'bad']
+        rows = [dict(self.base_test_data, amount=amount, date=date) for amount, date in zip(amounts, dates)]
+        columns = {key: [row[key] for row in rows] for key in self.base_test_data}
+        result = self.validator.validate_batch(columns)
+
+        for i, row in enumerate(rows):
+            expected = self.validator.validate_input(row)
+            described = self.validator.describe_codes(result['errors'][i], result['warnings'][i])
+            self.assertEqual((described['errors'], described['warnings']), (expected['errors'], expected['warnings']))
+
 if __name__ == '__main__':
     unittest.main()
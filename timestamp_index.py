@@ -0,0 +1,149 @@
+import bisect
+import os
+import re
+from sidecar_index import SidecarIndex, iter_records, make_row
+
+INDEX_SUFFIX = '.tsidx'
+INDEX_VERSION = 2
+BLOCK_ROWS = 256
+TIMESTAMP_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+class TimestampIndex(SidecarIndex):
+    SUFFIX = INDEX_SUFFIX
+    VERSION = INDEX_VERSION
+    _instances = {}
+
+    def __init__(self, file_path, block_rows=BLOCK_ROWS):
+        """
+        Sparse timestamp index persisted next to an append-only audit CSV
+        Every block_rows rows get one [offset, block min timestamp, running max timestamp]
+        entry, so rows written slightly out of order are still found
+        """
+        self.block_rows = block_rows
+        super().__init__(file_path)
+
+    def _reset(self):
+        """Clear the in-memory index"""
+        super()._reset()
+        self.blocks = []
+        self.rows = 0
+        self.valid = True
+        self._clear_bounds()
+
+    def _clear_bounds(self):
+        """Drop the cached block maxima and suffix minima"""
+        self._maxima = []
+        self._suffix_min = []
+        # Blocks from here on changed since the cached lists were built
+        self._stale_block = 0
+
+    def _sidecar_data(self):
+        """Get what the sidecar persists"""
+        return dict(super()._sidecar_data(), block_rows=self.block_rows, rows=self.rows,
+                    valid=self.valid, blocks=self.blocks)
+
+    def _restore(self, data):
+        """Restore the in-memory index from sidecar data"""
+        if data['block_rows'] != self.block_rows:
+            return
+        super()._restore(data)
+        self.blocks = data['blocks']
+        self.rows = data['rows']
+        self.valid = data['valid']
+        self._clear_bounds()
+
+    def _rebuild(self, file):
+        """Index a file from scratch, returning the end of the indexed part"""
+        end = super()._rebuild(file)
+        if not self.fieldnames:
+            self.valid = False
+        return end
+
+    def _extend(self, file, start):
+        """Add records from start to end of file to the blocks"""
+        if 'timestamp' not in self.fieldnames:
+            self.valid = False
+            file.seek(0, os.SEEK_END)
+            return file.tell()
+
+        ts_pos = self.fieldnames.index('timestamp')
+        # The last block can still grow, so its cached bounds go stale too
+        self._stale_block = min(self._stale_block, max(len(self.blocks) - 1, 0))
+        for offset, values in iter_records(file, start):
+            timestamp = values[ts_pos] if len(values) > ts_pos else ''
+            if not TIMESTAMP_PATTERN.match(timestamp):
+                # Such rows make date queries fail the same way a full scan would
+                self.valid = False
+            if self.rows % self.block_rows == 0:
+                running_max = max(self.blocks[-1][2], timestamp) if self.blocks else timestamp
+                self.blocks.append([offset, timestamp, running_max])
+            else:
+                block = self.blocks[-1]
+                if timestamp < block[1]:
+                    block[1] = timestamp
+                if timestamp > block[2]:
+                    block[2] = timestamp
+            self.rows += 1
+        file.seek(0, os.SEEK_END)
+        return file.tell()
+
+    def iter_range(self, start=None, end=None):
+        """
+        Yield rows whose timestamp string lies in [start, end]
+        Reads from the first block that can hold start and stops after the last block that
+        can hold end; returns None if the file has malformed timestamps and must be scanned
+        """
+        if not self.refresh() or not self.valid:
+            return None
+        return self._iter_blocks(start, end)
+
+    def _block_bounds(self, start, end):
+        """Bisect to the first and past-the-last block that can hold rows in [start, end]"""
+        maxima, suffix_min = self._bounds_lists()
+        # Running maxima never decrease, so every block before first is all < start
+        first = bisect.bisect_left(maxima, start) if start is not None else 0
+        # Minima of the remaining blocks never decrease either; from stop on all rows are > end
+        stop = bisect.bisect_right(suffix_min, end) if end is not None else len(self.blocks)
+        return first, stop
+
+    def _bounds_lists(self):
+        """Get the running maxima and suffix minima of the blocks, updating the cached lists"""
+        stale, blocks = self._stale_block, self.blocks
+        if stale < len(blocks):
+            del self._maxima[stale:]
+            self._maxima.extend(block[2] for block in blocks[stale:])
+
+            suffix_min = self._suffix_min
+            del suffix_min[stale:]
+            suffix_min.extend(block[1] for block in blocks[stale:])
+            for i in range(len(blocks) - 2, stale - 1, -1):
+                suffix_min[i] = min(suffix_min[i], suffix_min[i + 1])
+            # Earlier suffix minima only change while the new ones are smaller
+            for i in range(stale - 1, -1, -1):
+                if suffix_min[i + 1] >= suffix_min[i]:
+                    break
+                suffix_min[i] = suffix_min[i + 1]
+            self._stale_block = len(blocks)
+        return self._maxima, self._suffix_min
+
+    def _iter_blocks(self, start, end):
+        """Read the rows of the blocks overlapping [start, end]"""
+        with self._lock:
+            first, stop = self._block_bounds(start, end)
+            if first >= stop:
+                return
+            start_offset = self.blocks[first][0]
+            stop_offset = self.blocks[stop][0] if stop < len(self.blocks) else self.state['end']
+            fieldnames = list(self.fieldnames)
+
+        ts_pos = fieldnames.index('timestamp')
+        with open(self.file_path, 'rb') as f:
+            for offset, values in iter_records(f, start_offset):
+                if offset >= stop_offset:
+                    break
+                timestamp = values[ts_pos] if len(values) > ts_pos else ''
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp > end:
+                    continue
+                yield make_row(fieldnames, values)
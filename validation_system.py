@@ -1,4 +1,44 @@
+from array import array
+from collections import Counter
 from datetime import datetime
+from itertools import compress, count, filterfalse, repeat
+from amount_index import amount_matches, parse_cents, tolerance_terms
+from operator import mul, or_
+import re
+
+# Per-row error flags returned by validate_batch, in the order validate_input checks them
+ERROR_COMPANY = 1
+ERROR_BENEFICIARY = 2
+ERROR_REFERENCE = 4
+ERROR_AMOUNT_FORMAT = 8
+ERROR_AMOUNT_NOT_POSITIVE = 16
+ERROR_AMOUNT_LIMIT = 32
+ERROR_DATE_FORMAT = 64
+ERROR_DATE_FUTURE = 128
+WARNING_CNP_REQUIRED = 1
+
+ERROR_MESSAGES = {
+    ERROR_COMPANY: "Company selection required",
+    ERROR_BENEFICIARY: "Beneficiary name required",
+    ERROR_REFERENCE: "Invalid reference format",
+    ERROR_AMOUNT_FORMAT: "Invalid amount format",
+    ERROR_AMOUNT_NOT_POSITIVE: "Amount must be greater than 0",
+    ERROR_AMOUNT_LIMIT: "Amount exceeds maximum limit",
+    ERROR_DATE_FORMAT: "Invalid date format (YYYY-MM-DD)",
+    ERROR_DATE_FUTURE: "Future date not allowed"
+}
+WARNING_MESSAGES = {
+    WARNING_CNP_REQUIRED: "CNP verification required for old payment"
+}
+
+REFERENCE_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+AMOUNT_LIMIT = 999999999.99
+
+# YYYY-MM-DD dates that exist in every year, so they compare as strings; others, 29 February included,
+# are parsed one by one
+DATE_PATTERN = re.compile(r'(?!0000)[0-9]{4}-(?:(?:0[1-9]|1[0-2])-(?:0[1-9]|1[0-9]|2[0-8])'
+                          r'|(?:0[13-9]|1[0-2])-(?:29|30)|(?:0[13578]|1[02])-31)')
 
 class ValidationSystem:
     def __init__(self):
@@ -45,6 +85,123 @@ class ValidationSystem:
 
         return results
 
+    def validate_batch(self, columns):
+        """
+        Validate columns of payment fields together, with the same rules as validate_input
+        columns: equal-length sequences under company, beneficiary, reference, amount and date
+        Returns array('H') error flags and array('B') warning flags per row (ERROR_* and
+        WARNING_* constants) plus summary counts
+        """
+        companies = columns['company']
+        beneficiaries = columns['beneficiary']
+        references = columns['reference']
+        amounts = columns['amount']
+        dates = columns['date']
+        rows = len(references)
+        if any(len(column) != rows for column in (companies, beneficiaries, amounts, dates)):
+            raise ValueError("All columns must have the same length")
+
+        company_errors = [0 if company else ERROR_COMPANY for company in companies]
+        beneficiary_errors = [0 if name else ERROR_BENEFICIARY for name in map(str.strip, beneficiaries)]
+        reference_errors = [0 if match else ERROR_REFERENCE
+                            for match in map(REFERENCE_PATTERN.fullmatch, map(str.strip, references))]
+        amount_errors = self._amount_errors(amounts)
+        date_errors, warnings = self._date_flags(dates, datetime.now())
+
+        errors = array('H', map(or_, map(or_, map(or_, company_errors, beneficiary_errors),
+                                         map(or_, reference_errors, amount_errors)),
+                                date_errors))
+
+        return {
+            'errors': errors,
+            'warnings': warnings,
+            'summary': self._batch_summary(errors, warnings)
+        }
+
+    def _amount_errors(self, amounts):
+        """
+        Error flags for a column of amounts
+        The whole column is converted to floats in one pass and scanned for the out-of-range
+        rows; the pass only restarts after each value float() rejects
+        """
+        values = array('d')
+        invalid = []
+        remaining = iter(amounts)
+        while True:
+            try:
+                values.extend(map(float, remaining))
+                break
+            except (TypeError, ValueError):
+                # The rejected value was taken from remaining; a valid placeholder keeps rows aligned
+                invalid.append(len(values))
+                values.append(1.0)
+        errors = array('H', [0]) * len(values)
+        for row in compress(count(), map((0.0).__ge__, values)):
+            errors[row] = ERROR_AMOUNT_NOT_POSITIVE
+        for row in compress(count(), map(AMOUNT_LIMIT.__lt__, values)):
+            errors[row] = ERROR_AMOUNT_LIMIT
+        for row in invalid:
+            errors[row] = ERROR_AMOUNT_FORMAT
+        return errors
+
+    def _date_flags(self, dates, now):
+        """
+        (error flags, warning flags) for a column of dates
+        Dates matching DATE_PATTERN are compared with today as strings a whole column at a
+        time; each distinct other value is parsed like validate_input
+        """
+        today = now.strftime('%Y-%m-%d')
+        errors = array('H', [0]) * len(dates)
+        for row in compress(count(), map(today.__lt__, dates)):
+            errors[row] = ERROR_DATE_FUTURE
+        # Payments from an earlier month than today's need CNP verification
+        warnings = array('B', map(mul, map(today[:7].__gt__, dates), repeat(WARNING_CNP_REQUIRED)))
+        irregular = set(filterfalse(DATE_PATTERN.fullmatch, set(dates)))
+        if irregular:
+            codes = {date: self._date_codes(date, now) for date in irregular}
+            for row in compress(count(), map(codes.__contains__, dates)):
+                errors[row], warnings[row] = codes[dates[row]]
+        return errors, warnings
+
+    def _date_codes(self, date_str, now):
+        """(error flags, warning flags) for one date value"""
+        result = self._validate_date(date_str, now)
+        if not result['valid']:
+            if result['error'] == ERROR_MESSAGES[ERROR_DATE_FUTURE]:
+                return ERROR_DATE_FUTURE, 0
+            return ERROR_DATE_FORMAT, 0
+        return 0, WARNING_CNP_REQUIRED if result['cnp_required'] else 0
+
+    def _batch_summary(self, errors, warnings):
+        """Count valid rows and rows per error and warning"""
+        by_error = dict.fromkeys(ERROR_MESSAGES.values(), 0)
+        for code, count in Counter(errors).items():
+            for flag, message in ERROR_MESSAGES.items():
+                if code & flag:
+                    by_error[message] += count
+        by_warning = dict.fromkeys(WARNING_MESSAGES.values(), 0)
+        for code, count in Counter(warnings).items():
+            for flag, message in WARNING_MESSAGES.items():
+                if code & flag:
+                    by_warning[message] += count
+
+        valid = errors.tolist().count(0)
+        return {
+            'rows': len(errors),
+            'valid': valid,
+            'invalid': len(errors) - valid,
+            'with_warnings': len(warnings) - warnings.tolist().count(0),
+            'errors': by_error,
+            'warnings': by_warning
+        }
+
+    def describe_codes(self, error_code, warning_code=0):
+        """Turn batch error and warning flags back into validate_input messages"""
+        return {
+            'errors': [message for flag, message in ERROR_MESSAGES.items() if error_code & flag],
+            'warnings': [message for flag, message in WARNING_MESSAGES.items() if warning_code & flag]
+        }
+
     def _validate_reference(self, reference):
         """Validate reference number format"""
         if not reference.strip():
@@ -69,12 +226,12 @@ class ValidationSystem:
             result['error'] = "Invalid amount format"
         return result
 
-    def _validate_date(self, date_str):
+    def _validate_date(self, date_str, current_date=None):
         """Validate date and check CNP requirement"""
         result = {'valid': True, 'error': None, 'cnp_required': False}
         try:
             payment_date = datetime.strptime(date_str, '%Y-%m-%d')
-            current_date = datetime.now()
+            current_date = current_date or datetime.now()
             
             if payment_date > current_date:
                 result['valid'] = False
@@ -109,7 +266,13 @@ class ValidationSystem:
     def _check_file(self, file_type, data, results, file_handler):
         """Check for matches in specific file"""
         try:
-            file_data = file_handler.read_file(file_type)
+            if hasattr(file_handler, 'amount_index'):
+                # Tolerance window candidates come straight from the sorted amount index
+                threshold_cents, tolerance_bp = tolerance_terms(self.threshold_amount, self.tolerance)
+                file_data = file_handler.amount_index(file_type).find(
+                    data['reference'], self._cents(data['amount']), threshold_cents, tolerance_bp)
+            else:
+                file_data = file_handler.read_file(file_type)
             for record in file_data:
                 if self._is_matching_record(record, data):
                     match = {
@@ -127,12 +290,13 @@ class ValidationSystem:
         # Reference match
         if record['reference'].strip() == data['reference'].strip():
             # For amounts > 15000, allow 1% tolerance
-            amount = float(record['amount'])
-            input_amount = float(data['amount'])
-            
-            if amount > self.threshold_amount:
-                difference = abs(amount - input_amount) / amount
-                return difference <= self.tolerance
-            else:
-                return amount == input_amount
+            return amount_matches(self._cents(record['amount']), self._cents(data['amount']),
+                                  *tolerance_terms(self.threshold_amount, self.tolerance))
         return False
+
+    def _cents(self, amount):
+        """Parse an amount to integer cents, raising ValueError if it is invalid"""
+        cents = parse_cents(amount)
+        if cents is None:
+            raise ValueError(f"Invalid amount: {amount}")
+        return cents